@@ -0,0 +1,274 @@
+"""计算流程基准测试
+
+按界面按钮整理的表达式语料，走与界面相同的求值入口分阶段计时（无需窗口）：
+    preprocess  preprocess_expression
+    cache       CalculatorEngine查结果缓存（每次先清空，不会命中）
+    plan        开销估计，选择计算路径
+    parse       解析为语法树（每次清空解析缓存）
+    evaluate    数值快速路径或由语法树构造SymPy结果
+    evalf       数值化判断（numeric_form，走快速路径时跳过）
+    ipc         交给工作进程时的排队和传输（--workers大于0时）
+    text        display_text（大结果为摘要）
+    latex       display_latex（大结果跳过）
+    render      mathtext栅格化为PNG（--no-render跳过）
+
+结果以JSON输出各阶段的百分位数，并与保存的基线比较，超出阈值的阶段标记为退化。
+
+用法：
+    python benchmarks/bench_pipeline.py --save-baseline      # 记录基线
+    python benchmarks/bench_pipeline.py                      # 与基线比较，退化时返回1
+    python benchmarks/bench_pipeline.py -k integrate -n 10   # 只测某一类
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculator  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(HERE, 'results.json')
+
+STAGES = ('preprocess', 'cache', 'plan', 'parse', 'evaluate', 'evalf', 'ipc', 'text', 'latex',
+          'render')
+
+# (类别, 表达式)，类别对应setup_ui中的按钮
+CORPUS = [
+    ('arithmetic', '2+3*4'),
+    ('arithmetic', '2^100/3^50'),
+    ('arithmetic', 'factorial(200)'),
+    ('arithmetic', 'sqrt(8)+log(exp(2))'),
+    ('trig', 'sin(pi/6)+cos(pi/3)'),
+    ('trig', 'tan(pi/8)'),
+    ('trig', 'sin(x)^2+cos(x)^2'),
+    ('diff', 'diff(sin(x)*exp(x), x)'),
+    ('diff', 'diff(x^x, x, 3)'),
+    ('integrate', 'integrate(x^2*sin(x), x)'),
+    ('integrate', 'integrate(exp(-x^2), (x, -oo, oo))'),
+    ('integrate', 'integrate(1/(x^3+1), x)'),
+    ('limit', 'limit(sin(x)/x, x, 0)'),
+    ('limit', 'limit((1+1/x)^x, x, oo)'),
+    ('solve', 'solve(x^2-4, x)'),
+    ('solve', 'solve([x+y-3, x-y-1], [x, y])'),
+    ('solve', 'solve(x^3-2*x+1, x)'),
+    ('expand', 'expand((x+y)^8)'),
+    ('expand', 'expand((x+y+z)^6)'),
+    ('factor', 'factor(x^6-1)'),
+    ('factor', 'factor(x^4+4*y^4)'),
+    ('simplify', 'simplify(sin(x)^2+cos(x)^2)'),
+    ('simplify', 'simplify((x^2-1)/(x-1))'),
+    ('subs', '(x^2+2*x+1).subs(x, 3)'),
+    ('subs', 'sin(x*y).subs({x: 2, y: pi/4})'),
+    ('idiff', 'idiff(x^2+y^2-1, y, x)'),
+    ('idiff', 'idiff(x+y^2, y, x)'),
+    ('matrix', 'det(Matrix([[1,2],[3,4]]))'),
+    ('matrix', 'det(Matrix([[x,1,0],[1,x,1],[0,1,x]]))'),
+    ('matrix', 'Matrix([[1,2],[3,4]]).inv()'),
+    ('summation', 'summation(1/k^2, (k, 1, oo))'),
+    ('summation', 'summation(k^3, (k, 1, n))'),
+]
+
+
+def summarize(samples):
+    """把一组耗时（秒）汇总为毫秒统计"""
+    ms = [s * 1000 for s in samples]
+    return {
+        'n': len(ms),
+        'min': round(min(ms), 4),
+        'mean': round(sum(ms) / len(ms), 4),
+        'p50': round(calculator.percentile(ms, 50), 4),
+        'p90': round(calculator.percentile(ms, 90), 4),
+        'p95': round(calculator.percentile(ms, 95), 4),
+        'max': round(max(ms), 4),
+    }
+
+
+def run_once(expression, engine, renderer, precision=None):
+    """按compute_job的步骤走一遍计算流程，返回各阶段耗时（秒）"""
+    times = {}
+    clock = time.perf_counter
+
+    start = clock()
+    processed = calculator.preprocess_expression(expression)
+    times['preprocess'] = clock() - start
+
+    calculator.parse_expression.cache_clear()
+    engine.result_cache.clear()
+    result, _ = engine.evaluate_detailed(processed, precision=precision,
+                                         report={'timings': times})
+
+    start = clock()
+    large = calculator.is_large_result(result)
+    if large:
+        calculator.LargeResult(result).summary()
+    else:
+        calculator.display_text(result)
+    times['text'] = clock() - start
+    if large:
+        return times
+
+    start = clock()
+    latex = calculator.display_latex(result)
+    times['latex'] = clock() - start
+
+    if renderer is not None:
+        start = clock()
+        try:
+            renderer.rasterize(f"$= {latex}$", 16)
+        except Exception:
+            pass  # 界面会回退为纯文本，耗时照样计入
+        times['render'] = clock() - start
+    return times
+
+
+def run_benchmark(corpus, repeats=5, warmup=1, warm_cache=False, render=True, precision=None,
+                  workers=0):
+    """运行语料，返回可写成JSON的结果字典
+
+    workers为0时在本进程中求值；大于0时与界面一样由工作进程池计算开销大的输入。
+    """
+    sp = calculator.load_sympy()
+    from sympy.core.cache import clear_cache
+    engine = calculator.CalculatorEngine(workers=workers)
+    if engine.pool is not None:
+        engine.pool.wait_ready()
+    renderer = None
+    if render:
+        try:
+            calculator.load_matplotlib()
+            # 容量为0：每次都重新排版和栅格化
+            renderer = calculator.LatexRenderCache(max_entries=0)
+        except ImportError:
+            print("未安装matplotlib，跳过render阶段", file=sys.stderr)
+
+    results = {}
+    try:
+        for category, expression in corpus:
+            samples = {}
+            totals = []
+            for i in range(warmup + repeats):
+                if not warm_cache:
+                    clear_cache()  # SymPy内部缓存会让重复计算明显变快
+                times = run_once(expression, engine, renderer, precision)
+                if i < warmup:
+                    continue
+                totals.append(sum(times.values()))
+                for stage, seconds in times.items():
+                    samples.setdefault(stage, []).append(seconds)
+            stages = {stage: summarize(samples[stage]) for stage in STAGES if stage in samples}
+            results[expression] = {
+                'category': category,
+                'stages': stages,
+                'total': summarize(totals),
+            }
+            print(f"{category:<11} {results[expression]['total']['p50']:>10.3f} ms  {expression}",
+                  file=sys.stderr)
+    finally:
+        engine.shutdown()
+
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'sympy': sp.__version__,
+            'platform': platform.platform(),
+            'repeats': repeats,
+            'warm_cache': warm_cache,
+            'precision': precision,
+            'workers': workers,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.25, min_delta_ms=0.5):
+    """与基线比较各阶段p50，变慢超过阈值（且绝对差值足够大）视为退化"""
+    regressions = []
+    for expression, entry in current['results'].items():
+        base = baseline.get('results', {}).get(expression)
+        if base is None:
+            continue
+        for stage, stats in list(entry['stages'].items()) + [('total', entry['total'])]:
+            base_stats = base['total'] if stage == 'total' else base['stages'].get(stage)
+            if base_stats is None:
+                continue
+            old, new = base_stats['p50'], stats['p50']
+            if new - old > min_delta_ms and new > old * (1 + threshold):
+                regressions.append({
+                    'expression': expression,
+                    'stage': stage,
+                    'baseline_p50': old,
+                    'p50': new,
+                    'ratio': round(new / old, 2) if old else None,
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计算流程分阶段基准测试")
+    parser.add_argument('-n', '--repeats', type=int, default=5,
+                        help="每个表达式的计时次数 (默认: 5)")
+    parser.add_argument('--warmup', type=int, default=1,
+                        help="不计时的预热次数 (默认: 1)")
+    parser.add_argument('-k', '--category', action='append',
+                        help="只运行指定类别，可重复")
+    parser.add_argument('--warm-cache', action='store_true',
+                        help="保留SymPy内部缓存（默认每次清空，测冷启动耗时）")
+    parser.add_argument('--no-render', action='store_true',
+                        help="跳过mathtext栅格化阶段")
+    parser.add_argument('--precision', type=int, default=None,
+                        help="数值精度（默认精确模式）")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="求值进程数，0为在本进程中求值 (默认: 0)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, metavar='FILE',
+                        help="结果JSON路径 (默认: benchmarks/results.json)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, metavar='FILE',
+                        help="基线JSON路径 (默认: benchmarks/baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="p50变慢超过该比例视为退化 (默认: 0.25)")
+    args = parser.parse_args()
+
+    corpus = CORPUS
+    if args.category:
+        corpus = [item for item in CORPUS if item[0] in args.category]
+        if not corpus:
+            parser.error(f"没有类别 {args.category}")
+
+    current = run_benchmark(corpus, args.repeats, args.warmup, args.warm_cache,
+                            not args.no_render, args.precision, args.workers)
+
+    if args.save_baseline:
+        path = args.baseline
+    else:
+        path = args.output
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            current['regressions'] = compare(current, baseline, args.threshold)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {path}", file=sys.stderr)
+
+    regressions = current.get('regressions')
+    if regressions is None:
+        return 0
+    if not regressions:
+        print("与基线相比没有退化", file=sys.stderr)
+        return 0
+    print(f"发现 {len(regressions)} 处退化:", file=sys.stderr)
+    for item in regressions:
+        print(f"  {item['stage']:<10} {item['baseline_p50']:>9.3f} -> {item['p50']:>9.3f} ms"
+              f"  {item['expression']}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
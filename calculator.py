@@ -1,19 +1,4357 @@
+import time
+_START_TIME = time.perf_counter()  # 启动计时起点（--startup-profile）
+
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import sympy as sp
-from sympy import *
-import math
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import font as tkfont
+_TK_IMPORT_SECONDS = time.perf_counter() - _START_TIME
+
 import io
 import base64
 import os
+import queue
+import threading
+import argparse
+import multiprocessing
+import hashlib
+import tempfile
+import json
+import csv
+import sys
+import re
+import types
+import operator
+import functools
+import sqlite3
+import math
+import traceback
+import socket
+import socketserver
+from fractions import Fraction
+from urllib.parse import urlsplit
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource  # 仅类Unix系统可用，用于限制工作进程内存
+except ImportError:
+    resource = None
+
+# 各模块导入耗时（秒），SymPy和matplotlib在用到时才导入
+IMPORT_TIMES = {
+    'tkinter': _TK_IMPORT_SECONDS,
+    '标准库': time.perf_counter() - _START_TIME - _TK_IMPORT_SECONDS,
+}
+
+sp = None  # sympy模块，由load_sympy()导入
+_NAMESPACE = None  # 会话命名空间，由get_namespace()构建
+_Figure = _FigureCanvasAgg = None  # matplotlib离屏渲染，由load_matplotlib()导入
+_numpy = None  # numpy模块，由load_numpy()导入
+_import_lock = threading.Lock()
+
+
+def load_sympy():
+    """导入SymPy（只导入一次，线程安全），返回sympy模块"""
+    global sp
+    if sp is None:
+        with _import_lock:
+            if sp is None:
+                start = time.perf_counter()
+                import sympy
+                IMPORT_TIMES['sympy'] = time.perf_counter() - start
+                sp = sympy
+    return sp
+
+
+def load_matplotlib():
+    """导入matplotlib离屏渲染所需的类，首次渲染公式时调用"""
+    global _Figure, _FigureCanvasAgg
+    if _Figure is None:
+        with _import_lock:
+            if _Figure is None:
+                start = time.perf_counter()
+                from matplotlib.figure import Figure
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                IMPORT_TIMES['matplotlib'] = time.perf_counter() - start
+                _FigureCanvasAgg = FigureCanvasAgg
+                _Figure = Figure
+    return _Figure, _FigureCanvasAgg
+
+
+def load_numpy():
+    """导入NumPy（绘图、表格等向量化计算时使用）"""
+    global _numpy
+    if _numpy is None:
+        with _import_lock:
+            if _numpy is None:
+                start = time.perf_counter()
+                import numpy
+                IMPORT_TIMES['numpy'] = time.perf_counter() - start
+                _numpy = numpy
+    return _numpy
+
+
+class StartupProfile:
+    """启动耗时分解（--startup-profile）
+
+    窗口可用且SymPy后台导入完成后打印一次报告；之后延迟导入的模块
+    （如首次渲染时的matplotlib）在导入后补充打印。
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stderr
+        self.stages = []  # (阶段名, 秒)
+        self.pending = {'window', 'sympy'}
+        self.reported = set()
+        self.lock = threading.Lock()
+
+    def mark(self, name, seconds):
+        """记录一个初始化阶段的耗时"""
+        with self.lock:
+            self.stages.append((name, seconds))
+
+    def since_start(self):
+        """距进程启动的秒数"""
+        return time.perf_counter() - _START_TIME
+
+    def done(self, what):
+        """标记一个里程碑完成，全部完成后打印报告"""
+        with self.lock:
+            self.stages.append((f"{'窗口可用' if what == 'window' else 'SymPy就绪'}（距启动）",
+                                self.since_start()))
+            self.pending.discard(what)
+            if self.pending:
+                return
+        self.report()
+
+    def report(self):
+        """打印导入和初始化耗时"""
+        lines = ["启动耗时分解:"]
+        for module, seconds in list(IMPORT_TIMES.items()):
+            lines.append(f"  {seconds * 1000:9.1f} ms  导入 {module}")
+            self.reported.add(module)
+        for name, seconds in self.stages:
+            lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+        if 'matplotlib' not in IMPORT_TIMES:
+            lines.append("  matplotlib 延迟到首次渲染公式时导入")
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+    def report_late_imports(self):
+        """补充打印报告之后才导入的模块"""
+        if self.pending:
+            return
+        for module, seconds in list(IMPORT_TIMES.items()):
+            if module not in self.reported:
+                self.reported.add(module)
+                self.out.write(f"  {seconds * 1000:9.1f} ms  延迟导入 {module}"
+                               f"（距启动 {self.since_start():.2f} s）\n")
+                self.out.flush()
+
+
+# 本地数据目录（磁盘缓存等）
+APP_DIR = os.path.join(os.path.expanduser('~'), '.sympy_calculator')
+DEFAULT_DISK_CACHE_DIR = os.path.join(APP_DIR, 'cache')
+
+
+# ---------------------------------------------------------------------------
+# 计算核心（不依赖Tk，可在工作进程中使用）
+# ---------------------------------------------------------------------------
+
+def build_namespace():
+    """创建安全的命名空间"""
+    load_sympy()
+    x, y, z, t = sp.symbols('x y z t')
+    return {
+        # 基本符号
+        'x': x, 'y': y, 'z': z, 't': t,
+        # 常数
+        'pi': sp.pi, 'e': sp.E, 'E': sp.E, 'I': sp.I, 'oo': sp.oo,
+        # 基本函数
+        'sin': sp.sin, 'cos': sp.cos, 'tan': sp.tan,
+        'asin': sp.asin, 'acos': sp.acos, 'atan': sp.atan,
+        'sinh': sp.sinh, 'cosh': sp.cosh, 'tanh': sp.tanh,
+        'log': sp.log, 'log10': lambda x: sp.log(x, 10),
+        'ln': sp.log, 'exp': sp.exp,
+        'sqrt': sp.sqrt, 'abs': sp.Abs,
+        'factorial': sp.factorial,
+        # 微积分函数
+        'diff': sp.diff, 'integrate': sp.integrate,
+        'limit': sp.limit, 'series': sp.series,
+        'idiff': sp.idiff,
+        # 代数函数
+        'solve': solve_equations, 'expand': poly_expand,
+        'factor': poly_factor, 'simplify': sp.simplify,
+        'cancel': poly_cancel, 'apart': sp.apart,
+        # 矩阵函数
+        'Matrix': sp.Matrix, 'det': determinant,
+        # 其他有用函数
+        'summation': sp.summation, 'product': sp.product,
+        # 批量代入用的点列：expr.subs(x, range(0, 1, 1/10))
+        'range': point_range, 'linspace': point_linspace,
+    }
+
+
+def preprocess_expression(expr):
+    """预处理表达式"""
+    # 替换常用数学符号
+    replacements = [
+        ('π', 'pi'),
+        ('∞', 'oo'),
+        ('×', '*'),
+        ('÷', '/'),
+    ]
+    
+    for old, new in replacements:
+        expr = expr.replace(old, new)
+        
+    return expr
+
+
+# ---------------------------------------------------------------------------
+# 表达式解析：计算器语法的分词器和递归下降解析器
+# ---------------------------------------------------------------------------
+#
+# 语法树节点均为不可变元组，可按输入字符串缓存：
+#   ('num', 文本)              ('name', 名称)
+#   ('neg', a) ('pos', a)      ('fact', a)             后缀 ! 阶乘
+#   ('binop', 运算符, a, b)     ('cmp', 运算符, a, b)
+#   ('call', f, 参数, 关键字参数) ('attr', a, 名称)  ('index', a, 下标)
+#   ('tuple', 项) ('list', 项)  ('dict', 键值对)
+# 相邻的操作数（如 2x、x y）按乘法处理；对非函数对象的“调用”，
+# 如 2(x+1)、(x+1)(x-1)，也按乘法处理。
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<num>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[^\W\d]\w*)
+  | (?P<op>\*\*|==|!=|<=|>=|[-+*/%^!()\[\]{},.=<>:×÷∞])
+""", re.VERBOSE)
+
+# 符号别名
+_OP_ALIASES = {'^': '**', '×': '*', '÷': '/'}
+_NAME_ALIASES = {'π': 'pi', '∞': 'oo'}
+_COMPARISONS = ('==', '!=', '<', '>', '<=', '>=')
+
+
+def tokenize(text):
+    """把输入拆分为 (类型, 文本, 位置) 列表，类型为 'num'/'name'/'op'"""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if match is None:
+            raise SyntaxError(f"无法识别的字符 '{text[pos]}'（位置 {pos + 1}）")
+        kind = match.lastgroup
+        value = match.group()
+        if kind == 'op' and value == '∞':
+            kind = 'name'
+        if kind == 'name':
+            value = _NAME_ALIASES.get(value, value)
+        elif kind == 'op':
+            value = _OP_ALIASES.get(value, value)
+        if kind != 'ws':
+            tokens.append((kind, value, pos))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析器，优先级与Python一致（^ 等同于 **）"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        if index < len(self.tokens):
+            return self.tokens[index]
+        return ('end', '', len(self.text))
+
+    def at_op(self, *ops):
+        kind, value, _ = self.peek()
+        return kind == 'op' and value in ops
+
+    def advance(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, op):
+        if not self.at_op(op):
+            self.error(f"缺少 '{op}'")
+        return self.advance()
+
+    def error(self, message=None):
+        kind, value, pos = self.peek()
+        if message is None:
+            message = "表达式不完整" if kind == 'end' else f"意外的符号 '{value}'"
+        raise SyntaxError(f"{message}（位置 {pos + 1}）")
+
+    def parse(self):
+        if not self.tokens:
+            raise SyntaxError("表达式为空")
+        node = self.expression()
+        if self.peek()[0] != 'end':
+            self.error()
+        return node
+
+    def expression(self):
+        node = self.additive()
+        if self.at_op(*_COMPARISONS):
+            op = self.advance()[1]
+            node = ('cmp', op, node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.term()
+        while self.at_op('+', '-'):
+            op = self.advance()[1]
+            node = ('binop', op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while True:
+            if self.at_op('*', '/', '%'):
+                op = self.advance()[1]
+                node = ('binop', op, node, self.unary())
+            elif self.peek()[0] in ('num', 'name'):
+                # 隐式乘法：2x、x y、2 sin(x)
+                node = ('binop', '*', node, self.unary())
+            else:
+                return node
+
+    def unary(self):
+        if self.at_op('-'):
+            self.advance()
+            return ('neg', self.unary())
+        if self.at_op('+'):
+            self.advance()
+            return ('pos', self.unary())
+        return self.power()
+
+    def power(self):
+        node = self.postfix()
+        if self.at_op('**'):
+            self.advance()
+            node = ('binop', '**', node, self.unary())  # 右结合，指数可带负号
+        return node
+
+    def postfix(self):
+        node = self.atom()
+        while True:
+            if self.at_op('!'):
+                self.advance()
+                node = ('fact', node)
+            elif self.at_op('('):
+                self.advance()
+                args, kwargs = self.arguments(')')
+                node = ('call', node, args, kwargs)
+            elif self.at_op('['):
+                self.advance()
+                items = self.items(']')
+                node = ('index', node, items[0] if len(items) == 1 else ('tuple', items))
+            elif self.at_op('.'):
+                self.advance()
+                kind, name, _ = self.peek()
+                if kind != 'name':
+                    self.error("'.' 后应为属性名")
+                if name.startswith('_'):
+                    self.error(f"不允许访问属性 '{name}'")
+                self.advance()
+                node = ('attr', node, name)
+            else:
+                return node
+
+    def atom(self):
+        kind, value, _ = self.peek()
+        if kind == 'num':
+            self.advance()
+            return ('num', value)
+        if kind == 'name':
+            self.advance()
+            return ('name', value)
+        if self.at_op('('):
+            self.advance()
+            if self.at_op(')'):
+                self.advance()
+                return ('tuple', ())
+            first = self.expression()
+            if self.at_op(')'):
+                self.advance()
+                return first
+            self.expect(',')
+            items = (first,) + self.items(')')
+            return ('tuple', items)
+        if self.at_op('['):
+            self.advance()
+            return ('list', self.items(']'))
+        if self.at_op('{'):
+            self.advance()
+            return ('dict', self.pairs())
+        self.error()
+
+    def items(self, close):
+        """逗号分隔的表达式列表，允许末尾逗号，消耗结束括号"""
+        items = []
+        while not self.at_op(close):
+            items.append(self.expression())
+            if not self.at_op(','):
+                break
+            self.advance()
+        self.expect(close)
+        return tuple(items)
+
+    def arguments(self, close):
+        """函数参数，支持 name=value 关键字参数"""
+        args, kwargs = [], []
+        while not self.at_op(close):
+            kind, name, _ = self.peek()
+            if kind == 'name' and self.peek(1)[:2] == ('op', '='):
+                self.advance()
+                self.advance()
+                kwargs.append((name, self.expression()))
+            else:
+                if kwargs:
+                    self.error("位置参数不能出现在关键字参数之后")
+                args.append(self.expression())
+            if not self.at_op(','):
+                break
+            self.advance()
+        self.expect(close)
+        return tuple(args), tuple(kwargs)
+
+    def pairs(self):
+        """字典 {键: 值, ...}"""
+        pairs = []
+        while not self.at_op('}'):
+            key = self.expression()
+            self.expect(':')
+            pairs.append((key, self.expression()))
+            if not self.at_op(','):
+                break
+            self.advance()
+        self.expect('}')
+        return tuple(pairs)
+
+
+def tree_children(node):
+    """语法树节点的直接子节点"""
+    kind = node[0]
+    if kind in ('neg', 'pos', 'fact', 'attr'):
+        return (node[1],)
+    if kind in ('binop', 'cmp'):
+        return (node[2], node[3])
+    if kind == 'call':
+        return (node[1],) + node[2] + tuple(value for _, value in node[3])
+    if kind == 'index':
+        return (node[1], node[2])
+    if kind in ('tuple', 'list'):
+        return node[1]
+    if kind == 'dict':
+        return tuple(item for pair in node[1] for item in pair)
+    return ()
+
+
+def iter_tree(node):
+    """先序遍历语法树的所有节点"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(tree_children(node)))
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_expression(text):
+    """解析表达式为语法树（按输入字符串缓存），语法错误时抛出SyntaxError"""
+    return _Parser(text).parse()
+
+
+_BINARY_OPS = {
+    '+': operator.add, '-': operator.sub,
+    '*': operator.mul, '/': operator.truediv,
+    '%': operator.mod, '**': operator.pow,
+}
+
+
+def resolve_name(name, namespace):
+    """按命名空间、SymPy公开对象、新符号的顺序解析名称（与sympify一致）"""
+    if name in namespace:
+        return namespace[name]
+    if name in ('True', 'False', 'None'):
+        return {'True': True, 'False': False, 'None': None}[name]
+    value = getattr(sp, name, None)
+    if value is not None and not name.startswith('_') and not isinstance(value, types.ModuleType):
+        return value
+    return sp.Symbol(name)
+
+
+def evaluate_tree(node, namespace):
+    """按语法树直接构造SymPy对象"""
+    kind = node[0]
+    if kind == 'num':
+        text = node[1]
+        if text.isdigit():
+            return sp.Integer(int(text))
+        return sp.Float(text)
+    if kind == 'name':
+        return resolve_name(node[1], namespace)
+    if kind == 'binop':
+        left = evaluate_tree(node[2], namespace)
+        right = evaluate_tree(node[3], namespace)
+        if node[1] == '*' and callable(left) and not isinstance(left, sp.Basic):
+            return left(right)  # sin x 形式的隐式调用
+        if node[1] in ('*', '**') and isinstance(left, sp.MatrixBase):
+            result = numpy_matrix_op(node[1], left, right)
+            if result is not None:
+                return result
+        return _BINARY_OPS[node[1]](left, right)
+    if kind == 'neg':
+        return -evaluate_tree(node[1], namespace)
+    if kind == 'pos':
+        return +evaluate_tree(node[1], namespace)
+    if kind == 'fact':
+        return sp.factorial(evaluate_tree(node[1], namespace))
+    if kind == 'call':
+        func = evaluate_tree(node[1], namespace)
+        args = [evaluate_tree(arg, namespace) for arg in node[2]]
+        kwargs = {name: evaluate_tree(value, namespace) for name, value in node[3]}
+        if node[1][0] == 'attr' and node[1][2] in _METHOD_OVERRIDES:
+            # 数值代入用编译后的函数计算，数值矩阵交给NumPy；不适用时返回None
+            target = getattr(func, '__self__', None)
+            result = _METHOD_OVERRIDES[node[1][2]](target, args, kwargs)
+            if result is not None:
+                return result
+        if callable(func):
+            return func(*args, **kwargs)
+        if len(args) == 1 and not kwargs:
+            return func * args[0]  # 2(x+1)、(x+1)(x-1)
+        raise TypeError(f"'{func}' 不是函数")
+    if kind == 'attr':
+        return getattr(evaluate_tree(node[1], namespace), node[2])
+    if kind == 'index':
+        return evaluate_tree(node[1], namespace)[evaluate_tree(node[2], namespace)]
+    if kind == 'cmp':
+        left = evaluate_tree(node[2], namespace)
+        right = evaluate_tree(node[3], namespace)
+        op = node[1]
+        if op == '==':
+            return sp.Eq(left, right)
+        if op == '!=':
+            return sp.Ne(left, right)
+        return {'<': operator.lt, '>': operator.gt,
+                '<=': operator.le, '>=': operator.ge}[op](left, right)
+    if kind == 'tuple':
+        return tuple(evaluate_tree(item, namespace) for item in node[1])
+    if kind == 'list':
+        return [evaluate_tree(item, namespace) for item in node[1]]
+    if kind == 'dict':
+        return {evaluate_tree(k, namespace): evaluate_tree(v, namespace)
+                for k, v in node[1]}
+    raise ValueError(f"未知的语法树节点: {kind}")
+
+
+def get_namespace():
+    """会话内共享的命名空间（只构建一次）"""
+    global _NAMESPACE
+    if _NAMESPACE is None:
+        _NAMESPACE = build_namespace()
+    return _NAMESPACE
+
+
+# ---------------------------------------------------------------------------
+# 纯数值快速路径：不含自由符号的输入绕过SymPy表达式树
+# ---------------------------------------------------------------------------
+
+# 数值精度选项：None 表示精确模式（只走整数/有理数快速路径）
+PRECISION_CHOICES = [('精确', None), ('15位', 15), ('30位', 30), ('50位', 50), ('100位', 100)]
+
+# 求值路径在状态栏中的名称
+ROUTE_LABELS = {'inline': '直接计算', 'background': '进程内', 'isolated': '工作进程'}
+
+ENGINE_LABELS = {
+    'exact': '整数/有理数快速路径',
+    'float': '浮点快速路径',
+    'mpmath': 'mpmath快速路径',
+    'sympy': 'SymPy',
+    'numpy': 'NumPy/LAPACK',
+    'domain': 'DomainMatrix精确消元',
+    'poly': '稀疏多项式环',
+    'compiled': '编译的数值函数',
+    'cache': '内存缓存',
+    'disk': '磁盘缓存',
+}
+
+
+class _NeedsSymPy(Exception):
+    """快速路径无法处理该输入，需要交给SymPy"""
+
+
+def _exact_factorial(n):
+    if isinstance(n, Fraction) and n.denominator == 1:
+        n = n.numerator
+    if not isinstance(n, int) or n < 0:
+        raise _NeedsSymPy
+    return math.factorial(n)
+
+
+_EXACT_FUNCTIONS = {'abs': abs, 'factorial': _exact_factorial}
+
+
+def _exact_value(node, namespace):
+    """用Python整数和分数精确计算，遇到无法精确处理的节点抛出_NeedsSymPy"""
+    kind = node[0]
+    if kind == 'num':
+        if node[1].isdigit():
+            return int(node[1])
+        raise _NeedsSymPy  # 浮点字面量
+    if kind == 'neg':
+        return -_exact_value(node[1], namespace)
+    if kind == 'pos':
+        return _exact_value(node[1], namespace)
+    if kind == 'fact':
+        return _exact_factorial(_exact_value(node[1], namespace))
+    if kind == 'binop':
+        a = _exact_value(node[2], namespace)
+        b = _exact_value(node[3], namespace)
+        op = node[1]
+        if op == '+':
+            return a + b
+        if op == '-':
+            return a - b
+        if op == '*':
+            return a * b
+        if b == 0 and op in ('/', '%'):
+            raise _NeedsSymPy  # 交给SymPy给出zoo/nan
+        if op == '/':
+            return Fraction(a) / b
+        if op == '%':
+            return a % b
+        if op == '**':
+            if isinstance(b, Fraction):
+                if b.denominator != 1:
+                    raise _NeedsSymPy  # 开方结果可能是无理数
+                b = b.numerator
+            if b < 0:
+                if a == 0:
+                    raise _NeedsSymPy
+                return Fraction(1) / Fraction(a) ** -b
+            return a ** b
+    if kind == 'call' and node[1][0] == 'name' and len(node[2]) == 1 and not node[3]:
+        name = node[1][1]
+        if name in _EXACT_FUNCTIONS and _is_builtin_name(name, namespace):
+            return _EXACT_FUNCTIONS[name](_exact_value(node[2][0], namespace))
+    raise _NeedsSymPy
+
+
+def _float_functions():
+    return {
+        'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+        'asin': math.asin, 'acos': math.acos, 'atan': math.atan,
+        'sinh': math.sinh, 'cosh': math.cosh, 'tanh': math.tanh,
+        'log': math.log, 'ln': math.log, 'log10': math.log10,
+        'exp': math.exp, 'sqrt': math.sqrt, 'abs': abs,
+        'factorial': lambda v: math.gamma(v + 1),
+    }
+
+
+def _mpmath_functions(ctx):
+    return {
+        'sin': ctx.sin, 'cos': ctx.cos, 'tan': ctx.tan,
+        'asin': ctx.asin, 'acos': ctx.acos, 'atan': ctx.atan,
+        'sinh': ctx.sinh, 'cosh': ctx.cosh, 'tanh': ctx.tanh,
+        'log': ctx.log, 'ln': ctx.ln, 'log10': ctx.log10,
+        'exp': ctx.exp, 'sqrt': ctx.sqrt, 'abs': ctx.fabs,
+        'factorial': ctx.factorial,
+    }
+
+
+class _NumericBackend:
+    """浮点（15位）或mpmath（任意精度）数值后端"""
+
+    _contexts = {}
+
+    def __init__(self, precision):
+        self.precision = precision
+        if precision <= 15:
+            self.ctx = None
+            self.functions = _float_functions()
+            self.constants = {'pi': math.pi, 'e': math.e, 'E': math.e}
+        else:
+            ctx = self._contexts.get(precision)
+            if ctx is None:
+                import mpmath
+                ctx = mpmath.MPContext()
+                ctx.dps = precision
+                self._contexts[precision] = ctx
+            self.ctx = ctx
+            self.functions = _mpmath_functions(ctx)
+            self.constants = {'pi': ctx.pi, 'e': ctx.e, 'E': ctx.e}
+
+    def number(self, text):
+        return float(text) if self.ctx is None else self.ctx.mpf(text)
+
+    def check(self, value):
+        """复数、无穷和NaN交给SymPy处理"""
+        if self.ctx is None:
+            if isinstance(value, complex) or not math.isfinite(value):
+                raise _NeedsSymPy
+        elif isinstance(value, self.ctx.mpc) or not self.ctx.isfinite(value):
+            raise _NeedsSymPy
+        return value
+
+
+def _numeric_value(node, namespace, backend):
+    """用浮点或mpmath计算，遇到符号、复数或不支持的结构抛出_NeedsSymPy"""
+    kind = node[0]
+    if kind == 'num':
+        return backend.number(node[1])
+    if kind == 'name':
+        name = node[1]
+        if name in backend.constants and _is_builtin_name(name, namespace):
+            return backend.constants[name]
+        raise _NeedsSymPy
+    if kind == 'neg':
+        return -_numeric_value(node[1], namespace, backend)
+    if kind == 'pos':
+        return _numeric_value(node[1], namespace, backend)
+    if kind == 'fact':
+        return backend.check(backend.functions['factorial'](
+            _numeric_value(node[1], namespace, backend)))
+    if kind == 'binop':
+        a = _numeric_value(node[2], namespace, backend)
+        b = _numeric_value(node[3], namespace, backend)
+        return backend.check(_BINARY_OPS[node[1]](a, b))
+    if kind == 'call' and node[1][0] == 'name' and not node[3]:
+        name = node[1][1]
+        if name in backend.functions and _is_builtin_name(name, namespace):
+            args = [_numeric_value(arg, namespace, backend) for arg in node[2]]
+            if name in ('log', 'ln') and len(args) == 2:
+                return backend.check(backend.functions['log'](args[0]) /
+                                     backend.functions['log'](args[1]))
+            if len(args) != 1:
+                raise _NeedsSymPy
+            return backend.check(backend.functions[name](args[0]))
+    raise _NeedsSymPy
+
+
+def _is_builtin_name(name, namespace):
+    """名称仍指向默认命名空间中的对象（未被重新定义）"""
+    default = get_namespace()
+    return name in default and namespace.get(name) is default[name]
+
+
+def _has_float_literal(tree):
+    return any(node[0] == 'num' and not node[1].isdigit() for node in iter_tree(tree))
+
+
+def numeric_fast_path(tree, namespace, precision=None):
+    """尝试不经SymPy表达式树计算，返回 (结果, 路径)；无法处理时返回None
+
+    精确模式下只处理整数/有理数运算（与SymPy的精确值相同，长整数不改写为浮点），
+    含浮点字面量时用浮点；
+    选择了精度时，不含自由符号的输入一律按该精度数值计算。
+    """
+    try:
+        value = _exact_value(tree, namespace)
+        if isinstance(value, Fraction):
+            result = sp.Rational(value.numerator, value.denominator)
+        else:
+            result = sp.Integer(value)
+        if precision is not None:
+            result = result.evalf(precision)  # 与SymPy路径的numeric_form一致
+        return result, 'exact'
+    except _NeedsSymPy:
+        pass
+    except (ArithmeticError, ValueError):
+        return None
+    if precision is None:
+        if not _has_float_literal(tree):
+            return None
+        precision = 15
+    backend = _NumericBackend(precision)
+    try:
+        value = _numeric_value(tree, namespace, backend)
+    except (_NeedsSymPy, ArithmeticError, ValueError, TypeError):
+        return None
+    return sp.Float(value, max(precision, 15)), ('float' if backend.ctx is None else 'mpmath')
+
+
+# ---------------------------------------------------------------------------
+# 开销估计：按语法树结构预测计算开销，选择计算路径
+# ---------------------------------------------------------------------------
+
+COST_INLINE = 50         # 低于此值且只含简单运算：在调用线程中直接计算，其余交给工作进程
+COST_WARN = 1e7          # 超过此值时在计算前提示
+PRECISION_INLINE = 100   # 不超过此位数的数值精度不计入开销（界面可选的最高精度）
+
+# 可在调用线程中计算的函数：参数规模小时总是很快（大整数参数的开销另行计入）
+INLINE_FUNCTIONS = {'sqrt', 'exp', 'log', 'ln', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
+                    'sinh', 'cosh', 'tanh', 'abs', 'Abs', 'factorial', 'Rational',
+                    're', 'im', 'conjugate', 'sign'}
+_INLINE_NODES = {'num', 'name', 'neg', 'pos', 'binop', 'fact', 'cmp', 'tuple', 'list'}
+
+# 耗时难以从输入规模预测的函数，按节点数给出较高的估计
+UNPREDICTABLE_FUNCTIONS = {'integrate', 'solve', 'limit', 'summation', 'product',
+                           'simplify', 'idiff', 'series', 'eigenvals', 'eigenvects'}
+_FACTORING_FUNCTIONS = {'factor', 'cancel', 'apart', 'together', 'gcd', 'roots'}
+_MAX_TERMS = 10 ** 12
+
+
+class Cost:
+    """estimate_cost的结果：开销估计值、计算路径和提示原因"""
+
+    def __init__(self, score, route, reasons):
+        self.score = score
+        self.route = route      # 'inline' 或 'isolated'
+        self.reasons = reasons  # 开销主要来源的说明
+
+    @property
+    def warn(self):
+        return self.score >= COST_WARN
+
+
+def _int_digits(n):
+    """整数的十进制位数（按位长估计，不做进制转换）"""
+    return max(1, int(abs(n).bit_length() * 0.30103) + 1) + (n < 0)
+
+
+def _float_digits(value):
+    """Float文本的长度估计：有效数字、小数点，量级很大或很小时加上指数部分"""
+    from mpmath.libmp import prec_to_dps
+    sign, man, exp, bc = value._mpf_
+    digits = prec_to_dps(value._prec)
+    exponent = math.floor((exp + bc - 1) * 0.30103) if man else 0
+    if exponent >= digits or exponent < -5:
+        return digits + 5 + sign  # 科学计数法
+    return digits + 1 + sign + (exponent < 0)  # 绝对值小于1时有前导0
+
+
+def display_size(expr, limit=None):
+    """结果文本长度的结构化估计，用于比较数值形式和符号形式，代替len(str(...))
+
+    数字按位数、符号按名称长度、函数按名称加括号、运算按运算符计；累计超过
+    limit时提前返回limit，不必遍历完大表达式。
+    """
+    total = 0
+    for node in sp.preorder_traversal(expr):
+        if isinstance(node, sp.Float):
+            total += _float_digits(node)
+        elif isinstance(node, sp.Integer):
+            total += _int_digits(int(node))
+        elif isinstance(node, sp.Rational):
+            total += _int_digits(node.p) + _int_digits(node.q) + 1
+        elif isinstance(node, sp.Symbol):
+            total += len(node.name)
+        elif isinstance(node, sp.Add):
+            total += 3 * (len(node.args) - 1)  # " + "
+        elif isinstance(node, sp.Mul):
+            total += len(node.args) - 1
+        elif isinstance(node, sp.Function):
+            total += len(type(node).__name__) + 2
+        elif isinstance(node, sp.Pow):
+            total += 4 if isinstance(node.base, (sp.Add, sp.Mul)) else 2  # 底数的括号
+        else:
+            total += 2
+        if limit is not None and total >= limit:
+            return limit
+    return total
+
+
+def expr_size(value, limit=10 ** 6):
+    """SymPy对象（含列表、矩阵）的节点数，超过limit时返回limit"""
+    count = 0
+    try:
+        for _ in sp.preorder_traversal(value):
+            count += 1
+            if count >= limit:
+                break
+    except Exception:
+        return 1
+    return max(count, 1)
+
+
+def _cost_metrics(node, sizes, reasons):
+    """返回 (开销, 节点数, 多项式次数, 展开后的项数, 整数值或None, 嵌套深度)
+
+    由整数字面量算出但太大无法确定的整数值记为math.inf（无上界），
+    以它为指数或阶乘参数的运算开销也视为无上界。
+    """
+    kind = node[0]
+    if kind == 'num':
+        value = int(node[1]) if node[1].isdigit() else None
+        return 1, 1, 0, 1, value, 0
+    if kind == 'name':
+        if node[1] in sizes:
+            size = sizes[node[1]]
+            return 1, size, 1, size, None, 0
+        degree = 0 if node[1] in ('pi', 'e', 'E', 'I', 'oo') else 1
+        return 1, 1, degree, 1, None, 0
+    if kind in ('neg', 'pos'):
+        cost, size, degree, terms, value, depth = _cost_metrics(node[1], sizes, reasons)
+        if value is not None and kind == 'neg':
+            value = -value
+        return cost + 1, size + 1, degree, terms, value, depth + 1
+    if kind == 'fact' or (kind == 'call' and node[1] == ('name', 'factorial') and len(node[2]) == 1):
+        cost, size, degree, terms, value, depth = _cost_metrics(
+            node[1] if kind == 'fact' else node[2][0], sizes, reasons)
+        if value is not None and value > 1:
+            digits = math.inf if value == math.inf else value * math.log10(value)
+            cost += _big_number_cost(digits, reasons)
+        if value is not None and value >= 0:
+            value = math.factorial(value) if value <= 20 else math.inf  # 21!已超过10**18
+        else:
+            value = None
+        return cost + 1, size + 1, degree, terms, value, depth + 1
+    if kind == 'binop':
+        op = node[1]
+        c1, s1, d1, t1, v1, h1 = _cost_metrics(node[2], sizes, reasons)
+        c2, s2, d2, t2, v2, h2 = _cost_metrics(node[3], sizes, reasons)
+        cost, size, depth = c1 + c2 + 1, s1 + s2 + 1, max(h1, h2) + 1
+        value = _small_int_op(op, v1, v2)
+        if op in ('+', '-'):
+            return cost, size, max(d1, d2), min(t1 + t2, _MAX_TERMS), value, depth
+        if op != '**':
+            return cost, size, d1 + d2, min(t1 * t2, _MAX_TERMS), value, depth
+        if v2 is None:
+            return cost, size, d1, t1, None, depth
+        if v1 is not None:
+            # 整数的整数次幂（负指数时为分母）：按结果位数计
+            if abs(v1) <= 1:
+                digits = 1
+            elif math.inf in (abs(v1), abs(v2)):
+                digits = math.inf
+            else:
+                digits = abs(v2) * math.log10(max(abs(v1), 2))
+            return cost + _big_number_cost(digits, reasons), size, 0, 1, value, depth
+        if v2 < 0 or v2 == math.inf:
+            return cost, size, d1, t1, None, depth
+        terms = math.comb(v2 + t1 - 1, t1 - 1) if 1 < t1 < 1000 and v2 < 10 ** 6 else t1
+        return cost, size, d1 * v2, min(terms, _MAX_TERMS), None, depth
+    if kind == 'call':
+        callee = node[1]
+        children = list(node[2]) + [value for _, value in node[3]]
+        if callee[0] == 'attr':
+            name = callee[2]
+            children.insert(0, callee[1])  # 方法的对象视为第一个参数
+        else:
+            name = callee[1] if callee[0] == 'name' else None
+        cost, size, degree, terms, depth = 1, 1, 0, 0, 0
+        values = []
+        for child in children:
+            c, s, d, t, v, h = _cost_metrics(child, sizes, reasons)
+            cost += c
+            size += s
+            degree = max(degree, d)
+            terms = min(terms + t, _MAX_TERMS)
+            depth = max(depth, h)
+            values.append(v)
+        extra = _function_cost(name, size, degree, terms, depth, reasons)
+        extra += _precision_cost(_digits_argument(node, values), reasons)
+        if name == 'expand':
+            size = max(size, terms)
+        return cost + extra, size, degree, max(terms, 1), None, depth + 1
+    # 比较、属性、下标、元组、列表、字典：累加子节点
+    cost, size, degree, terms, depth = 1, 1, 0, 0, 0
+    for child in tree_children(node):
+        c, s, d, t, _, h = _cost_metrics(child, sizes, reasons)
+        cost += c
+        size += s
+        degree = max(degree, d)
+        terms = min(terms + t, _MAX_TERMS)
+        depth = max(depth, h)
+    return cost, size, degree, max(terms, 1), None, depth + 1
+
+
+def _small_int_op(op, a, b):
+    """两个整数的运算结果（只用于估计指数等）：不是整数运算时返回None，
+    结果过大（或操作数已是math.inf）时返回math.inf"""
+    if a is None or b is None:
+        return None
+    if op == '**' and b < 0:
+        return None
+    if math.inf in (abs(a), abs(b)):
+        return None if op not in ('+', '-', '*', '**') else math.inf
+    if op == '+':
+        value = a + b
+    elif op == '-':
+        value = a - b
+    elif op == '*':
+        value = a * b
+    elif op == '**':
+        if abs(a) > 1 and (b > 64 or abs(a) >= 2 ** 32):
+            return math.inf
+        value = a ** b
+    else:
+        return None
+    return value if abs(value) < 10 ** 18 else math.inf
+
+
+def _big_number_cost(digits, reasons):
+    """位数很多的整数：计算和转换为文本的开销"""
+    cost = digits * 10
+    if digits == math.inf:
+        reasons.append("嵌套的巨大整数运算，结果位数无法估计")
+    elif cost >= COST_WARN / 10:
+        reasons.append(f"结果约 {digits:.3g} 位数字")
+    return cost
+
+
+def _digits_argument(node, values):
+    """evalf(n)、n(n)、N(expr, n)调用中的精度位数（整数值或math.inf），没有时返回None
+
+    values为调用各子节点（方法的对象、位置参数、关键字参数依次排列）的整数值。
+    """
+    callee, args, kwargs = node[1], node[2], node[3]
+    if callee[0] == 'attr' and callee[2] in ('evalf', 'n'):
+        count = 1  # 精度为第1个位置参数，values[0]为方法的对象
+    elif callee == ('name', 'N'):
+        count = 2  # 精度为第2个位置参数
+    else:
+        return None
+    for index, (key, _) in enumerate(kwargs):
+        if key == 'n':
+            return values[len(values) - len(kwargs) + index]
+    return values[1] if len(args) >= count else None
+
+
+def _precision_cost(digits, reasons):
+    """按digits位精度数值求值的附加开销，不超过PRECISION_INLINE位时忽略"""
+    if digits is None or digits <= PRECISION_INLINE:
+        return 0
+    cost = digits * 10
+    if digits == math.inf:
+        reasons.append("数值精度的位数无法估计")
+    elif cost >= COST_WARN / 10:
+        reasons.append(f"按 {digits:.3g} 位精度数值求值")
+    return cost
+
+
+def _inline_only(tree, sizes):
+    """语法树是否只含可在调用线程中直接计算的简单运算
+
+    方法调用、属性、下标和不在INLINE_FUNCTIONS中的函数（包括未知的函数）
+    耗时无法估计，都交给可终止的工作进程；引用的会话变量也须足够小。
+    """
+    for node in iter_tree(tree):
+        kind = node[0]
+        if kind == 'call':
+            if node[1][0] != 'name' or node[1][1] not in INLINE_FUNCTIONS or node[3]:
+                return False
+        elif kind not in _INLINE_NODES:
+            return False
+        elif kind == 'name' and sizes.get(node[1], 0) >= COST_INLINE:
+            return False
+    return True
+
+
+def _function_cost(name, size, degree, terms, depth, reasons):
+    """一次函数调用的附加开销，参数为其全部参数的合计规模"""
+    if name == 'expand':
+        cost = terms * max(degree, 1)
+        if cost >= COST_WARN / 10:
+            reasons.append(f"expand 展开后约 {terms:.3g} 项")
+    elif name in _FACTORING_FUNCTIONS:
+        cost = 10 * (degree + 1) ** 2 * max(size, terms)
+        if cost >= COST_WARN / 10:
+            reasons.append(f"{name} 作用于 {degree} 次、约 {max(size, terms):.3g} 项的多项式")
+    elif name in UNPREDICTABLE_FUNCTIONS:
+        cost = 50 * size ** 1.5 * (1 + degree) * (1 + depth / 10)
+        if name == 'simplify':
+            cost = max(cost, 20 * size ** 2)
+        if cost >= COST_WARN / 10:
+            reasons.append(f"{name} 作用于约 {size} 个节点的表达式")
+    elif name in ('det', 'inv', 'solve_linear', 'LUsolve', 'rref'):
+        cost = size ** 1.5
+    elif name in ('diff', 'subs'):
+        cost = 2 * size
+    else:
+        cost = 1
+    return cost
+
+
+def estimate_cost(expr, sizes=None, precision=None):
+    """按语法树估计计算开销，返回Cost；sizes为会话变量名 -> 值的节点数
+
+    开销按运算次数、多项式次数（展开后的项数）、嵌套深度、所调用的函数和数值
+    精度（precision及evalf/N的位数参数）估计，只遍历输入的语法树，不构造SymPy
+    表达式。只有开销很小且只含简单运算的输入在调用线程中计算，其余（包括无法
+    解析的输入）都交给可终止的工作进程。
+    """
+    try:
+        tree = parse_expression(expr)
+    except Exception:
+        return Cost(0, 'isolated', [])
+    reasons = []
+    sizes = sizes or {}
+    score = _cost_metrics(tree, sizes, reasons)[0] + _precision_cost(precision, reasons)
+    if score < COST_INLINE and _inline_only(tree, sizes):
+        route = 'inline'
+    else:
+        route = 'isolated'
+    return Cost(score, route, reasons)
+
+
+def binding_sizes(bindings):
+    """会话变量值的节点数，供estimate_cost使用
+
+    遍历每个值，只在没有Session.sizes（定义变量时已算好）可用时使用。
+    """
+    return {name: expr_size(value) for name, value in (bindings or {}).items()}
+
+
+# ---------------------------------------------------------------------------
+# 编译的数值函数：数值代入时不再逐点遍历符号表达式
+# ---------------------------------------------------------------------------
+
+_COMPILED_FUNCTIONS = OrderedDict()  # (表达式, 变量, 后端) -> 编译后的函数
+_compiled_lock = threading.Lock()
+MAX_BATCH_POINTS = 100000
+
+
+def compile_numeric(expr, variables, backend='math'):
+    """把表达式编译为数值函数（先做公共子表达式消去再lambdify），按表达式缓存
+
+    backend为'math'时得到逐点计算的纯Python函数，为'numpy'时得到向量化函数。
+    同一结果之后的数值代入和绘图都复用缓存的函数。
+    """
+    variables = tuple(variables)
+    key = (expr, variables, backend)
+    with _compiled_lock:
+        func = _COMPILED_FUNCTIONS.get(key)
+        if func is not None:
+            _COMPILED_FUNCTIONS.move_to_end(key)
+            return func
+    if backend == 'numpy':
+        load_numpy()
+    try:
+        func = sp.lambdify(variables, expr, modules=backend, cse=True)
+    except TypeError:  # SymPy 1.9之前的lambdify没有cse参数
+        func = sp.lambdify(variables, expr, modules=backend)
+    with _compiled_lock:
+        _COMPILED_FUNCTIONS[key] = func
+        if len(_COMPILED_FUNCTIONS) > 64:
+            _COMPILED_FUNCTIONS.popitem(last=False)
+    return func
+
+
+def point_range(start, stop=None, step=1):
+    """等差点列，不含终点（同Python的range），步长可以是分数或小数"""
+    if stop is None:
+        start, stop = 0, start
+    start, stop, step = sp.sympify(start), sp.sympify(stop), sp.sympify(step)
+    if step == 0:
+        raise ValueError("步长不能为0")
+    count = max(int(sp.ceiling((stop - start) / step)), 0)
+    if count > MAX_BATCH_POINTS:
+        raise ValueError(f"点数过多（上限 {MAX_BATCH_POINTS}）")
+    return [start + i * step for i in range(count)]
+
+
+def point_linspace(start, stop, count=50):
+    """从start到stop（含两端）均匀分布的count个点"""
+    count = int(count)
+    if count < 2 or count > MAX_BATCH_POINTS:
+        raise ValueError(f"点数应在 2 到 {MAX_BATCH_POINTS} 之间")
+    start, stop = sp.sympify(start), sp.sympify(stop)
+    return [start + (stop - start) * i / (count - 1) for i in range(count)]
+
+
+def _subs_pairs(args):
+    """把subs的参数整理为 [(旧, 新)]，不认识的形式返回None"""
+    if len(args) == 2:
+        return [(args[0], args[1])]
+    if len(args) == 1:
+        mapping = args[0]
+        if isinstance(mapping, dict):
+            return list(mapping.items())
+        if isinstance(mapping, (list, tuple)) and all(
+                isinstance(pair, (list, tuple)) and len(pair) == 2 for pair in mapping):
+            return [tuple(pair) for pair in mapping]
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _code_printer(backend):
+    if backend == 'numpy':
+        from sympy.printing.numpy import NumPyPrinter
+        return NumPyPrinter()
+    from sympy.printing.pycode import PythonCodePrinter
+    return PythonCodePrinter()
+
+
+def translatable(expr, backend='math'):
+    """表达式中的函数是否都能由lambdify翻译为backend模块的函数
+
+    lambdify会把不认识的函数原样写进生成的代码，调用时才报NameError。
+    """
+    known = _code_printer(backend).known_functions
+    return all(type(func).__name__ in known for func in expr.atoms(sp.Function))
+
+
+def _to_number(value):
+    """把编译函数的返回值转换为SymPy数（整数结果如floor保持为Integer）"""
+    if isinstance(value, int):
+        return sp.Integer(value)
+    value = complex(value)
+    if math.isnan(value.real) or math.isnan(value.imag):
+        return sp.nan
+    if abs(value.imag) <= 1e-12 * (1 + abs(value.real)):
+        if math.isinf(value.real):
+            return sp.oo if value.real > 0 else -sp.oo
+        return sp.Float(value.real)
+    return sp.Float(value.real) + sp.I * sp.Float(value.imag)
+
+
+def numeric_subs(expr, args, kwargs):
+    """用编译后的函数代入数值，不适用时返回None（交给SymPy的subs）
+
+    代入值中含浮点数时按浮点计算；某个变量代入列表（如range、linspace的结果）时
+    在所有点上计算并返回结果列表，批量代入的结果均为浮点数。
+    """
+    if kwargs or not isinstance(expr, sp.Expr):
+        return None
+    pairs = _subs_pairs(args)
+    if pairs is None or not all(isinstance(old, sp.Symbol) for old, _ in pairs):
+        return None
+    batch = [i for i, (_, new) in enumerate(pairs) if isinstance(new, (list, tuple))]
+    if len(batch) > 1:
+        raise ValueError("只能对一个变量代入列表")
+    variables = [old for old, _ in pairs]
+    numeric = expr.free_symbols <= set(variables)
+    compilable = numeric and translatable(expr, 'math')
+    
+    if not batch:
+        news = [sp.sympify(new) for _, new in pairs]
+        if not compilable or not any(new.has(sp.Float) for new in news):
+            return None  # 精确代入仍由SymPy完成
+        try:
+            result = _to_number(compile_numeric(expr, variables, 'math')(*[float(new) for new in news]))
+        except (TypeError, ValueError, ArithmeticError, NameError, KeyError):
+            return None
+        return _answered('compiled', result)
+    
+    index = batch[0]
+    points = [sp.sympify(point) for point in pairs[index][1]]
+    if len(points) > MAX_BATCH_POINTS:
+        raise ValueError(f"点数过多（上限 {MAX_BATCH_POINTS}）")
+    
+    def symbolic(point):
+        value = expr.subs([(old, point if i == index else new)
+                           for i, (old, new) in enumerate(pairs)])
+        return value.evalf() if numeric else value
+    
+    if not numeric:
+        return [symbolic(point) for point in points]
+    try:
+        values = [complex(new) for i, (_, new) in enumerate(pairs) if i != index]
+        xs = [complex(point) for point in points]
+    except TypeError:
+        return [symbolic(point) for point in points]
+    
+    # 先用NumPy在复数上向量化计算，不支持的函数再逐点计算
+    if translatable(expr, 'numpy'):
+        try:
+            np = load_numpy()
+            func = compile_numeric(expr, variables, 'numpy')
+            call_args = list(values)
+            call_args.insert(index, np.asarray(xs, dtype=complex))
+            with np.errstate(all='ignore'):
+                ys = np.broadcast_to(np.asarray(func(*call_args)), (len(xs),))
+            return _answered('compiled', [_to_number(y) for y in ys])
+        except (ImportError, TypeError, ValueError, ArithmeticError, AttributeError,
+                NameError, KeyError):
+            pass
+    if not compilable:
+        return [symbolic(point) for point in points]
+    func = compile_numeric(expr, variables, 'math')
+    results = []
+    for point, x in zip(points, xs):
+        call_args = list(values)
+        call_args.insert(index, x)
+        # math模块的函数只接受实数，复数点交给SymPy
+        call_args = [value if value.imag else value.real for value in call_args]
+        try:
+            results.append(_to_number(func(*call_args)))
+        except (TypeError, ValueError, ArithmeticError, NameError, KeyError):
+            results.append(symbolic(point))
+    return _answered('compiled', results)
+
+
+# ---------------------------------------------------------------------------
+# NumPy数值矩阵：只含数值且有浮点元素的矩阵交给LAPACK，含符号或全为精确数的
+# 矩阵仍由SymPy精确计算
+# ---------------------------------------------------------------------------
+
+_engine = threading.local()  # 本线程当前求值实际用到的后端（'numpy'等）及其结果
+
+
+def _answered(name, result):
+    """记录由name路径算出的结果；它就是最终结果时才用作路径标签（见evaluate_detailed）"""
+    _engine.name = name
+    _engine.answer = result
+    return result
+
+
+def numeric_array(value, require_float=True):
+    """把只含数值的SymPy矩阵转换为NumPy数组，不适用时返回None
+
+    require_float为True时只转换含浮点元素的矩阵，精确矩阵的结果保持精确。
+    """
+    if not isinstance(value, sp.MatrixBase) or (require_float and not value.has(sp.Float)):
+        return None
+    try:
+        np = load_numpy()
+    except ImportError:
+        return None
+    try:
+        # 数字元素直接转float，比complex()快得多
+        entries = [float(entry) if entry.is_Number else complex(entry) for entry in value]
+    except TypeError:
+        return None  # 含符号
+    array = np.array(entries, dtype=complex).reshape(value.shape)
+    if not array.imag.any():
+        array = array.real
+    return array
+
+
+def _from_array(array):
+    """NumPy结果转换回SymPy矩阵或数"""
+    np = load_numpy()
+    if np.ndim(array) == 0:
+        return _to_number(array)
+    return sp.Matrix([[_to_number(entry) for entry in row] for row in np.atleast_2d(array)])
+
+
+def _square_array(target, args, kwargs):
+    """无参数方法的公共检查：数值方阵返回数组，否则返回None"""
+    if args or kwargs:
+        return None
+    array = numeric_array(target)
+    if array is None or array.shape[0] != array.shape[1]:
+        return None
+    return array
+
+
+def _numpy_det(target, args=(), kwargs=None):
+    array = _square_array(target, args, kwargs)
+    if array is None:
+        return None
+    np = load_numpy()
+    return _answered('numpy', _to_number(np.linalg.det(array)))
+
+
+def _numpy_inv(target, args=(), kwargs=None):
+    array = _square_array(target, args, kwargs)
+    if array is None:
+        return None
+    np = load_numpy()
+    try:
+        return _answered('numpy', _from_array(np.linalg.inv(array)))
+    except np.linalg.LinAlgError:
+        raise ValueError("矩阵不可逆（奇异矩阵）")
+
+
+def _numpy_eigenvals(target, args=(), kwargs=None):
+    array = _square_array(target, args, kwargs)
+    if array is None:
+        return None
+    np = load_numpy()
+    values = {}
+    for value in np.linalg.eigvals(array):
+        value = _to_number(value)
+        values[value] = values.get(value, 0) + 1
+    return _answered('numpy', values)  # 与SymPy一致：特征值 -> 重数
+
+
+def _numpy_solve(target, args, kwargs):
+    """A.solve(b) / A.LUsolve(b)：求解线性方程组"""
+    if len(args) != 1 or kwargs:
+        return None
+    a = numeric_array(target, require_float=False)
+    b = numeric_array(args[0], require_float=False)
+    if a is None or b is None or not (target.has(sp.Float) or args[0].has(sp.Float)):
+        return None
+    if a.shape[0] != a.shape[1] or b.shape[0] != a.shape[0]:
+        return None
+    np = load_numpy()
+    try:
+        return _answered('numpy', _from_array(np.linalg.solve(a, b)))
+    except np.linalg.LinAlgError:
+        raise ValueError("系数矩阵奇异，方程组没有唯一解")
+
+
+def numpy_matrix_op(op, left, right):
+    """数值矩阵的乘积和整数次幂，不适用时返回None"""
+    np_left = numeric_array(left, require_float=False)
+    if np_left is None:
+        return None
+    np = load_numpy()
+    if op == '*':
+        np_right = numeric_array(right, require_float=False)
+        if (np_right is None or not (left.has(sp.Float) or right.has(sp.Float))
+                or np_left.shape[1] != np_right.shape[0]):
+            return None
+        return _answered('numpy', _from_array(np_left @ np_right))
+    if (op == '**' and left.has(sp.Float) and isinstance(right, (int, sp.Integer))
+            and np_left.shape[0] == np_left.shape[1]):
+        try:
+            return _answered('numpy', _from_array(np.linalg.matrix_power(np_left, int(right))))
+        except np.linalg.LinAlgError:
+            raise ValueError("矩阵不可逆（奇异矩阵）")
+    return None
+
+
+# ---------------------------------------------------------------------------
+# 稀疏多项式环：多项式和有理函数的expand/factor/cancel/solve在ZZ/QQ上的
+# 稀疏表示中计算，只在最后转换回SymPy表达式
+# ---------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=64)
+def _poly_ring(symbols, domain):
+    from sympy.polys.rings import ring
+    return ring(symbols, domain)[0]
+
+
+@functools.lru_cache(maxsize=64)
+def _poly_field(symbols, domain):
+    from sympy.polys.fields import field
+    return field(symbols, domain)[0]
+
+
+def _poly_symbols(expr):
+    """表达式的自由符号（与Poly相同的生成元顺序）；含浮点、函数、非整数次幂等时返回None"""
+    from sympy.polys.polyutils import _sort_gens
+    if not isinstance(expr, sp.Expr) or expr.has(sp.Float):
+        return None
+    symbols = expr.free_symbols
+    if not symbols or not all(isinstance(symbol, sp.Symbol) for symbol in symbols):
+        return None
+    return tuple(_sort_gens(symbols))
+
+
+def poly_element(expr, rational=False):
+    """转换为ZZ/QQ上稀疏多项式环（rational为True时为有理函数域）的元素，不适用时返回None"""
+    symbols = _poly_symbols(expr)
+    if symbols is None:
+        return None
+    for domain in (sp.ZZ, sp.QQ):
+        space = _poly_field(symbols, domain) if rational else _poly_ring(symbols, domain)
+        try:
+            return space.from_expr(expr)
+        except (ValueError, TypeError, sp.polys.polyerrors.CoercionFailed,
+                sp.polys.polyerrors.PolynomialError):
+            continue
+    return None
+
+
+def poly_expand(expr, *args, **hints):
+    """expand：多项式在稀疏环上展开，其余交给sp.expand"""
+    if not args and not hints:
+        poly = poly_element(sp.sympify(expr))
+        if poly is not None:
+            return _answered('poly', poly.as_expr())
+    return sp.expand(expr, *args, **hints)
+
+
+def _factored(poly, sign=1):
+    """稀疏多项式的因式分解 -> (SymPy系数, [因子**次数])，sign为-1时次数取负（分母）"""
+    coeff, factors = poly.factor_list()
+    coeff = poly.ring.domain.to_sympy(coeff)
+    return coeff ** sign, [factor.as_expr() ** (sign * k) for factor, k in factors]
+
+
+def poly_factor(expr, *args, **hints):
+    """factor：多项式和有理函数分别对分子、分母在稀疏环上分解，其余交给sp.factor"""
+    if not args and not hints:
+        fraction = poly_element(sp.sympify(expr), rational=True)
+        if fraction is not None:
+            from sympy.core.mul import _keep_coeff
+            coeff, factors = _factored(fraction.numer)
+            if fraction.denom != 1:
+                denom_coeff, denom_factors = _factored(fraction.denom, -1)
+                coeff *= denom_coeff
+                factors += denom_factors
+            # 与sp.factor一样保留数值系数，不让它分配进加法因子
+            return _answered('poly', _keep_coeff(coeff, sp.Mul(*factors)))
+    return sp.factor(expr, *args, **hints)
+
+
+def poly_cancel(expr, *args, **hints):
+    """cancel：有理函数在有理函数域上约分（分子分母自动约去公因式），其余交给sp.cancel"""
+    if not args and not hints:
+        expr = sp.sympify(expr)
+        fraction = poly_element(expr, rational=True)
+        if fraction is not None:
+            numer, denom = fraction.numer, fraction.denom
+            if fraction.field.domain.is_negative(denom.LC):
+                numer, denom = -numer, -denom  # 与sp.cancel一致：符号放在分子
+            return _answered('poly', numer.as_expr() / denom.as_expr())
+    return sp.cancel(expr, *args, **hints)
+
+
+def _polynomial_roots(args, kwargs):
+    """单变量多项式方程：在稀疏环上分解后逐个因子求根，返回sp.solve格式或None"""
+    if kwargs or not 1 <= len(args) <= 2:
+        return None
+    equation = sp.sympify(args[0])
+    if isinstance(equation, sp.Equality):
+        equation = equation.lhs - equation.rhs
+    poly = poly_element(equation)
+    if poly is None or poly.ring.ngens != 1:
+        return None
+    symbol = poly.ring.symbols[0]
+    if len(args) == 2:
+        target = args[1]
+        if isinstance(target, (list, tuple)) and len(target) == 1:
+            target = target[0]
+        if target != symbol:
+            return None
+    if poly.is_ground:
+        return None  # 常数方程交给sp.solve
+    solutions = []
+    for factor, _ in poly.factor_list()[1]:
+        factor_poly = sp.Poly(factor.as_expr(), symbol)
+        found = sp.roots(factor_poly, cubics=True, quartics=True)
+        if sum(found.values()) < factor_poly.degree():
+            found = {sp.CRootOf(factor_poly, i): 1 for i in range(factor_poly.degree())}
+        solutions.extend(root for root in found if root not in solutions)
+    return _answered('poly', sorted(solutions, key=sp.default_sort_key))  # 与sp.solve的排序一致
+
+
+# ---------------------------------------------------------------------------
+# 精确线性代数：有理数或多项式元素的矩阵转换为稀疏DomainMatrix，
+# 在对应的整环/域上做无分数消元
+# ---------------------------------------------------------------------------
+
+EXACT_MIN_SIZE = 4  # 更小的矩阵和方程组直接交给SymPy，结果形式保持不变
+
+
+def domain_matrix(value):
+    """把精确矩阵转换为稀疏DomainMatrix，含浮点、无法放入多项式域或太小时返回None"""
+    if (not isinstance(value, sp.MatrixBase) or max(value.shape) < EXACT_MIN_SIZE
+            or value.has(sp.Float)):
+        return None
+    from sympy.polys.matrices import DomainMatrix
+    try:
+        matrix = DomainMatrix.from_Matrix(value)
+    except Exception:
+        return None
+    if matrix.domain.is_EX or getattr(matrix.domain, 'is_EXRAW', False):
+        return None  # 含sqrt(2)、sin(x)等，域上运算没有优势
+    return matrix.to_sparse()
+
+
+def _exact_det(target, args=(), kwargs=None):
+    if args or kwargs:
+        return None
+    matrix = domain_matrix(target)
+    if matrix is None or not matrix.is_square:
+        return None
+    return _answered('domain', matrix.domain.to_sympy(matrix.det()))
+
+
+def _exact_solve(target, args, kwargs):
+    """A.solve(b) / A.LUsolve(b)：无分数消元求 (分子, 公分母)，最后再约分"""
+    if len(args) != 1 or kwargs or not isinstance(args[0], sp.MatrixBase):
+        return None
+    a = domain_matrix(target)
+    if a is None or not a.is_square or args[0].has(sp.Float) or args[0].rows != a.shape[0]:
+        return None
+    from sympy.polys.matrices import DomainMatrix
+    from sympy.polys.matrices.exceptions import DMNonInvertibleMatrixError
+    try:
+        a, b = a.unify(DomainMatrix.from_Matrix(args[0]).to_sparse())
+        if a.domain.is_EX or getattr(a.domain, 'is_EXRAW', False):
+            return None
+        numerators, denominator = a.solve_den(b)
+    except (AttributeError, NotImplementedError):
+        return None  # 较早的SymPy没有solve_den
+    except DMNonInvertibleMatrixError:
+        raise ValueError("系数矩阵奇异，方程组没有唯一解")
+    field = numerators.domain.get_field()
+    scale = field.quo(field.one, field.convert_from(denominator, numerators.domain))
+    return _answered('domain', (numerators.convert_to(field) * scale).to_Matrix())
+
+
+def solve_equations(*args, **kwargs):
+    """solve：较大的线性方程组用linsolve，单变量多项式方程在稀疏环上分解后求根，
+    其余交给sp.solve
+
+    返回形式与sp.solve一致：唯一解或参数解为 {变量: 值}，无解为 []。
+    """
+    result = _linear_system(args, kwargs)
+    if result is None:
+        result = _polynomial_roots(args, kwargs)
+    return sp.solve(*args, **kwargs) if result is None else result
+
+
+def _linear_system(args, kwargs):
+    if kwargs or len(args) != 2:
+        return None
+    equations, symbols = args
+    if (not isinstance(equations, (list, tuple)) or not isinstance(symbols, (list, tuple))
+            or len(equations) < EXACT_MIN_SIZE
+            or not all(isinstance(symbol, sp.Symbol) for symbol in symbols)):
+        return None
+    exprs = []
+    for equation in equations:
+        if isinstance(equation, sp.Equality):
+            equation = equation.lhs - equation.rhs
+        if not isinstance(equation, sp.Expr) or equation.has(sp.Float):
+            return None
+        exprs.append(equation)
+    try:
+        solutions = sp.linsolve(exprs, list(symbols))
+    except ValueError:
+        return None  # 非线性方程组
+    if not solutions:
+        return _answered('domain', [])
+    values = next(iter(solutions))
+    return _answered('domain', {symbol: value for symbol, value in zip(symbols, values)
+                                if value != symbol})
+
+
+def _matrix_method(*implementations):
+    """依次尝试NumPy和精确实现，都不适用时返回None（回到SymPy）"""
+    def method(target, args=(), kwargs=None):
+        for implementation in implementations:
+            result = implementation(target, args, kwargs)
+            if result is not None:
+                return result
+        return None
+    return method
+
+
+_matrix_det = _matrix_method(_numpy_det, _exact_det)
+_matrix_solve = _matrix_method(_numpy_solve, _exact_solve)
+
+
+def determinant(matrix):
+    """det(M)：数值矩阵用LAPACK，有理数/多项式矩阵用DomainMatrix，其余用SymPy"""
+    result = _matrix_det(matrix)
+    return matrix.det() if result is None else result
+
+
+# 方法调用的快速实现，返回None时回到SymPy的方法
+_METHOD_OVERRIDES = {
+    'subs': numeric_subs,
+    'det': _matrix_det,
+    'inv': _numpy_inv,
+    'eigenvals': _numpy_eigenvals,
+    'solve': _matrix_solve,
+    'LUsolve': _matrix_solve,
+}
+
+
+def evaluate_detailed(expr, namespace=None, precision=None, timings=None):
+    """计算表达式并返回 (结果, 路径)，路径见ENGINE_LABELS
+
+    单次解析（语法树有缓存）；不含自由符号的输入先走数值快速路径，
+    需要时才由SymPy构造表达式。传入timings字典时记录各阶段耗时（秒）。
+    """
+    load_sympy()
+    if namespace is None:
+        namespace = get_namespace()
+    if timings is None:
+        timings = {}
+    
+    start = time.perf_counter()
+    tree = parse_expression(expr)
+    parsed = time.perf_counter()
+    timings['parse'] = parsed - start
+    fast = numeric_fast_path(tree, namespace, precision)
+    if fast is not None:
+        timings['evaluate'] = time.perf_counter() - parsed
+        return fast
+    
+    _engine.name, _engine.answer = 'sympy', None
+    result = evaluate_tree(tree, namespace)
+    # 快速路径只算了其中一部分（如嵌套的expand）时仍标为SymPy
+    engine = _engine.name if _engine.answer is result else 'sympy'
+    evaluated = time.perf_counter()
+    timings['evaluate'] = evaluated - parsed
+    result = numeric_form(result, precision)
+    timings['evalf'] = time.perf_counter() - evaluated
+    return result, engine
+
+
+def numeric_form(result, precision=None):
+    """对SymPy结果尝试数值化：选择了精度时按精度计算，否则数值形式更简单时才采用"""
+    if isinstance(result, sp.MatrixBase):
+        return result  # 矩阵没有is_number/is_real，避免为大矩阵生成两次文本
+    if hasattr(result, 'evalf'):
+        try:
+            if precision is not None and result.is_number:
+                return result.evalf(precision)
+            numeric_result = result.evalf()
+            # 如果数值结果比符号结果更简单，返回数值结果（按结构估计文本长度）
+            size = display_size(result)
+            if display_size(numeric_result, size) < size and numeric_result.is_real:
+                return numeric_result
+        except Exception:
+            pass
+    
+    return result
+
+
+def evaluate_expression(expr, namespace=None, precision=None):
+    """使用SymPy计算表达式"""
+    return evaluate_detailed(expr, namespace, precision)[0]
+
+
+MATRIX_DISPLAY_LIMIT = 12  # 行数或列数超过该值的矩阵只显示四角
+MATRIX_EDGE_ITEMS = 3
+
+
+def _shown_indices(n):
+    """显示的行/列下标，None表示省略的部分"""
+    if n <= MATRIX_DISPLAY_LIMIT:
+        return list(range(n))
+    return list(range(MATRIX_EDGE_ITEMS)) + [None] + list(range(n - MATRIX_EDGE_ITEMS, n))
+
+
+def _is_large_matrix(result):
+    return isinstance(result, sp.MatrixBase) and max(result.shape) > MATRIX_DISPLAY_LIMIT
+
+
+# Python 3.11+限制int与十进制文本互转的位数（默认4300位）以防解析不可信输入时的
+# 平方复杂度攻击；进程内不放开该限制，显示和导出已知的大整数时分段转换
+INT_TEXT_DIGITS = 4000  # 分段转换时每段的最大位数，低于默认限制
+_INT_TEXT_BITS = 13000  # 不超过此位长（约3900位）时直接用str
+
+
+def int_text(n):
+    """整数的十进制文本，位数超过int/str转换限制时分段转换"""
+    if abs(n).bit_length() <= _INT_TEXT_BITS:
+        return str(n)
+    sign = '-' if n < 0 else ''
+    n = abs(n)
+    return sign + ''.join(_integer_chunks(n, _exact_digits(n), INT_TEXT_DIGITS, {}))
+
+
+@functools.lru_cache(maxsize=None)
+def _printers():
+    """返回 (文本, LaTeX, srepr) 打印器类，整数不受int/str转换限制
+
+    与str、sp.latex、sp.srepr的输出相同；srepr中的大整数写成十六进制，sympify
+    还原时不经过十进制转换。
+    """
+    from sympy.printing.str import StrPrinter
+    from sympy.printing.latex import LatexPrinter
+    from sympy.printing.repr import ReprPrinter
+
+    class TextPrinter(StrPrinter):
+        def _print_int(self, expr):
+            return int_text(expr)
+
+        def _print_Integer(self, expr):
+            return int_text(expr.p)
+
+        def _print_Rational(self, expr):
+            if expr.q == 1:
+                return int_text(expr.p)
+            return f"{int_text(expr.p)}/{int_text(expr.q)}"
+
+        def _print_MatrixBase(self, expr):
+            # 顶层矩阵与MatrixBase.__str__相同，嵌套在列表等中时与sstr相同
+            if self._print_level > 1 or 0 in expr.shape:
+                return super()._print_MatrixBase(expr)
+            return f"Matrix({self._print(expr.tolist())})"
+
+    class LatexTextPrinter(LatexPrinter):
+        def _print_int(self, expr):
+            return int_text(expr)
+
+        def _print_Rational(self, expr):
+            if expr.q == 1:
+                return int_text(expr.p)
+            sign = "- " if expr.p < 0 else ""
+            p, q = int_text(abs(expr.p)), int_text(expr.q)
+            if self._settings['fold_short_frac']:
+                return f"{sign}{p} / {q}"
+            return rf"{sign}\frac{{{p}}}{{{q}}}"
+
+    class SafeReprPrinter(ReprPrinter):
+        def _print_int(self, expr):
+            return int_text(expr) if abs(expr).bit_length() <= _INT_TEXT_BITS else hex(expr)
+
+        def _print_Integer(self, expr):
+            return f"Integer({self._print_int(expr.p)})"
+
+    return TextPrinter, LatexTextPrinter, SafeReprPrinter
+
+
+def result_text(result):
+    """与str(result)相同的文本"""
+    return _printers()[0]().doprint(result)
+
+
+def result_latex(result):
+    """与sp.latex(result)相同的LaTeX"""
+    return _printers()[1]().doprint(result)
+
+
+def result_srepr(result):
+    """可由sympify还原的srepr文本（大整数为十六进制）"""
+    return _printers()[2]().doprint(result)
+
+
+def display_text(result):
+    """结果的显示文本；大矩阵只格式化四角的元素"""
+    if not _is_large_matrix(result):
+        return result_text(result)
+    rows = []
+    for i in _shown_indices(result.rows):
+        if i is None:
+            rows.append('...')
+            continue
+        cells = ['...' if j is None else result_text(result[i, j]) for j in _shown_indices(result.cols)]
+        rows.append('[' + ', '.join(cells) + ']')
+    return f"Matrix([{', '.join(rows)}])  ({result.rows}×{result.cols})"
+
+
+def display_latex(result):
+    """结果的LaTeX；大矩阵只排版四角的元素"""
+    if not _is_large_matrix(result):
+        return result_latex(result)
+    rows = []
+    for i in _shown_indices(result.rows):
+        cells = []
+        for j in _shown_indices(result.cols):
+            if i is None:
+                cells.append(r'\ddots' if j is None else r'\vdots')
+            else:
+                cells.append(r'\cdots' if j is None else result_latex(result[i, j]))
+        rows.append(' & '.join(cells))
+    body = r' \\ '.join(rows)
+    return (rf"\left[\begin{{matrix}}{body}\end{{matrix}}\right]"
+            rf"_{{{result.rows}\times{result.cols}}}")
+
+
+def format_result(result, with_latex=False):
+    """把结果转换为可序列化的文本形式"""
+    load_sympy()
+    formatted = {'result': result_text(result)}
+    if with_latex:
+        try:
+            formatted['latex'] = result_latex(result)
+        except Exception:
+            formatted['latex'] = None
+    return formatted
+
+
+# ---------------------------------------------------------------------------
+# 大结果：先显示摘要，完整的文本和LaTeX按需分段生成，导出时边生成边写入
+# ---------------------------------------------------------------------------
+
+LARGE_RESULT_CHARS = 20000  # 估计文本长度超过该值时只显示摘要
+PAGE_CHARS = 8000           # 查看器每页的字符数
+SUMMARY_DIGITS = 20         # 摘要中整数首尾各显示的位数
+SUMMARY_CHARS = 80          # 摘要中前几项的最大长度
+TERM_BATCH = 64             # 和式每次打印的项数
+
+
+def is_large_result(result):
+    """结果是否大到不宜整体生成文本和LaTeX（大矩阵另有四角显示）"""
+    if not isinstance(result, sp.Basic) or isinstance(result, sp.MatrixBase):
+        return False
+    return display_size(result, LARGE_RESULT_CHARS) >= LARGE_RESULT_CHARS
+
+
+def _exact_digits(n):
+    """整数绝对值的十进制位数（按位长定位后只需一次比较）"""
+    n = abs(n)
+    digits = int((n.bit_length() - 1) * math.log10(2)) + 1 if n else 1
+    return digits + 1 if n >= 10 ** digits else digits
+
+
+def _integer_pages(n, digits, size):
+    """从高位起逐页取出十进制数字，每页一次除法，首页不必转换整个整数"""
+    for start in range(0, digits, size):
+        shift = digits - start - size
+        part = n // 10 ** shift if shift > 0 else n
+        width = min(size, digits - start)
+        yield int_text(part % 10 ** width).zfill(width)
+
+
+def _integer_chunks(n, digits, size, powers, pad=False):
+    """二分转换十进制数字并按从高位到低位的顺序产出，总开销与str相同但不必整体驻留"""
+    if digits <= size:
+        text = str(n)
+        yield text.zfill(digits) if pad else text
+        return
+    low = digits // 2
+    if low not in powers:
+        powers[low] = 10 ** low
+    high, rest = divmod(n, powers[low])
+    yield from _integer_chunks(high, digits - low, size, powers, pad)
+    yield from _integer_chunks(rest, low, size, powers, True)
+
+
+class LargeResult:
+    """大结果的摘要和分段文本；和式的项只排序一次"""
+
+    def __init__(self, result):
+        self.result = result
+        self.size = display_size(result)
+        self._terms = None
+
+    def terms(self):
+        if self._terms is None:
+            self._terms = self.result.as_ordered_terms()
+        return self._terms
+
+    @staticmethod
+    def _integer(n, paged):
+        if n < 0:
+            yield '-'
+        n = abs(n)
+        digits = _exact_digits(n)
+        if paged:
+            yield from _integer_pages(n, digits, PAGE_CHARS)
+        else:
+            yield from _integer_chunks(n, digits, INT_TEXT_DIGITS, {})
+
+    def chunks(self, latex=False, paged=False):
+        """按顺序产出完整文本（latex为True时为LaTeX）的片段，拼接后与str/sp.latex相同
+
+        paged为True时整数逐页做除法（首页快，适合边看边生成），否则二分转换
+        （适合整体导出）。
+        """
+        result = self.result
+        if isinstance(result, sp.Integer):
+            yield from self._integer(result.p, paged)
+        elif isinstance(result, sp.Rational):
+            if latex:
+                yield r'- \frac{' if result.p < 0 else r'\frac{'
+                yield from self._integer(abs(result.p), paged)
+                yield '}{'
+                yield from self._integer(result.q, paged)
+                yield '}'
+            else:
+                yield from self._integer(result.p, paged)
+                yield '/'
+                yield from self._integer(result.q, paged)
+        elif isinstance(result, sp.Add):
+            # 按打印顺序分批打印各项，批与批之间补上运算符
+            printer = result_latex if latex else result_text
+            terms = self.terms()
+            for start in range(0, len(terms), TERM_BATCH):
+                text = printer(sp.Add(*terms[start:start + TERM_BATCH], evaluate=False))
+                if start:
+                    text = ' - ' + text[1:].lstrip() if text.startswith('-') else ' + ' + text
+                yield text
+        else:
+            yield result_latex(result) if latex else result_text(result)
+
+    def summary(self):
+        """不生成完整文本的一行摘要：位数、项数和开头部分"""
+        result = self.result
+        size = f"约{self.size:,}字符"
+        if isinstance(result, sp.Integer):
+            n = abs(result.p)
+            digits = _exact_digits(n)
+            sign = '-' if result.p < 0 else ''
+            if digits <= 2 * SUMMARY_DIGITS:
+                return f"{digits}位整数：{sign}{n}"
+            head = str(n // 10 ** (digits - SUMMARY_DIGITS))
+            tail = str(n % 10 ** SUMMARY_DIGITS).zfill(SUMMARY_DIGITS)
+            return f"{digits:,}位整数：{sign}{head}…{tail}"
+        if isinstance(result, sp.Rational):
+            return (f"分数：分子{_exact_digits(result.p):,}位，"
+                    f"分母{_exact_digits(result.q):,}位（{size}）")
+        if isinstance(result, sp.Add):
+            terms = self.terms()
+            head = result_text(sp.Add(*terms[:3], evaluate=False))
+            if len(head) > SUMMARY_CHARS:
+                head = head[:SUMMARY_CHARS]
+            return f"{len(terms):,}项之和（{size}）：{head} + …"
+        return f"{type(result).__name__}（{size}，{expr_size(result):,}个节点）"
+
+    def export(self, path, latex=False, cancel_event=None, progress=None):
+        """把完整文本流式写入文件，返回写入的字符数；取消时删除未写完的文件"""
+        written = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for chunk in self.chunks(latex):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                f.write(chunk)
+                written += len(chunk)
+                if progress is not None:
+                    progress(written)
+            else:
+                f.write('\n')
+                return written
+        os.remove(path)
+        raise EvaluationCancelled()
+
+
+class ResultPager:
+    """把LargeResult.chunks切成固定长度的页，每次只生成下一页"""
+
+    def __init__(self, large, latex=False, page_chars=PAGE_CHARS):
+        self.chunks = large.chunks(latex, paged=True)
+        self.page_chars = page_chars
+        self.buffer = ''
+        self.exhausted = False
+
+    def next_page(self):
+        """返回下一页文本，没有更多内容时返回None"""
+        while not self.exhausted and len(self.buffer) < self.page_chars:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+        page, self.buffer = self.buffer[:self.page_chars], self.buffer[self.page_chars:]
+        return page or None
+
+
+# ---------------------------------------------------------------------------
+# 会话变量：name = 表达式，按依赖关系增量重算
+# ---------------------------------------------------------------------------
+
+_ASSIGNMENT_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*=(?!=)(.*)$', re.S)
+
+
+def value_digest(value):
+    """结果的内容摘要，用于判断重算后是否变化以及区分缓存键"""
+    load_sympy()
+    try:
+        text = result_srepr(value)
+    except Exception:
+        text = repr(value)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class SessionVariable:
+    """一个会话变量的定义和当前值"""
+
+    def __init__(self, name, expression, dependencies, value):
+        self.name = name
+        self.expression = expression      # 预处理后的右侧表达式
+        self.dependencies = dependencies  # 引用的非内置名称
+        self.value = value
+        self.digest = value_digest(value)
+        self.size = expr_size(value)      # 值的节点数，估计引用它的输入的开销
+
+
+class Session:
+    """会话变量表
+
+    用 名称 = 表达式 定义变量，之后的输入可以直接引用。每个定义记录它引用的
+    名称；某个变量被重新定义时，只按拓扑顺序重算下游的定义，值未变化的变量
+    不会触发它的下游重算（类似电子表格）。
+    """
+
+    def __init__(self):
+        self.variables = OrderedDict()  # 名称 -> SessionVariable
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_assignment(text):
+        """识别 名称 = 表达式，返回 (名称, 表达式)；不是赋值时返回None"""
+        match = _ASSIGNMENT_RE.match(text)
+        if match is None:
+            return None
+        name, expression = match.group(1), match.group(2).strip()
+        if not expression:
+            raise SyntaxError("赋值号右侧缺少表达式")
+        if name in get_namespace():
+            raise ValueError(f"不能给内置名称 {name} 赋值")
+        return name, expression
+
+    @staticmethod
+    def references(expr):
+        """表达式引用的非内置名称（可能是已定义或将来定义的变量）"""
+        namespace = get_namespace()
+        return frozenset(node[1] for node in iter_tree(parse_expression(expr))
+                         if node[0] == 'name' and node[1] not in namespace)
+
+    def bindings(self, names, overrides=None):
+        """返回 (名称->值, 缓存上下文)；overrides为尚未提交的新值"""
+        values = {}
+        digests = []
+        with self.lock:
+            for name in sorted(names):
+                if overrides is not None and name in overrides:
+                    variable = overrides[name]
+                else:
+                    variable = self.variables.get(name)
+                if variable is not None:
+                    values[name] = variable.value
+                    digests.append(f"{name}={variable.digest}")
+        return values, (';'.join(digests) or None)
+
+    def sizes(self, names, overrides=None):
+        """名称 -> 值的节点数（定义时已算好），供estimate_cost使用"""
+        sizes = {}
+        with self.lock:
+            for name in names:
+                if overrides is not None and name in overrides:
+                    variable = overrides[name]
+                else:
+                    variable = self.variables.get(name)
+                if variable is not None:
+                    sizes[name] = variable.size
+        return sizes
+
+    def check_cycle(self, name, dependencies):
+        """新定义会形成循环依赖时抛出ValueError"""
+        with self.lock:
+            pending = list(dependencies)
+            seen = set()
+            while pending:
+                current = pending.pop()
+                if current == name:
+                    raise ValueError(f"循环依赖：{name} 依赖于自身")
+                if current in seen:
+                    continue
+                seen.add(current)
+                variable = self.variables.get(current)
+                if variable is not None:
+                    pending.extend(variable.dependencies)
+
+    def downstream(self, name):
+        """直接或间接依赖name的变量，按拓扑顺序排列"""
+        with self.lock:
+            dependents = {}
+            for other, variable in self.variables.items():
+                for dependency in variable.dependencies:
+                    dependents.setdefault(dependency, []).append(other)
+        order = []
+        seen = set()
+
+        def visit(current):
+            for child in dependents.get(current, ()):
+                if child not in seen:
+                    seen.add(child)
+                    visit(child)
+                    order.append(child)
+
+        visit(name)
+        order.reverse()
+        return order
+
+    def get(self, name):
+        with self.lock:
+            return self.variables.get(name)
+
+    def commit(self, variables):
+        """一次性写入重算后的变量"""
+        with self.lock:
+            for variable in variables:
+                self.variables[variable.name] = variable
+
+    def names(self):
+        with self.lock:
+            return list(self.variables)
+
+
+# ---------------------------------------------------------------------------
+# 性能记录：分阶段计时、慢计算的cProfile和会话内耗时统计
+# ---------------------------------------------------------------------------
+
+DEFAULT_PROFILE_DIR = os.path.join(APP_DIR, 'profiles')
+DEFAULT_METRICS_LOG = os.path.join(APP_DIR, 'metrics.jsonl')
+DEFAULT_DIAGNOSTICS_LOG = os.path.join(APP_DIR, 'diagnostics.log')
+
+# 计算流程的阶段，按先后顺序
+STAGE_LABELS = {
+    'preprocess': '预处理', 'cache': '查缓存', 'plan': '开销估计', 'parse': '解析', 'evaluate': '求值',
+    'evalf': '数值化', 'ipc': '进程调度', 'latex': 'LaTeX', 'mathtext': '排版',
+    'draw': '绘制', 'other': '其他',
+}
+
+
+def percentile(values, q):
+    """线性插值百分位数，q取0~100"""
+    data = sorted(values)
+    if not data:
+        return None
+    pos = (len(data) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (pos - lo)
+
+
+def format_ms(seconds):
+    """耗时的简短文本"""
+    ms = seconds * 1000
+    if ms < 10:
+        return f"{ms:.1f}ms"
+    return f"{ms:.0f}ms"
+
+
+def format_timings(timings, total, limit=4):
+    """状态栏用的耗时分解：总耗时和最慢的几个阶段"""
+    stages = sorted(((name, seconds) for name, seconds in timings.items()
+                     if seconds >= 0.0005), key=lambda item: -item[1])[:limit]
+    parts = [f"{STAGE_LABELS.get(name, name)} {format_ms(seconds)}" for name, seconds in stages]
+    text = f"耗时 {format_ms(total)}"
+    if parts:
+        text += "（" + " · ".join(parts) + "）"
+    return text
+
+
+def operation_type(expr):
+    """按最外层函数名给表达式分类，用于耗时统计"""
+    try:
+        tree = parse_expression(expr)
+    except Exception:
+        return '其他'
+    if tree[0] == 'call':
+        func = tree[1]
+        if func[0] == 'name':
+            return func[1]
+        if func[0] == 'attr':
+            return func[2]
+    return '算术'
+
+
+def save_profile(profiler, profile_dir, label=''):
+    """保存cProfile数据（.prof）和按累计耗时排序的文本摘要（.txt），返回.prof路径"""
+    import pstats
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}')
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(f"{label}\n\n")
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+    return base + '.prof'
+
+
+def run_profiled(func, profile_dir, threshold, label=''):
+    """在cProfile下运行func()，耗时达到threshold秒时保存，返回 (结果, 文件路径或None)"""
+    import cProfile
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        result = func()
+    finally:
+        profiler.disable()
+    path = None
+    if time.perf_counter() - start >= threshold:
+        try:
+            path = save_profile(profiler, profile_dir, label)
+        except OSError:
+            pass
+    return result, path
+
+
+class MetricsLog:
+    """按运算类型统计最近的计算耗时，并追加写入JSON lines日志
+
+    内存中每类只保留最近window次；日志超过max_bytes时轮换为 .1 文件。
+    """
+
+    def __init__(self, path=None, window=200, max_bytes=1024 * 1024):
+        self.path = path
+        self.window = window
+        self.max_bytes = max_bytes
+        self.samples = {}  # 运算类型 -> deque[秒]
+        self.race_wins = {}  # 运算类型 -> {胜出策略: 次数}
+
+    def record(self, operation, total, source, timings, race=None):
+        """记录一次计算（在UI线程调用），race为竞速求解的结局"""
+        samples = self.samples.get(operation)
+        if samples is None:
+            samples = self.samples[operation] = deque(maxlen=self.window)
+        samples.append(total)
+        if race is not None and race['winner'] is not None:
+            wins = self.race_wins.setdefault(operation, {})
+            wins[race['winner']] = wins.get(race['winner'], 0) + 1
+        if not self.path:
+            return
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'op': operation,
+            'source': source,
+            'total_ms': round(total * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in timings.items()},
+        }
+        if race is not None:
+            entry['race'] = race
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError:
+            self.path = None  # 日志不可写时只保留内存统计
+
+    def summary(self):
+        """[(运算类型, 次数, p50秒, p95秒)]，按p95从高到低排列"""
+        rows = [(operation, len(samples), percentile(samples, 50), percentile(samples, 95))
+                for operation, samples in self.samples.items() if samples]
+        rows.sort(key=lambda row: -row[3])
+        return rows
+
+    def summary_text(self):
+        """各运算类型的p50/p95文本表"""
+        rows = self.summary()
+        if not rows:
+            return "本次会话还没有计算记录"
+        lines = [f"{'运算':<12}{'次数':>6}{'p50':>10}{'p95':>10}"]
+        for operation, count, p50, p95 in rows:
+            lines.append(f"{operation:<12}{count:>6}{format_ms(p50):>10}{format_ms(p95):>10}")
+        if self.race_wins:
+            lines.append("")
+            lines.append("竞速胜出次数:")
+            for operation, wins in self.race_wins.items():
+                ranked = sorted(wins.items(), key=lambda item: -item[1])
+                lines.append(f"  {operation}: " + ", ".join(f"{name}×{count}" for name, count in ranked))
+        return "\n".join(lines)
+
+
+class StallWatchdog:
+    """界面卡顿监视器
+
+    UI线程通过root.after定时发出心跳；后台线程发现心跳停顿超过threshold秒时，
+    抓取主线程当前的调用栈（卡顿持续时每隔threshold秒再抓一次）。心跳恢复后
+    把卡顿时长和调用栈写入诊断日志，据此可以找到阻塞界面的事件处理函数。
+    """
+
+    def __init__(self, root, log_path=DEFAULT_DIAGNOSTICS_LOG, threshold=0.5,
+                 interval=0.1, max_samples=5, max_bytes=1024 * 1024):
+        self.root = root
+        self.log_path = log_path
+        self.threshold = threshold
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.main_thread_id = None
+        self.last_beat = None
+        self.samples = []   # 本次卡顿中抓到的 (已卡顿秒数, 调用栈文本)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.after_id = None
+        self.stalls = 0
+
+    def start(self):
+        """开始监视（必须在UI线程调用）"""
+        self.main_thread_id = threading.get_ident()
+        self.last_beat = time.perf_counter()
+        self.after_id = self.root.after(int(self.interval * 1000), self._beat)
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        """停止监视"""
+        self.stopped.set()
+        if self.after_id is not None:
+            try:
+                self.root.after_cancel(self.after_id)
+            except tk.TclError:
+                pass
+            self.after_id = None
+
+    def _beat(self):
+        """UI线程心跳：计算本次比预定时间晚了多少"""
+        now = time.perf_counter()
+        late = now - self.last_beat - self.interval
+        with self.lock:
+            self.last_beat = now
+            samples, self.samples = self.samples, []
+        if late >= self.threshold:
+            self._log_stall(late, samples)
+        if not self.stopped.is_set():
+            self.after_id = self.root.after(int(self.interval * 1000), self._beat)
+
+    def _watch(self):
+        """后台线程：心跳停顿时抓取主线程调用栈"""
+        step = min(self.interval, self.threshold) / 2
+        while not self.stopped.wait(step):
+            with self.lock:
+                stalled = time.perf_counter() - self.last_beat - self.interval
+                due = self.threshold * (len(self.samples) + 1)
+                if stalled < due or len(self.samples) >= self.max_samples:
+                    continue
+                frame = sys._current_frames().get(self.main_thread_id)
+                if frame is None:
+                    continue
+                stack = ''.join(traceback.format_stack(frame))
+                del frame
+                self.samples.append((stalled, stack))
+
+    def _log_stall(self, seconds, samples):
+        """把一次卡顿写入诊断日志"""
+        self.stalls += 1
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S')} 界面卡顿 {seconds:.2f} 秒"]
+        if not samples:
+            lines.append("  （未抓到调用栈）")
+        previous = None
+        for stalled, stack in samples:
+            if stack == previous:
+                lines.append(f"--- 卡顿 {stalled:.2f} 秒时：调用栈同上")
+                continue
+            lines.append(f"--- 卡顿 {stalled:.2f} 秒时的主线程调用栈：")
+            lines.append(stack.rstrip())
+            previous = stack
+        text = '\n'.join(lines) + '\n\n'
+        print(f"界面卡顿 {seconds:.2f} 秒，详情见 {self.log_path}", file=sys.stderr)
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > self.max_bytes:
+                os.replace(self.log_path, self.log_path + '.1')
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(text)
+        except OSError as e:
+            print(f"诊断日志写入失败: {e}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------------------
+# 求值进程池：预热的工作进程，带超时和内存上限
+# ---------------------------------------------------------------------------
+
+class EvaluationTimeout(Exception):
+    """求值超过时间上限，工作进程已被终止"""
+
+
+class EvaluationMemoryError(Exception):
+    """求值超过内存上限，工作进程已被终止"""
+
+
+class EvaluationWorkerError(RuntimeError):
+    """工作进程启动失败或在预热时意外退出"""
+
+
+class EvaluationCancelled(Exception):
+    """求值被用户取消"""
+
+
+def _worker_main(conn, memory_limit_mb):
+    """工作进程入口：先导入SymPy并建好命名空间，再循环处理任务"""
+    namespace = get_namespace()
+    if resource is not None and memory_limit_mb:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass  # 上限低于当前占用或平台不支持时不限制
+    conn.send(('ready', os.getpid()))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        expr, output, precision, profile, bindings = task
+        timings = {}
+        scope = dict(namespace, **bindings) if bindings else namespace
+        try:
+            call = lambda: evaluate_detailed(expr, scope, precision, timings)
+            if profile is None:
+                (result, engine), profile_path = call(), None
+            else:
+                (result, engine), profile_path = run_profiled(call, *profile)
+            info = {'timings': timings, 'profile': profile_path}
+            if output is not None:
+                result = format_result(result, output == 'latex')
+                result['engine'] = engine
+                conn.send(('ok', result, info))
+            else:
+                conn.send(('ok', (result, engine), info))
+        except MemoryError:
+            result = None  # 先释放引用再回复
+            conn.send(('memory', None))
+            break  # 内存耗尽后进程状态不可靠，由主进程替换
+        except Exception as e:
+            try:
+                conn.send(('error', e))
+            except Exception:
+                conn.send(('error', RuntimeError(str(e))))
+
+
+class _Worker:
+    """一个工作进程及其管道"""
+
+    def __init__(self, ctx, memory_limit_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child_conn, memory_limit_mb),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout=None):
+        """等待工作进程完成预热"""
+        if not self.ready and self.conn.poll(timeout):
+            try:
+                self.conn.recv()
+            except (EOFError, OSError):
+                raise EvaluationWorkerError("工作进程启动失败")  # 管道已关闭：进程已退出
+            self.ready = True
+        return self.ready
+
+    def kill(self):
+        """立即终止工作进程"""
+        try:
+            self.process.kill()
+            self.process.join(1)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class EvaluationWorkerPool:
+    """预先启动的求值进程池
+
+    每个任务在独立的工作进程中运行，超过时间上限或内存上限的进程会被终止
+    并立即替换为新进程，调用方得到明确的超时/内存不足异常。
+    """
+
+    def __init__(self, size=2, timeout=30.0, memory_limit_mb=1024):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        # spawn方式不会把Tk和后台线程的状态复制到子进程
+        self.ctx = multiprocessing.get_context('spawn')
+        self.idle = queue.Queue()
+        self.closed = False
+        for _ in range(size):
+            self.idle.put(_Worker(self.ctx, memory_limit_mb))
+
+    def _replace(self, worker):
+        """终止一个工作进程并补充新进程"""
+        worker.kill()
+        if not self.closed:
+            self.idle.put(_Worker(self.ctx, self.memory_limit_mb))
+
+    def evaluate(self, expr, timeout=None, cancel_event=None, output=None, precision=None,
+                 report=None, profile=None, bindings=None):
+        """在工作进程中计算预处理后的表达式，返回 (结果, 路径) 或抛出异常
+
+        output为'text'或'latex'时在工作进程中生成文本，返回format_result的字典
+        （含'engine'键）。传入report字典时写入工作进程的分阶段耗时('timings')；
+        profile为 (目录, 阈值秒, 标签) 时在cProfile下求值，超过阈值的分析文件
+        路径写入report['profile']。bindings为额外的名称->值（会话变量）。
+        """
+        if self.closed:
+            raise RuntimeError("求值进程池已关闭")
+        if timeout is None:
+            timeout = self.timeout
+        worker = self.idle.get()
+        healthy = False
+        try:
+            # 预热时间不计入任务时间
+            while not worker.wait_ready(0.1):
+                if not worker.process.is_alive():
+                    raise EvaluationWorkerError("工作进程启动失败")
+                if cancel_event is not None and cancel_event.is_set():
+                    healthy = True
+                    raise EvaluationCancelled("计算已取消")
+            try:
+                worker.conn.send((expr, output, precision, profile, bindings))
+            except OSError:
+                raise EvaluationWorkerError("工作进程意外退出")  # 空闲时被系统终止
+            deadline = time.monotonic() + timeout
+            while not worker.conn.poll(0.05):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise EvaluationCancelled("计算已取消")
+                if time.monotonic() > deadline:
+                    raise EvaluationTimeout(f"计算超时（超过 {timeout:g} 秒）")
+                if not worker.process.is_alive():
+                    # 进程被系统杀死，通常是内存耗尽
+                    raise EvaluationMemoryError(
+                        f"内存不足（超过 {self.memory_limit_mb} MB 上限）")
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                raise EvaluationMemoryError(
+                    f"内存不足（超过 {self.memory_limit_mb} MB 上限）")
+            status, payload = message[:2]
+            if status == 'memory':
+                raise EvaluationMemoryError(
+                    f"内存不足（超过 {self.memory_limit_mb} MB 上限）")
+            healthy = True
+            if status == 'error':
+                raise payload
+            if report is not None and len(message) > 2:
+                report.update(message[2])
+            return payload
+        finally:
+            if healthy and not self.closed:
+                self.idle.put(worker)
+            else:
+                self._replace(worker)
+
+    def wait_ready(self):
+        """阻塞直到所有空闲工作进程完成预热"""
+        workers = []
+        while True:
+            try:
+                workers.append(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            try:
+                worker.wait_ready()
+            except EvaluationWorkerError:
+                self._replace(worker)
+                continue
+            self.idle.put(worker)
+
+    def shutdown(self):
+        """关闭所有工作进程"""
+        self.closed = True
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.kill()
+
+
+# ---------------------------------------------------------------------------
+# 结果缓存
+# ---------------------------------------------------------------------------
+
+def normalize_expression(expr):
+    """缓存键：预处理后的表达式，去掉首尾空白并合并连续空白"""
+    return ' '.join(expr.split())
+
+
+def cache_key(expr, precision=None, context=None):
+    """结果缓存键，不同数值精度、引用的会话变量值不同的结果分开缓存"""
+    key = normalize_expression(expr)
+    if precision is not None:
+        key = f"{key}\0{precision}"
+    if context is not None:
+        key = f"{key}\0{context}"
+    return key
+
+
+def estimate_result_bytes(result):
+    """粗略估计结果占用的内存（按表达式树节点计），避免为此调用str"""
+    load_sympy()
+    try:
+        nodes = 0
+        for node in sp.preorder_traversal(result):
+            nodes += 1
+            if isinstance(node, sp.Integer):
+                nodes += abs(int(node)).bit_length() // 512  # 大整数按位数计
+        return 64 * nodes
+    except Exception:
+        return 64
+
+
+class ResultCache:
+    """线程安全的LRU结果缓存，同时限制条目数和估计字节数"""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # 键 -> (结果, 估计字节数)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        """返回 (是否命中, 结果)"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def __contains__(self, key):
+        """是否已缓存（不影响命中统计和淘汰顺序）"""
+        with self.lock:
+            return key in self.entries
+
+    def store(self, key, result):
+        """写入结果，超出预算时淘汰最久未使用的条目"""
+        if self.max_entries <= 0:
+            return
+        size = estimate_result_bytes(result)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size)
+            self.total_bytes += size
+            while (len(self.entries) > self.max_entries
+                   or self.total_bytes > self.max_bytes):
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+
+    def clear(self):
+        """清空缓存（保留命中统计）"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats_text(self):
+        """状态栏显示的命中统计"""
+        return f"缓存 命中{self.hits}/未命中{self.misses}"
+
+
+class DiskResultCache:
+    """跨会话共享的磁盘结果缓存（按内容寻址）
+
+    键为 sha256(SymPy版本 + 预处理后的表达式)，结果以 srepr 文本保存。
+    写入先落到临时文件再原子替换，多个计算器进程可以同时读写同一目录；
+    总大小超出上限时按最近使用时间淘汰。目录内容会被重新解析为SymPy对象，
+    因此只应使用当前用户私有的目录。
+    """
+
+    def __init__(self, directory, max_mb=256, min_seconds=0.1):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.min_seconds = min_seconds  # 算得比这更快的结果不值得写盘
+        self.version = None  # SymPy版本，首次使用时读取
+        self.stores_since_sweep = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def path_for(self, key):
+        """键对应的文件路径（两级目录避免单目录文件过多）"""
+        if self.version is None:
+            self.version = load_sympy().__version__
+        digest = hashlib.sha256(f"{self.version}\0{key}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:] + '.srepr')
+
+    def load(self, key):
+        """返回 (是否命中, 结果)"""
+        path = self.path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return False, None
+        try:
+            result = sp.sympify(text)
+        except Exception:
+            # 损坏或无法还原的条目直接删除
+            self._remove(path)
+            return False, None
+        try:
+            os.utime(path)  # 记录最近使用时间，供淘汰使用
+        except OSError:
+            pass
+        return True, result
+
+    def store(self, key, result, seconds):
+        """保存结果（原子写入）"""
+        if seconds < self.min_seconds:
+            return
+        try:
+            text = result_srepr(result)
+        except Exception:
+            return
+        path = self.path_for(key)
+        folder = os.path.dirname(path)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.stores_since_sweep += 1
+        if self.stores_since_sweep >= 32:
+            self.sweep()
+
+    def sweep(self):
+        """总大小超出上限时删除最久未使用的条目，降到上限的80%"""
+        self.stores_since_sweep = 0
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # 可能刚被其他进程删除
+                if name.endswith('.tmp') and time.time() - st.st_mtime < 3600:
+                    continue  # 其他进程正在写入
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.8:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# 竞速求解：integrate/solve/limit的多种策略在不同进程中并行，取最先完成的结果
+# ---------------------------------------------------------------------------
+
+def _equation_and_symbol(f, symbols):
+    """solve参数 -> (单个方程表达式, 未知数)；多个方程或未知数时抛出ValueError"""
+    if len(symbols) == 1 and isinstance(symbols[0], (list, tuple)):
+        symbols = tuple(symbols[0])
+    if isinstance(f, (list, tuple)) or len(symbols) > 1:
+        raise ValueError("只处理单个方程和单个未知数")
+    f = sp.sympify(f)
+    if isinstance(f, sp.Equality):
+        f = f.lhs - f.rhs
+    if symbols:
+        return f, symbols[0]
+    if len(f.free_symbols) != 1:
+        raise ValueError("需要指定未知数")
+    return f, next(iter(f.free_symbols))
+
+
+def _integrate_manual(*args, **kwargs):
+    """manualintegrate：模仿手算的规则，默认算法很慢时常能很快完成"""
+    return sp.integrate(*args, manual=True, **kwargs)
+
+
+def _integrate_meijerg(*args, **kwargs):
+    """Meijer G函数方法，擅长含特殊函数的定积分"""
+    return sp.integrate(*args, meijerg=True, **kwargs)
+
+
+def _integrate_numeric(f, *limits, digits=15):
+    """定积分的数值求积（只在选择了数值精度时参与）"""
+    integral = sp.Integral(f, *limits)
+    if not limits or integral.free_symbols:
+        raise ValueError("数值积分只适用于定积分")
+    return integral.evalf(digits)
+
+
+def _solve_solveset(f, *symbols, **kwargs):
+    """solveset：解为有限集时返回与solve相同格式的列表"""
+    if kwargs:
+        raise ValueError("solveset不支持solve的选项")
+    f, symbol = _equation_and_symbol(f, symbols)
+    solutions = sp.solveset(f, symbol)
+    if not isinstance(solutions, sp.FiniteSet):
+        raise ValueError("solveset的解不是有限集")
+    return list(solutions)
+
+
+def _solve_nroots(f, *symbols, digits=15):
+    """多项式方程的数值求根（只在选择了数值精度时参与）"""
+    f, symbol = _equation_and_symbol(f, symbols)
+    if f.free_symbols != {symbol}:
+        raise ValueError("只适用于单变量数值系数多项式")
+    return sp.Poly(f, symbol).nroots(n=digits)
+
+
+def _limit_gruntz(e, z, z0, dir='+'):
+    """直接调用Gruntz算法，跳过limit的启发式预处理"""
+    from sympy.series.gruntz import gruntz
+    return gruntz(sp.sympify(e), z, sp.sympify(z0), dir)
+
+
+# 函数名 -> [(策略名, 替换该函数的实现, 是否为数值近似)]；None为SymPy的默认实现
+RACE_STRATEGIES = {
+    'integrate': [('integrate', None, False), ('manual', _integrate_manual, False),
+                  ('meijerg', _integrate_meijerg, False), ('numeric', _integrate_numeric, True)],
+    'solve': [('solve', None, False), ('solveset', _solve_solveset, False),
+              ('nroots', _solve_nroots, True)],
+    'limit': [('limit', None, False), ('gruntz', _limit_gruntz, False)],
+}
+RACE_POOL_SIZE = max(len(entries) for entries in RACE_STRATEGIES.values())
+
+
+def race_strategies(expr, precision=None):
+    """顶层为integrate/solve/limit调用时返回 [(策略名, 名称覆盖)]，否则返回None
+
+    名称覆盖随会话变量一起传给工作进程，替换命名空间中的同名函数。数值近似
+    策略只在选择了数值精度时参与，精确模式下不会用近似值代替精确结果。
+    """
+    try:
+        tree = parse_expression(expr)
+    except Exception:
+        return None
+    if tree[0] != 'call' or tree[1][0] != 'name' or tree[1][1] not in RACE_STRATEGIES:
+        return None
+    func = tree[1][1]
+    strategies = []
+    for name, impl, numeric in RACE_STRATEGIES[func]:
+        if numeric:
+            if precision is None:
+                continue
+            impl = functools.partial(impl, digits=precision)
+        strategies.append((name, {func: impl} if impl is not None else {}))
+    return strategies
+
+
+def race_complete(value):
+    """结果中没有未求出的积分、极限或条件集时视为完整结果"""
+    if isinstance(value, dict):
+        return all(race_complete(k) and race_complete(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return all(race_complete(item) for item in value)
+    if isinstance(value, sp.Basic):
+        return not value.has(sp.Integral, sp.Limit, sp.ConditionSet)
+    return True
+
+
+def race_summary(race):
+    """状态栏显示的竞速结果"""
+    others = ", ".join(f"{name} {outcome}" for name, outcome in race['outcomes'].items()
+                       if name != race['winner'])
+    if race['winner'] is None:
+        text = "竞速: 没有策略得到完整结果"
+    else:
+        text = f"竞速: {race['winner']} 胜出 ({race['outcomes'][race['winner']]})"
+    return f"{text}；{others}" if others else text
+
+
+# ---------------------------------------------------------------------------
+# 近似层：精确结果较慢时先显示的快速估算
+# ---------------------------------------------------------------------------
+
+ESTIMATE_ORDER = 6  # 不定积分级数近似的阶数
+
+
+def _integrate_estimate(f, *limits, digits=15):
+    """积分的快速近似：定积分数值求积，单变量不定积分对被积函数的低阶级数逐项积分"""
+    integral = sp.Integral(f, *limits)
+    if limits and not integral.free_symbols:
+        return integral.evalf(digits)
+    if len(integral.limits) != 1 or len(integral.limits[0]) != 1:
+        raise ValueError("只估算定积分和单变量不定积分")
+    var = integral.limits[0][0]
+    series = sp.series(f, var, 0, ESTIMATE_ORDER)
+    order = series.getO()
+    result = sp.integrate(series.removeO(), var)
+    return result if order is None else result + sp.O(var * order.expr, var)
+
+
+def _summation_estimate(f, *limits, digits=15):
+    """不含自由变量的求和的数值近似（无穷级数用mpmath外推）"""
+    total = sp.Sum(f, *limits)
+    if total.free_symbols:
+        raise ValueError("只估算不含自由变量的求和")
+    return total.evalf(digits)
+
+
+def _product_estimate(f, *limits, digits=15):
+    """不含自由变量的连乘积的数值近似"""
+    total = sp.Product(f, *limits)
+    if total.free_symbols:
+        raise ValueError("只估算不含自由变量的乘积")
+    return total.evalf(digits)
+
+
+def _limit_estimate(e, z, z0, dir='+', digits=15):
+    """mpmath外推求极限的数值近似
+
+    分别按线性和指数间隔取点外推，两者不一致（多为发散或振荡）时不估算。
+    """
+    import mpmath
+    e, z0 = sp.sympify(e), sp.sympify(z0)
+    if e.free_symbols - {z} or z0.free_symbols or dir not in ('+', '-'):
+        raise ValueError("只估算单变量的单侧极限")
+    f = sp.lambdify(z, e, 'mpmath')
+    with mpmath.workdps(digits + 5):
+        if z0.is_infinite:
+            point = mpmath.inf if z0 == sp.oo else -mpmath.inf
+        else:
+            point = mpmath.mpmathify(str(sp.N(z0, digits + 5)))
+        direction = 1 if dir == '+' else -1
+        value = mpmath.limit(f, point, direction=direction)
+        check = mpmath.limit(f, point, direction=direction, exp=True)
+        tolerance = mpmath.mpf(10) ** (-(digits // 2)) * max(1, abs(value))
+        if not mpmath.isfinite(value) or abs(value - check) > tolerance:
+            raise ValueError("极限可能发散或振荡")
+        return sp.sympify(value)
+
+
+# 函数名 -> 近似实现（与精确实现同样的参数，另加digits）
+ESTIMATE_FUNCTIONS = {
+    'integrate': _integrate_estimate,
+    'summation': _summation_estimate,
+    'product': _product_estimate,
+    'limit': _limit_estimate,
+    'solve': _solve_nroots,
+}
+
+
+def estimate_overrides(expr, digits=15):
+    """表达式中含可快速近似的调用时返回名称覆盖（随会话变量传给工作进程），否则返回None"""
+    try:
+        tree = parse_expression(expr)
+    except Exception:
+        return None
+    names = {node[1][1] for node in iter_tree(tree)
+             if node[0] == 'call' and node[1][0] == 'name'}
+    used = names & ESTIMATE_FUNCTIONS.keys()
+    if not used:
+        return None
+    return {name: functools.partial(ESTIMATE_FUNCTIONS[name], digits=digits) for name in used}
+
+
+# ---------------------------------------------------------------------------
+# 求值引擎：进程池 + 结果缓存，界面和本地服务共用
+# ---------------------------------------------------------------------------
+
+class CalculatorEngine:
+    """不依赖Tk的求值入口
+
+    持有求值进程池、内存结果缓存和可选的磁盘缓存，evaluate_detailed与计算器
+    界面的求值语义完全相同，可被多个线程同时调用。
+    """
+
+    def __init__(self, workers=2, timeout=30.0, memory_limit_mb=1024, cache_size=256,
+                 cache_mb=64, disk_cache_dir=None, disk_cache_mb=256):
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout = timeout
+        self.race_pool = None  # 竞速求解专用的工作进程，首次使用时启动
+        self.race_lock = threading.Lock()
+        self.pool = None
+        if workers > 0:
+            try:
+                self.pool = EvaluationWorkerPool(workers, timeout, memory_limit_mb)
+            except Exception as e:
+                print(f"求值进程池启动失败，改为在线程中计算: {e}")
+        self.result_cache = ResultCache(cache_size, cache_mb * 1024 * 1024)
+        self.disk_cache = None
+        if disk_cache_dir:
+            try:
+                self.disk_cache = DiskResultCache(disk_cache_dir, disk_cache_mb)
+            except OSError as e:
+                print(f"磁盘缓存目录不可用: {e}")
+
+    def evaluate_detailed(self, expr, cancel_event=None, precision=None, report=None,
+                          profile=None, bindings=None, context=None, strategies=None,
+                          route=None, sizes=None):
+        """计算预处理后的表达式，返回 (结果, 来源)，来源为缓存或求值路径
+
+        report字典的'timings'中记录查缓存、求值各阶段和进程调度的耗时；
+        profile见EvaluationWorkerPool.evaluate。bindings为引用的会话变量值，
+        context为其摘要（区分缓存键），由Session.bindings给出。strategies来自
+        race_strategies，给出时多种策略竞速求值（需要工作进程）。
+
+        route为estimate_cost给出的路径（未给出时在此估计）：'isolated'交给可终止的
+        工作进程，'inline'（开销很小且只含简单运算）在调用线程中计算，省去进程间
+        传输；没有工作进程时只能在调用线程中计算（'background'）。实际路径写入
+        report['route']。sizes为Session.sizes给出的会话变量节点数，未给出时按
+        bindings计算。
+        """
+        if report is None:
+            report = {}
+        timings = report.setdefault('timings', {})
+        lookup_start = time.perf_counter()
+        expr = normalize_expression(expr)
+        key = cache_key(expr, precision, context)
+        found, result = self.result_cache.lookup(key)
+        if found:
+            timings['cache'] = time.perf_counter() - lookup_start
+            return result, 'cache'
+        
+        # 其次查磁盘缓存（跨会话共享）
+        if self.disk_cache is not None:
+            found, result = self.disk_cache.load(key)
+            if found:
+                self.result_cache.store(key, result)
+                timings['cache'] = time.perf_counter() - lookup_start
+                return result, 'disk'
+        
+        start = time.perf_counter()
+        timings['cache'] = start - lookup_start
+        if self.pool is None:
+            route = 'background'
+        elif strategies:
+            route = 'isolated'
+        elif route is None:
+            if sizes is None:
+                sizes = binding_sizes(bindings)
+            route = estimate_cost(expr, sizes, precision).route
+            start = time.perf_counter()
+            timings['plan'] = start - lookup_start - timings['cache']
+        report['route'] = route
+        if strategies and self.pool is not None:
+            result, engine = self.race(expr, strategies, cancel_event, precision, report,
+                                       bindings)
+        elif route == 'isolated':
+            info = {}
+            result, engine = self.pool.evaluate(expr, cancel_event=cancel_event,
+                                                precision=precision, report=info,
+                                                profile=profile, bindings=bindings)
+            worker_timings = info.get('timings', {})
+            timings.update(worker_timings)
+            # 等待空闲进程、传输任务和结果的时间
+            timings['ipc'] = max(0.0, time.perf_counter() - start - sum(worker_timings.values()))
+            report['profile'] = info.get('profile')
+        else:
+            namespace = dict(get_namespace(), **bindings) if bindings else None
+            call = lambda: evaluate_detailed(expr, namespace, precision, timings)
+            if profile is None:
+                result, engine = call()
+            else:
+                (result, engine), report['profile'] = run_profiled(call, *profile)
+        self.result_cache.store(key, result)
+        if self.disk_cache is not None:
+            self.disk_cache.store(key, result, time.perf_counter() - start)
+        return result, engine
+
+    def ensure_race_pool(self):
+        """返回竞速进程池，首次调用时启动（可在后台线程中提前调用以预热）"""
+        with self.race_lock:
+            if self.race_pool is None:
+                self.race_pool = EvaluationWorkerPool(RACE_POOL_SIZE, self.timeout,
+                                                      self.memory_limit_mb)
+        return self.race_pool
+
+    def race(self, expr, strategies, cancel_event=None, precision=None, report=None,
+             bindings=None):
+        """各策略在竞速进程池的不同进程中同时计算，返回最先得到的完整结果 (结果, 路径)
+
+        有策略得到完整结果后，其余仍在计算的进程被终止并由进程池补充新进程。
+        都没有完整结果时采用排在最前的成功结果，都失败时抛出第一个策略的异常。
+        胜出策略和各策略的结局写入report['race']。
+        """
+        pool = self.ensure_race_pool()
+        if report is None:
+            report = {}
+        stop = threading.Event()
+        finished = queue.Queue()
+        start = time.perf_counter()
+
+        def run(name, overrides):
+            info = {}
+            try:
+                scope = dict(bindings or {}, **overrides) or None
+                payload = pool.evaluate(expr, cancel_event=stop, precision=precision,
+                                        report=info, bindings=scope)
+                finished.put((name, True, payload, info))
+            except Exception as e:
+                finished.put((name, False, e, info))
+
+        for name, overrides in strategies:
+            threading.Thread(target=run, args=(name, overrides), daemon=True).start()
+
+        outcomes = {name: "已终止" for name, _ in strategies}
+        results = {}
+        winner = None
+        try:
+            while len(results) < len(strategies):
+                try:
+                    name, ok, payload, info = finished.get(timeout=0.05)
+                except queue.Empty:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise EvaluationCancelled("计算已取消")
+                    continue
+                results[name] = (ok, payload, info)
+                if not ok:
+                    outcomes[name] = "出错"
+                elif race_complete(payload[0]):
+                    outcomes[name] = f"{time.perf_counter() - start:.2f} 秒"
+                    winner = name
+                    break
+                else:
+                    outcomes[name] = "未求出"
+        finally:
+            stop.set()  # 终止仍在计算的策略
+
+        if winner is None:
+            # 没有完整结果：按策略顺序取第一个成功的结果，否则报告第一个策略的错误
+            for name, _ in strategies:
+                if results[name][0]:
+                    break
+            else:
+                raise results[strategies[0][0]][1]
+        else:
+            name = winner
+        ok, payload, info = results[name]
+        timings = report.setdefault('timings', {})
+        worker_timings = info.get('timings', {})
+        timings.update(worker_timings)
+        timings['ipc'] = max(0.0, time.perf_counter() - start - sum(worker_timings.values()))
+        report['race'] = {'winner': winner, 'outcomes': outcomes}
+        return payload
+
+    def shutdown(self):
+        """关闭工作进程"""
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.race_pool is not None:
+            self.race_pool.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# 无界面批量计算
+# ---------------------------------------------------------------------------
+
+def _batch_task(pool, line_no, expression, with_latex):
+    """批量模式的单个任务，返回一条JSON记录"""
+    record = {'line': line_no, 'expression': expression}
+    start = time.perf_counter()
+    try:
+        output = 'latex' if with_latex else 'text'
+        record.update(pool.evaluate(preprocess_expression(expression), output=output))
+    except EvaluationTimeout as e:
+        record.update(error=str(e), error_type='timeout')
+    except EvaluationMemoryError as e:
+        record.update(error=str(e), error_type='memory')
+    except Exception as e:
+        record.update(error=str(e), error_type=type(e).__name__)
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def run_batch(source, out, jobs=None, ordered=True, timeout=30.0,
+              memory_limit_mb=1024, with_latex=False, report=sys.stderr):
+    """从source逐行读取表达式，并行计算后以JSON lines写入out，不创建Tk窗口
+
+    空行和以#开头的行会被跳过。ordered为False时按完成顺序输出。
+    返回处理的表达式数量。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    pool = EvaluationWorkerPool(jobs, timeout, memory_limit_mb)
+    pool.wait_ready()  # 启动时间不计入吞吐量
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    window = jobs * 4  # 限制在途任务数，大文件也能流式处理
+    pending = deque()
+    count = 0
+    start = time.perf_counter()
+    last_report = start
+
+    def emit(record):
+        nonlocal count, last_report
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+        now = time.perf_counter()
+        if report is not None and now - last_report >= 5:
+            last_report = now
+            report.write(f"已完成 {count} 条，{count / (now - start):.1f} 条/秒\n")
+            report.flush()
+
+    def drain(limit):
+        # 把在途任务数降到limit以下
+        nonlocal pending
+        while len(pending) > limit:
+            if ordered:
+                emit(pending.popleft().result())
+            else:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(future.result())
+                pending = deque(not_done)
+
+    try:
+        for line_no, line in enumerate(source, 1):
+            expression = line.strip()
+            if not expression or expression.startswith('#'):
+                continue
+            pending.append(executor.submit(_batch_task, pool, line_no,
+                                           expression, with_latex))
+            drain(window - 1)
+        drain(0)
+        out.flush()
+    finally:
+        executor.shutdown(wait=True)
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    if report is not None:
+        rate = count / elapsed if elapsed > 0 else 0.0
+        report.write(f"共 {count} 条表达式，用时 {elapsed:.2f} 秒，"
+                     f"吞吐量 {rate:.1f} 条/秒 ({jobs} 个工作进程)\n")
+        report.flush()
+    return count
+
+
+# ---------------------------------------------------------------------------
+# 本地求值服务（JSON-RPC 2.0 over HTTP/1.1）
+# ---------------------------------------------------------------------------
+
+RPC_PARSE_ERROR = -32700
+RPC_INVALID_REQUEST = -32600
+RPC_METHOD_NOT_FOUND = -32601
+RPC_INVALID_PARAMS = -32602
+RPC_INTERNAL_ERROR = -32603
+RPC_EVALUATION_ERROR = -32000
+MAX_RPC_BODY = 16 * 1024 * 1024  # 请求体上限，字节
+MAX_RPC_PRECISION = 10000        # precision参数的上限，位
+_LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+class RPCError(Exception):
+    """JSON-RPC错误，code为规范中的错误码"""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+class EvaluationService:
+    """JSON-RPC方法的实现，与传输层无关
+
+    evaluate的参数为 {"expression", "precision", "latex", "race"} 或 [expression]，
+    返回结果文本、LaTeX、求值路径和分阶段耗时（毫秒）。批量请求中的各项在
+    线程池中并发计算，共用引擎的工作进程和结果缓存。求值总是交给有时间上限的
+    工作进程，不在服务进程内计算。
+    """
+
+    def __init__(self, engine, concurrency=None):
+        self.engine = engine
+        size = engine.pool.size if engine.pool is not None else 1
+        self.executor = ThreadPoolExecutor(max_workers=concurrency or size * 2)
+        self.methods = {'evaluate': self.evaluate, 'ping': self.ping}
+        self.requests = 0
+        self.lock = threading.Lock()  # requests由多个服务线程更新
+        self.started = time.time()
+
+    def ping(self):
+        return 'pong'
+
+    def evaluate(self, expression=None, precision=None, latex=True, race=False):
+        if not isinstance(expression, str) or not expression.strip():
+            raise RPCError(RPC_INVALID_PARAMS, "expression必须是非空字符串")
+        if precision is not None and (isinstance(precision, bool) or not isinstance(precision, int)
+                                      or not 0 < precision <= MAX_RPC_PRECISION):
+            raise RPCError(RPC_INVALID_PARAMS,
+                           f"precision必须是不超过{MAX_RPC_PRECISION}的正整数")
+        start = time.perf_counter()
+        load_sympy()
+        report = {'timings': {}}
+        timings = report['timings']
+        try:
+            processed = preprocess_expression(expression)
+            strategies = race_strategies(processed, precision) if race else None
+            timings['preprocess'] = time.perf_counter() - start
+            result, source = self.engine.evaluate_detailed(processed, precision=precision,
+                                                           report=report, strategies=strategies,
+                                                           route='isolated')
+        except EvaluationTimeout as e:
+            raise RPCError(RPC_EVALUATION_ERROR, str(e), {'type': 'timeout'})
+        except EvaluationMemoryError as e:
+            raise RPCError(RPC_EVALUATION_ERROR, str(e), {'type': 'memory'})
+        except EvaluationWorkerError as e:
+            raise RPCError(RPC_EVALUATION_ERROR, str(e), {'type': 'worker'})
+        except Exception as e:
+            raise RPCError(RPC_EVALUATION_ERROR, str(e),
+                           {'type': 'error', 'exception': type(e).__name__})
+        try:
+            response = {'result': display_text(result)}
+        except Exception as e:
+            raise RPCError(RPC_EVALUATION_ERROR, f"结果无法转换为文本: {e}",
+                           {'type': 'display', 'exception': type(e).__name__})
+        if latex:
+            latex_start = time.perf_counter()
+            try:
+                response['latex'] = display_latex(result)
+            except Exception:
+                response['latex'] = None
+            timings['latex'] = time.perf_counter() - latex_start
+        response['engine'] = source
+        if 'race' in report:
+            response['race'] = report['race']
+        response['seconds'] = round(time.perf_counter() - start, 6)
+        response['timings_ms'] = {stage: round(seconds * 1000, 3)
+                                  for stage, seconds in timings.items()}
+        return response
+
+    def call(self, request):
+        """处理单个请求对象，返回响应对象；通知（无id）返回None"""
+        if (not isinstance(request, dict) or request.get('jsonrpc') != '2.0'
+                or not isinstance(request.get('method'), str)):
+            return self.error_response(None, RPCError(RPC_INVALID_REQUEST, "无效的请求"))
+        request_id = request.get('id')
+        is_notification = 'id' not in request
+        with self.lock:
+            self.requests += 1
+        try:
+            method = self.methods.get(request['method'])
+            if method is None:
+                raise RPCError(RPC_METHOD_NOT_FOUND, f"未知方法: {request['method']}")
+            params = request.get('params', [])
+            try:
+                if isinstance(params, dict):
+                    result = method(**params)
+                elif isinstance(params, list):
+                    result = method(*params)
+                else:
+                    raise RPCError(RPC_INVALID_PARAMS, "params必须是数组或对象")
+            except TypeError as e:
+                raise RPCError(RPC_INVALID_PARAMS, str(e))
+        except RPCError as e:
+            return None if is_notification else self.error_response(request_id, e)
+        except Exception as e:
+            error = RPCError(RPC_INTERNAL_ERROR, str(e), {'exception': type(e).__name__})
+            return None if is_notification else self.error_response(request_id, error)
+        if is_notification:
+            return None
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    @staticmethod
+    def error_response(request_id, error):
+        body = {'code': error.code, 'message': str(error)}
+        if error.data is not None:
+            body['data'] = error.data
+        return {'jsonrpc': '2.0', 'id': request_id, 'error': body}
+
+    def handle(self, payload):
+        """处理请求体（bytes），返回响应JSON（bytes），全部为通知时返回None"""
+        try:
+            request = json.loads(payload)
+        except ValueError as e:
+            response = self.error_response(None, RPCError(RPC_PARSE_ERROR, f"JSON解析失败: {e}"))
+        else:
+            if isinstance(request, list):
+                if not request:
+                    response = self.error_response(None, RPCError(RPC_INVALID_REQUEST, "空的批量请求"))
+                else:
+                    responses = list(self.executor.map(self.call, request))
+                    response = [item for item in responses if item is not None] or None
+            else:
+                response = self.call(request)
+        if response is None:
+            return None
+        return json.dumps(response, ensure_ascii=False).encode('utf-8')
+
+    def health(self):
+        """GET /health 返回的状态"""
+        cache = self.engine.result_cache
+        return {
+            'status': 'ok',
+            'workers': self.engine.pool.size if self.engine.pool is not None else 0,
+            'requests': self.requests,
+            'uptime': round(time.time() - self.started, 1),
+            'cache': {'entries': len(cache.entries), 'hits': cache.hits, 'misses': cache.misses},
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class _RPCRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1处理器：连接保持打开，一个连接上可以依次发送多个请求"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'SymPyCalculator'
+    disable_nagle_algorithm = True  # 头部和正文分两次写出，避免保持连接时的40ms延迟确认
+
+    def setup(self):
+        if self.server.address_family == getattr(socket, 'AF_UNIX', None):
+            self.disable_nagle_algorithm = False  # Unix套接字没有TCP选项
+        super().setup()
+
+    def do_POST(self):
+        # 只接受JSON请求体和本机页面的跨域请求：网页不能用简单表单POST调用本服务
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self.send_error(415, explain="Content-Type必须是application/json")
+            return
+        origin = self.headers.get('Origin')
+        if origin is not None and not self.local_origin(origin):
+            self.send_error(403, explain="不接受其他站点的请求")
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_error(411, explain="需要Content-Length")
+            return
+        if length > MAX_RPC_BODY:
+            self.send_error(413, explain="请求体过大")
+            return
+        body = self.server.service.handle(self.rfile.read(length))
+        if body is None:
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_json(body)
+
+    @staticmethod
+    def local_origin(origin):
+        """Origin头是否指向本机"""
+        try:
+            return urlsplit(origin).hostname in _LOCAL_HOSTS
+        except ValueError:
+            return False
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/health':
+            self.send_error(404)
+            return
+        self.send_json(json.dumps(self.server.service.health()).encode('utf-8'))
+
+    def send_json(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix套接字的客户端地址为空字符串
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _RPCServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _RPCServer6(_RPCServer):
+    address_family = socket.AF_INET6
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixRPCServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixRPCServer = None
+
+
+def parse_serve_address(address):
+    """'HOST:PORT'、':PORT' 或 'unix:/路径' -> (类型, 地址)"""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"无效的服务地址: {address}")
+    return 'tcp', (host.strip('[]') or '127.0.0.1', int(port))
+
+
+def run_server(address, engine, verbose=False, ready=None):
+    """在address上提供JSON-RPC求值服务，直到被中断；不创建Tk窗口
+
+    ready为threading.Event时在开始监听后置位（测试和嵌入使用）。
+    """
+    kind, target = parse_serve_address(address)
+    if kind == 'unix':
+        if _UnixRPCServer is None:
+            raise ValueError("当前平台不支持Unix套接字")
+        if os.path.exists(target):
+            os.remove(target)  # 上次未正常退出时残留的套接字文件
+        server = _UnixRPCServer(target, _RPCRequestHandler)
+        os.chmod(target, 0o600)
+        where = target
+    else:
+        if target[0] not in ('127.0.0.1', 'localhost', '::1'):
+            print(f"警告: 服务监听在非本机地址 {target[0]}，没有任何访问控制",
+                  file=sys.stderr)
+        server_class = _RPCServer6 if ':' in target[0] else _RPCServer
+        server = server_class(target, _RPCRequestHandler)
+        where = f"http://{target[0]}:{server.server_address[1]}/"
+    service = EvaluationService(engine)
+    server.service = service
+    server.verbose = verbose
+    if engine.pool is not None:
+        load_sympy()  # 主进程需要SymPy还原工作进程返回的结果
+        engine.pool.wait_ready()
+    print(f"求值服务已启动: {where}", file=sys.stderr)
+    if ready is not None:
+        ready.server = server
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if kind == 'unix':
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+
+
+class LatexRenderCache:
+    """LaTeX渲染缓存
+
+    按(LaTeX字符串, 字号, 底色)缓存PNG栅格图和对应的Tk PhotoImage。
+    栅格化只用离屏Agg图形，可以在后台线程中预先完成；再次显示同一结果时
+    直接复用PhotoImage，不再排版或重绘。
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.png_cache = OrderedDict()    # 键 -> PNG字节（后台线程可写）
+        self.photo_cache = OrderedDict()  # 键 -> PhotoImage（仅UI线程）
+        self.lock = threading.Lock()
+        self.figure = None  # 离屏图形，首次渲染时创建
+        self.hits = 0
+        self.misses = 0
+
+    def rasterize(self, latex, fontsize=16, facecolor='lightblue'):
+        """返回公式的PNG字节；mathtext无法解析时抛出异常"""
+        key = (latex, fontsize, facecolor)
+        with self.lock:
+            png = self.png_cache.get(key)
+            if png is not None:
+                self.png_cache.move_to_end(key)
+                return png
+            if self.figure is None:
+                Figure, FigureCanvasAgg = load_matplotlib()
+                self.figure = Figure(figsize=(7, 1), dpi=100, facecolor='white')
+                FigureCanvasAgg(self.figure)
+            self.figure.clear()
+            self.figure.text(0.02, 0.5, latex, fontsize=fontsize,
+                             verticalalignment='center',
+                             bbox=dict(boxstyle="round,pad=0.3", facecolor=facecolor))
+            buf = io.BytesIO()
+            try:
+                self.figure.savefig(buf, format='png', dpi=100, facecolor='white',
+                                    bbox_inches='tight', pad_inches=0.05)
+            finally:
+                self.figure.clear()
+            png = buf.getvalue()
+            self.png_cache[key] = png
+            if len(self.png_cache) > self.max_entries:
+                self.png_cache.popitem(last=False)
+            return png
+
+    def photo(self, latex, fontsize=16, facecolor='lightblue', master=None):
+        """返回可直接显示的PhotoImage（必须在UI线程调用）"""
+        key = (latex, fontsize, facecolor)
+        photo = self.photo_cache.get(key)
+        if photo is not None:
+            self.photo_cache.move_to_end(key)
+            self.hits += 1
+            return photo
+        self.misses += 1
+        png = self.rasterize(latex, fontsize, facecolor)
+        photo = tk.PhotoImage(master=master, data=base64.b64encode(png).decode('ascii'))
+        self.photo_cache[key] = photo
+        if len(self.photo_cache) > self.max_entries:
+            self.photo_cache.popitem(last=False)
+        return photo
+
+
+# ---------------------------------------------------------------------------
+# 绘图与表格：NumPy向量化函数、自适应采样和按像素抽稀
+# ---------------------------------------------------------------------------
+
+def compile_function(expr, var):
+    """把单变量表达式编译为NumPy向量化函数（编译结果由compile_numeric缓存）
+
+    返回的函数接受一维数组，返回同形状的浮点数组；无定义或为复数的点为NaN。
+    """
+    np = load_numpy()
+    raw = compile_numeric(expr, (var,), 'numpy')
+
+    def func(xs):
+        xs = np.asarray(xs, dtype=float)
+        with np.errstate(all='ignore'):
+            ys = np.asarray(raw(xs))
+            if ys.shape != xs.shape:
+                ys = np.broadcast_to(ys, xs.shape)  # 常数表达式
+            if np.iscomplexobj(ys):
+                ys = np.where(np.abs(ys.imag) <= 1e-12 * (1 + np.abs(ys.real)), ys.real, np.nan)
+            ys = ys.astype(float)
+            ys[~np.isfinite(ys)] = np.nan
+        return ys
+
+    return func
+
+
+def adaptive_sample(func, a, b, initial=401, max_points=200000, tol=2e-3, max_rounds=14):
+    """在[a, b]上自适应采样：在曲率大、定义域边界和疑似间断处加密
+
+    每一轮只对需要加密的区间求一次中点（一次向量化调用）。
+    采样结束后仍有大跳变的区间视为间断，插入NaN断开曲线。返回 (xs, ys)。
+    """
+    np = load_numpy()
+    xs = np.linspace(a, b, initial)
+    ys = func(xs)
+    min_width = (b - a) * 1e-9
+    for _ in range(max_rounds):
+        if len(xs) >= max_points:
+            break
+        finite = ys[np.isfinite(ys)]
+        if len(finite) < 2:
+            break
+        lo, hi = np.percentile(finite, [2, 98])
+        scale = (hi - lo) or 1.0
+        dy = np.diff(ys)
+        width = np.diff(xs)
+        flag = np.zeros(len(xs) - 1, dtype=bool)
+        # 曲率：二阶差分相对纵向尺度过大
+        second = np.abs(ys[:-2] - 2 * ys[1:-1] + ys[2:]) / scale
+        bend = np.nan_to_num(second, nan=0.0) > tol
+        flag[:-1] |= bend
+        flag[1:] |= bend
+        # 定义域边界：一端有定义一端无定义
+        flag |= np.isnan(ys[:-1]) != np.isnan(ys[1:])
+        # 疑似间断：相邻点跳变过大
+        flag |= np.nan_to_num(np.abs(dy) / scale, nan=0.0) > 0.05
+        flag &= width > min_width
+        candidates = np.flatnonzero(flag)
+        if len(candidates) == 0:
+            break
+        candidates = candidates[:max_points - len(xs)]
+        mid = (xs[candidates] + xs[candidates + 1]) / 2
+        xs = np.insert(xs, candidates + 1, mid)
+        ys = np.insert(ys, candidates + 1, func(mid))
+    # 加密后仍然很陡的极窄区间视为间断点
+    finite = ys[np.isfinite(ys)]
+    if len(finite) >= 2:
+        lo, hi = np.percentile(finite, [2, 98])
+        scale = (hi - lo) or 1.0
+        jumps = np.flatnonzero((np.nan_to_num(np.abs(np.diff(ys)) / scale, nan=0.0) > 0.05)
+                               & (np.diff(xs) < (b - a) * 1e-5))
+        if len(jumps):
+            mid = (xs[jumps] + xs[jumps + 1]) / 2
+            xs = np.insert(xs, jumps + 1, mid)
+            ys = np.insert(ys, jumps + 1, np.nan)
+    return xs, ys
+
+
+def decimate(xs, ys, x0, x1, width):
+    """按像素列抽稀：每列保留首、末、最小、最大四个点（M4），保持曲线形状
+
+    只处理[x0, x1]内的点；点数不多时原样返回。NaN会被保留以断开曲线。
+    """
+    np = load_numpy()
+    i0 = max(int(np.searchsorted(xs, x0)) - 1, 0)
+    i1 = min(int(np.searchsorted(xs, x1)) + 1, len(xs))
+    xv, yv = xs[i0:i1], ys[i0:i1]
+    width = max(int(width), 1)
+    if len(xv) <= 4 * width or xv[-1] <= xv[0]:
+        return xv, yv
+    bins = ((xv - xv[0]) / (xv[-1] - xv[0]) * (width - 1)).astype(int)
+    # NaN处开始新的分组，使断点落在组首，曲线在该处断开
+    segment = np.cumsum(np.isnan(yv))
+    starts = np.flatnonzero(np.r_[True, (bins[1:] != bins[:-1]) | (segment[1:] != segment[:-1])])
+    ends = np.r_[starts[1:], len(xv)] - 1
+    with np.errstate(all='ignore'):
+        y_min = np.fmin.reduceat(yv, starts)
+        y_max = np.fmax.reduceat(yv, starts)
+    x_mid = (xv[starts] + xv[ends]) / 2
+    out_x = np.column_stack([xv[starts], x_mid, x_mid, xv[ends]]).ravel()
+    out_y = np.column_stack([yv[starts], y_min, y_max, yv[ends]]).ravel()
+    return out_x, out_y
+
+
+def plot_variable(expr):
+    """单变量结果的自变量（只能是x或t）；其他情况返回None"""
+    free = getattr(expr, 'free_symbols', None)
+    if free is not None and not free and getattr(expr, 'is_number', False):
+        return sp.Symbol('x')  # 常数函数
+    if free and len(free) == 1:
+        var = next(iter(free))
+        if var.name in ('x', 't'):
+            return var
+    return None
+
+
+def export_table(expr, var, start, stop, step, path):
+    """把 f(var) 在[start, stop]上按步长step导出为CSV（向量化计算，不逐点subs）"""
+    np = load_numpy()
+    if step <= 0:
+        raise ValueError("步长必须为正数")
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    if count <= 0:
+        raise ValueError("范围为空")
+    xs = start + step * np.arange(count)
+    ys = compile_function(expr, var)(xs)
+    ys = np.broadcast_to(ys, xs.shape)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)  # 表达式中可能有逗号（如Max(x, 1)），由csv模块加引号
+        writer.writerow([str(var), result_text(expr)])
+        writer.writerows((f"{x:.15g}", f"{y:.15g}") for x, y in zip(xs.tolist(), ys.tolist()))
+    return count
+
+
+class PlotPanel:
+    """右侧的绘图/表格面板
+
+    图形在首次打开面板时才创建；绘图数据保留全部采样点，缩放或平移时
+    按当前可见范围重新抽稀，放大到采样精度以下时在可见范围内补充采样。
+    """
+
+    def __init__(self, parent, app):
+        self.app = app
+        self.frame = tk.Frame(parent)
+        self.expr = None
+        self.var = None
+        self.xs = self.ys = None
+        self.line = None
+        self.canvas = None
+        self.updating = False
+
+        controls = tk.Frame(self.frame)
+        controls.pack(fill=tk.X)
+        self.x_min = tk.StringVar(value="-10")
+        self.x_max = tk.StringVar(value="10")
+        self.step = tk.StringVar(value="0.1")
+        tk.Label(controls, text="范围").pack(side=tk.LEFT)
+        tk.Entry(controls, textvariable=self.x_min, width=6).pack(side=tk.LEFT)
+        tk.Label(controls, text="到").pack(side=tk.LEFT)
+        tk.Entry(controls, textvariable=self.x_max, width=6).pack(side=tk.LEFT)
+        tk.Label(controls, text="步长").pack(side=tk.LEFT, padx=(5, 0))
+        tk.Entry(controls, textvariable=self.step, width=5).pack(side=tk.LEFT)
+        tk.Button(controls, text="绘制结果", command=self.plot_current).pack(side=tk.LEFT, padx=(5, 0))
+        tk.Button(controls, text="导出表格", command=self.export_current).pack(side=tk.LEFT, padx=(5, 0))
+
+        self.canvas_frame = tk.Frame(self.frame)
+        self.canvas_frame.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+
+    def ensure_canvas(self):
+        """首次使用时创建matplotlib画布和工具栏"""
+        if self.canvas is not None:
+            return
+        Figure, _ = load_matplotlib()
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        self.figure = Figure(figsize=(4, 3), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, self.canvas_frame)
+        toolbar = NavigationToolbar2Tk(self.canvas, self.canvas_frame, pack_toolbar=False)
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    def current_function(self):
+        """取当前结果及其自变量，不适合绘图时提示并返回None"""
+        expr = self.app.last_result
+        if expr is None:
+            messagebox.showinfo("绘图", "请先计算一个结果")
+            return None
+        var = plot_variable(expr)
+        if var is None:
+            messagebox.showinfo("绘图", "只能绘制以x或t为自变量的单变量结果")
+            return None
+        return expr, var
+
+    def read_range(self):
+        a, b = float(self.x_min.get()), float(self.x_max.get())
+        if not a < b:
+            raise ValueError("范围起点必须小于终点")
+        return a, b
+
+    def plot_current(self):
+        """绘制当前结果"""
+        current = self.current_function()
+        if current is None:
+            return
+        try:
+            a, b = self.read_range()
+            self.ensure_canvas()
+            start = time.perf_counter()
+            self.expr, self.var = current
+            func = compile_function(self.expr, self.var)
+            self.xs, self.ys = adaptive_sample(func, a, b)
+            self.ax.clear()  # 会重置坐标轴的回调，需要重新连接
+            self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+            self.ax.grid(True, alpha=0.3)
+            self.ax.set_xlabel(str(self.var))
+            self.line, = self.ax.plot([], [], linewidth=1.2)
+            self.ax.set_xlim(a, b)  # 触发on_xlim_changed完成抽稀
+            self.autoscale_y()
+            self.canvas.draw_idle()
+            self.app.status_var.set(f"绘图完成：{len(self.xs)} 个采样点，"
+                                    f"用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            messagebox.showerror("绘图错误", str(e))
+
+    def autoscale_y(self):
+        np = load_numpy()
+        finite = self.ys[np.isfinite(self.ys)]
+        if len(finite):
+            lo, hi = np.percentile(finite, [1, 99])
+            pad = (hi - lo) * 0.05 or 1.0
+            self.ax.set_ylim(lo - pad, hi + pad)
+
+    def on_xlim_changed(self, ax):
+        """缩放/平移后按可见范围重新抽稀（必要时补充采样）"""
+        if self.updating or self.xs is None or self.line is None:
+            return
+        self.updating = True
+        try:
+            np = load_numpy()
+            x0, x1 = ax.get_xlim()
+            width = max(self.canvas.get_tk_widget().winfo_width(), 200)
+            visible = np.searchsorted(self.xs, x1) - np.searchsorted(self.xs, x0)
+            if visible < width and len(self.xs) < 2000000:
+                # 放大到采样精度以下：在可见范围内补充采样后合并
+                func = compile_function(self.expr, self.var)
+                more_x, more_y = adaptive_sample(func, x0, x1, initial=2 * width)
+                xs = np.concatenate([self.xs, more_x])
+                ys = np.concatenate([self.ys, more_y])
+                order = np.argsort(xs, kind='stable')
+                self.xs, self.ys = xs[order], ys[order]
+            dx, dy = decimate(self.xs, self.ys, x0, x1, width)
+            self.line.set_data(dx, dy)
+            self.canvas.draw_idle()
+        finally:
+            self.updating = False
+
+    def export_current(self):
+        """导出当前结果在指定范围上的函数值表"""
+        current = self.current_function()
+        if current is None:
+            return
+        try:
+            a, b = self.read_range()
+            step = float(self.step.get())
+        except ValueError as e:
+            messagebox.showerror("导出错误", str(e))
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.csv',
+                                            filetypes=[("CSV", "*.csv")],
+                                            title="导出函数值表")
+        if not path:
+            return
+        try:
+            start = time.perf_counter()
+            count = export_table(current[0], current[1], a, b, step, path)
+            self.app.status_var.set(f"已导出 {count} 行到 {os.path.basename(path)}，"
+                                    f"用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception as e:
+            messagebox.showerror("导出错误", str(e))
+
+
+# ---------------------------------------------------------------------------
+# 历史记录：SQLite存储（批量写入、全文索引）和虚拟化列表
+# ---------------------------------------------------------------------------
+
+DEFAULT_HISTORY_PATH = os.path.join(APP_DIR, 'history.db')
+
+
+class HistoryStore:
+    """持久化的历史记录
+
+    新记录先放在内存中，攒够一批、由界面定时调用flush()或关闭时一次事务写入；
+    查询时把内存中的记录合并到结果里，不触发写入。
+    FTS5可用时对表达式和结果建立全文索引（优先trigram分词，支持子串搜索），
+    否则退回LIKE查询。数据库无法打开时使用内存数据库。
+    """
+
+    BATCH_SIZE = 50
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        try:
+            if path != ':memory:':
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error) as e:
+            print(f"历史记录数据库不可用，仅保存在内存中: {e}")
+            self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("CREATE TABLE IF NOT EXISTS history ("
+                          "id INTEGER PRIMARY KEY, created REAL, "
+                          "expression TEXT NOT NULL, result TEXT NOT NULL)")
+        self.tokenizer = self._create_index()
+        self.conn.commit()
+        self.pending = []
+        self.count_cache = {}  # 查询 -> 数据库中的记录数，写入或清除后失效
+
+    def _create_index(self):
+        """创建全文索引，返回使用的分词器（不支持FTS5时返回None）"""
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+        if row is not None:
+            return 'trigram' if 'trigram' in row[0] else 'unicode61'
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE history_fts USING fts5("
+                    "expression, result, content='history', content_rowid='id', "
+                    f"tokenize='{tokenizer}')")
+                self.conn.execute("INSERT INTO history_fts(history_fts) VALUES('rebuild')")
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        return None
+
+    def add(self, expression, result):
+        """记录一次计算（批量写入）"""
+        self.pending.append((time.time(), expression, result))
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """把待写入的记录在一个事务中写入数据库"""
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        self.count_cache.clear()
+        with self.conn:
+            for row in rows:
+                cursor = self.conn.execute(
+                    "INSERT INTO history (created, expression, result) VALUES (?, ?, ?)", row)
+                if self.tokenizer:
+                    self.conn.execute(
+                        "INSERT INTO history_fts (rowid, expression, result) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, row[1], row[2]))
+
+    def _where(self, query):
+        """返回 (FROM/WHERE子句, 参数)"""
+        query = query.strip()
+        if not query:
+            return "FROM history", ()
+        if self.tokenizer == 'trigram' and len(query) >= 3:
+            match = '"' + query.replace('"', '""') + '"'
+        elif self.tokenizer == 'unicode61' and re.fullmatch(r'[\w\s]+', query):
+            match = ' '.join('"' + word + '"' for word in query.split())
+        else:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            return ("FROM history WHERE expression LIKE ? ESCAPE '\\' OR result LIKE ? ESCAPE '\\'",
+                    (pattern, pattern))
+        return ("FROM history WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)",
+                (match,))
+
+    def _pending_matches(self, query):
+        """匹配查询的待写入记录，最新的在前，id为None
+
+        按子串匹配（unicode61分词时要求每个词都出现），与数据库查询基本一致。
+        """
+        words = query.lower().split() if self.tokenizer == 'unicode61' else [query.strip().lower()]
+        return [(None, expression, result) for _, expression, result in reversed(self.pending)
+                if all(word in expression.lower() or word in result.lower() for word in words)]
+
+    def count(self, query=''):
+        """匹配的记录数"""
+        if query not in self.count_cache:
+            clause, params = self._where(query)
+            self.count_cache[query] = self.conn.execute(f"SELECT COUNT(*) {clause}", params).fetchone()[0]
+        return self.count_cache[query] + (len(self._pending_matches(query)) if self.pending else 0)
+
+    def fetch(self, offset, limit, query=''):
+        """按时间倒序返回 [(id, 表达式, 结果)]，offset为0表示最新一条"""
+        pending = self._pending_matches(query) if self.pending else []
+        rows = pending[offset:offset + limit]
+        if len(rows) < limit:
+            clause, params = self._where(query)
+            rows += self.conn.execute(
+                f"SELECT id, expression, result {clause} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + (limit - len(rows), max(0, offset - len(pending)))).fetchall()
+        return rows
+
+    def clear(self):
+        """删除全部历史记录"""
+        self.pending.clear()
+        self.count_cache.clear()
+        with self.conn:
+            self.conn.execute("DELETE FROM history")
+            if self.tokenizer:
+                self.conn.execute("INSERT INTO history_fts(history_fts) VALUES('delete-all')")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class HistoryView:
+    """虚拟化的历史记录列表
+
+    列表框只放当前可见的几行，滚动条的位置按总记录数换算；
+    滚动或搜索时按需从HistoryStore读取对应的一页。
+    """
+
+    def __init__(self, parent, store, on_select):
+        self.store = store
+        self.on_select = on_select
+        self.offset = 0
+        self.visible_rows = 20
+        self.rows = []
+        self.search_after_id = None
+
+        self.frame = tk.Frame(parent)
+        search_frame = tk.Frame(self.frame)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(search_frame, text="搜索").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        search_entry.bind('<KeyRelease>', self.on_search_changed)
+
+        body = tk.Frame(self.frame)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(body, activestyle='none', width=50)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<Double-Button-1>', self.on_double_click)
+        self.listbox.bind('<Return>', self.on_double_click)
+        self.listbox.bind('<MouseWheel>', self.on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self.move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self.move_selection(1))
+
+    @property
+    def query(self):
+        return self.search_var.get()
+
+    def refresh(self):
+        """读取当前窗口内的记录并更新列表和滚动条"""
+        total = self.store.count(self.query)
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        self.rows = self.store.fetch(self.offset, self.visible_rows, self.query)
+        self.listbox.delete(0, tk.END)
+        for _, expression, result in self.rows:
+            line = f"{expression} = {result}"
+            if len(line) > 300:
+                line = line[:300] + " …"  # 只截断显示，完整结果保存在数据库中
+            self.listbox.insert(tk.END, line)
+        if total:
+            self.scrollbar.set(self.offset / total,
+                               min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_resize(self, event):
+        line_height = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace') + 1
+        rows = max(1, event.height // line_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.refresh()
+
+    def scroll_by(self, rows):
+        self.offset += rows
+        self.refresh()
+        return "break"
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self.offset = int(float(value) * self.store.count(self.query))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.offset += int(value) * step
+        self.refresh()
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def move_selection(self, step):
+        """键盘上下移动选中行，到边缘时滚动"""
+        selection = self.listbox.curselection()
+        index = (selection[0] if selection else -1) + step
+        if index < 0 or index >= len(self.rows):
+            self.scroll_by(step)
+            index = max(0, min(index, len(self.rows) - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        return "break"
+
+    def on_double_click(self, event=None):
+        selection = self.listbox.curselection()
+        if selection and selection[0] < len(self.rows):
+            self.on_select(self.rows[selection[0]][1])
+
+    def on_search_changed(self, event=None):
+        # 去抖：停止输入一段时间后再查询
+        if self.search_after_id is not None:
+            self.frame.after_cancel(self.search_after_id)
+        self.search_after_id = self.frame.after(200, self.run_search)
+
+    def run_search(self):
+        self.search_after_id = None
+        self.offset = 0
+        self.refresh()
+
+
+class ResultViewer:
+    """大结果的查看窗口
+
+    先显示摘要；文本或LaTeX在后台线程中按页生成，滚动到接近末尾时才生成下一页。
+    显示时按固定字符数折行（Tk的文本框不适合极长的单行），导出的文件不含折行。
+    """
+
+    LINE_CHARS = 120
+
+    def __init__(self, root, expression, large):
+        self.large = large
+        self.messages = queue.Queue()
+        self.generation = 0
+        self.loading = False
+        self.pages = 0
+        self.column = 0
+        self.export_cancel = None
+        self.polling = False
+        self.closed = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"完整结果 - {expression[:60]}")
+        self.window.geometry("800x500")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        top = tk.Frame(self.window)
+        top.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(top, text=large.summary(), anchor=tk.W, justify=tk.LEFT,
+                 wraplength=780).pack(fill=tk.X)
+        controls = tk.Frame(top)
+        controls.pack(fill=tk.X, pady=(5, 0))
+        self.mode = tk.StringVar(value='text')
+        tk.Radiobutton(controls, text="文本", variable=self.mode, value='text',
+                       command=self.reset).pack(side=tk.LEFT)
+        tk.Radiobutton(controls, text="LaTeX", variable=self.mode, value='latex',
+                       command=self.reset).pack(side=tk.LEFT)
+        self.export_btn = tk.Button(controls, text="导出到文件", command=self.export)
+        self.export_btn.pack(side=tk.LEFT, padx=(10, 0))
+        self.status_var = tk.StringVar()
+        tk.Label(controls, textvariable=self.status_var, fg="gray").pack(side=tk.LEFT, padx=(10, 0))
+
+        body = tk.Frame(self.window)
+        body.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text = tk.Text(body, wrap=tk.NONE, font=("Courier", 10),
+                            yscrollcommand=self.on_scroll)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.config(command=self.text.yview)
+        self.reset()
+
+    def reset(self):
+        """切换文本/LaTeX时从第一页重新生成"""
+        self.generation += 1
+        self.pager = ResultPager(self.large, self.mode.get() == 'latex')
+        self.loading = False
+        self.pages = 0
+        self.column = 0
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.config(state=tk.DISABLED)
+        self.load_more()
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9:
+            self.load_more()
+
+    def load_more(self):
+        """后台生成下一页（同一时间只生成一页）"""
+        if self.loading or self.pager.exhausted and not self.pager.buffer:
+            return
+        self.loading = True
+        self.status_var.set(f"正在生成第 {self.pages + 1} 页...")
+        threading.Thread(target=self.fetch, args=(self.generation, self.pager),
+                         daemon=True).start()
+        self.ensure_polling()
+
+    def fetch(self, generation, pager):
+        try:
+            self.messages.put((generation, 'page', pager.next_page()))
+        except Exception as e:
+            self.messages.put((generation, 'error', e))
+
+    def ensure_polling(self):
+        if not self.polling:
+            self.polling = True
+            self.window.after(50, self.poll)
+
+    def poll(self):
+        """取出后台线程的消息；还在生成或导出时继续轮询"""
+        if self.closed:
+            return
+        while True:
+            try:
+                generation, kind, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'page' and generation == self.generation:
+                self.loading = False
+                self.append_page(payload)
+            elif kind == 'error' and generation == self.generation:
+                self.loading = False
+                self.status_var.set(f"生成出错: {payload}")
+            elif kind == 'progress':
+                self.status_var.set(f"正在导出... 已写入 {payload:,} 字符")
+            elif kind == 'exported':
+                self.export_done(*payload)
+        if self.loading or self.export_cancel is not None:
+            self.window.after(50, self.poll)
+        else:
+            self.polling = False
+
+    def append_page(self, page):
+        if page is None:
+            self.status_var.set(f"已全部显示（{self.pages} 页）")
+            return
+        # 按LINE_CHARS折行，页与页之间接续上一行
+        lines = []
+        start = 0
+        while start < len(page):
+            end = start + self.LINE_CHARS - self.column
+            lines.append(page[start:end])
+            self.column = (self.column + len(page[start:end])) % self.LINE_CHARS
+            start = end
+            if self.column == 0 and start < len(page):
+                lines.append('\n')
+        if self.column == 0:
+            lines.append('\n')
+        self.text.config(state=tk.NORMAL)
+        self.text.insert(tk.END, ''.join(lines))
+        self.text.config(state=tk.DISABLED)
+        self.pages += 1
+        if self.pager.exhausted and not self.pager.buffer:
+            self.status_var.set(f"已全部显示（{self.pages} 页）")
+        else:
+            self.status_var.set(f"已显示 {self.pages} 页，滚动到末尾时继续生成")
+
+    def export(self):
+        """后台把完整的文本或LaTeX流式写入文件"""
+        latex = self.mode.get() == 'latex'
+        extension = '.tex' if latex else '.txt'
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=extension,
+                                            filetypes=[("LaTeX" if latex else "文本", f"*{extension}")],
+                                            title="导出完整结果")
+        if not path:
+            return
+        self.export_cancel = threading.Event()
+        self.export_btn.config(state=tk.DISABLED)
+        self.status_var.set("正在导出...")
+        threading.Thread(target=self.export_job, args=(path, latex, self.export_cancel),
+                         daemon=True).start()
+        self.ensure_polling()
+
+    def export_job(self, path, latex, cancel_event):
+        start = time.perf_counter()
+        progress = lambda written: self.messages.put((None, 'progress', written))
+        try:
+            written = self.large.export(path, latex, cancel_event, progress)
+            self.messages.put((None, 'exported', (path, written, time.perf_counter() - start, None)))
+        except Exception as e:
+            self.messages.put((None, 'exported', (path, 0, 0.0, e)))
+
+    def export_done(self, path, written, seconds, error):
+        self.export_cancel = None
+        self.export_btn.config(state=tk.NORMAL)
+        if isinstance(error, EvaluationCancelled):
+            self.status_var.set("导出已取消")
+        elif error is not None:
+            self.status_var.set("导出出错")
+            messagebox.showerror("导出错误", str(error), parent=self.window)
+        else:
+            self.status_var.set(f"已导出 {written:,} 字符到 {os.path.basename(path)}，"
+                                f"用时 {seconds * 1000:.0f} ms")
+
+    def close(self):
+        """关闭窗口时中止导出（已在生成的一页会被丢弃）"""
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+        self.closed = True
+        self.window.destroy()
 
 
 class SymPyCalculator:
-    def __init__(self, root):
+    def __init__(self, root, workers=2, timeout=30.0, memory_limit_mb=1024,
+                 cache_size=256, cache_mb=64, disk_cache_dir=None, disk_cache_mb=256,
+                 profile=None, history_path=DEFAULT_HISTORY_PATH,
+                 profile_dir=DEFAULT_PROFILE_DIR, profile_threshold=1.0,
+                 metrics_log=DEFAULT_METRICS_LOG, watchdog_threshold=None,
+                 diagnostics_log=DEFAULT_DIAGNOSTICS_LOG):
         self.root = root
+        self.profile = profile
         self.root.title("科学计算器")
         self.root.geometry("600x800")
 
@@ -23,22 +4361,102 @@ class SymPyCalculator:
         # 设置窗口最小安全尺寸
         self.root.minsize(400, 800)
         
-        # 创建符号变量
-        self.x, self.y, self.z = symbols('x y z')
-        self.t = symbols('t')
+        # SymPy在后台导入，用户输入时窗口已经可用
+        threading.Thread(target=self.preload_sympy, daemon=True).start()
+        
+        # 最近一次结果（供绘图/表格使用）；过大的结果另存LargeResult供查看器使用
+        self.last_result = None
+        self.large_result = None
         
-        # 历史记录
-        self.history = []
+        # 会话变量（name = 表达式），只在本次运行中保留
+        self.session = Session()
+        
+        # 历史记录（持久化），上下键浏览时记录距最新一条的位置
+        self.history_store = HistoryStore(history_path)
+        self.history_index = None
+        self.history_flush_id = None
+        
+        # 已渲染公式的缓存
+        self.render_cache = LatexRenderCache()
         
         # LaTeX显示设置
         self.latex_enabled = tk.BooleanVar(value=True)
         
+        # 数值精度设置
+        self.precision_var = tk.StringVar(value=PRECISION_CHOICES[0][0])
+        
+        # 后台计算：工作线程通过队列把结果交回，由root.after在UI线程中轮询
+        self.result_queue = queue.Queue()
+        self.job_id = 0          # 当前有效任务编号，编号不符的结果直接丢弃
+        self.running = False
+        self.poll_after_id = None
+        self.poll_interval = 50  # 毫秒
+        self.record_job = True   # 当前任务完成后是否写入历史
+        self.cancel_event = threading.Event()
+        
+        # 实时预览：输入停顿后用较短的时间预算试算，新的输入会取代未完成的预览
+        self.preview_enabled = tk.BooleanVar(value=True)
+        self.preview_id = 0          # 当前有效预览编号
+        self.preview_after_id = None
+        self.preview_cancel = threading.Event()  # 只在关闭窗口时设置
+        self.preview_thread = None
+        self.preview_active = False   # 预览任务已启动且尚未发回preview-idle
+        self.preview_pending = False  # 上一次预览未结束时推迟的新预览
+        self.preview_shown = False   # 显示标签中是否为预览内容
+        self.preview_delay = 300     # 毫秒
+        self.preview_timeout = 0.5   # 秒
+        self.preview_pool = None     # 预览和近似层的工作进程，首次使用时启动
+        # 近似层：精确结果超过estimate_delay毫秒仍未完成时，在预览进程中先算近似值
+        self.estimate_after_id = None
+        self.estimate_cancel = threading.Event()
+        self.estimate_shown = None   # 当前显示的近似结果文本
+        self.estimate_delay = 150    # 毫秒
+        self.estimate_timeout = 2.0  # 秒
+        # 竞速求解：integrate/solve/limit同时尝试多种策略，取最先完成的结果
+        self.race_enabled = tk.BooleanVar(value=False)
+        self.shown_expression = None  # 当前显示结果对应的输入
+        self.memory_limit_mb = memory_limit_mb
+        
+        # 性能记录：分阶段计时、慢计算的cProfile（开关）和会话内耗时统计
+        self.cprofile_enabled = tk.BooleanVar(value=False)
+        self.cprofile_dir = profile_dir
+        self.cprofile_threshold = profile_threshold
+        self.metrics = MetricsLog(metrics_log)
+        self.job_started = None
+        
+        # 求值进程池（超时或超内存的任务会被终止，窗口不受影响）和结果缓存
+        start = time.perf_counter()
+        self.engine = CalculatorEngine(workers, timeout, memory_limit_mb, cache_size,
+                                       cache_mb, disk_cache_dir, disk_cache_mb)
+        if self.profile and workers > 0:
+            self.profile.mark("启动工作进程", time.perf_counter() - start)
+        self.pool = self.engine.pool
+        self.result_cache = self.engine.result_cache
+        self.disk_cache = self.engine.disk_cache
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        start = time.perf_counter()
         self.setup_ui()
         self.bind_keyboard()
+        if self.profile:
+            self.profile.mark("构建界面", time.perf_counter() - start)
+            self.root.after_idle(lambda: self.profile.done('window'))
+        
+        # 界面卡顿监视（可选）
+        self.watchdog = None
+        if watchdog_threshold:
+            self.watchdog = StallWatchdog(self.root, diagnostics_log, watchdog_threshold)
+            self.watchdog.start()
         
         # 修复焦点问题：确保窗口完全加载后设置焦点
         self.root.after(100, self.set_initial_focus)
         
+    def preload_sympy(self):
+        """后台线程：预先导入SymPy"""
+        load_sympy()
+        if self.profile:
+            self.profile.done('sympy')
+        
     def set_initial_focus(self):
         """设置初始焦点到输入框"""
         self.entry.focus_set()  # 使用focus_set而不是focus_force
@@ -65,6 +4483,35 @@ class SymPyCalculator:
                                      command=self.toggle_latex)
         latex_check.grid(row=0, column=0, sticky=tk.W)
         
+        # 数值精度：精确模式下只有整数/有理数运算走快速路径
+        ttk.Label(settings_frame, text="数值精度:").grid(row=0, column=1, sticky=tk.W, padx=(10, 2))
+        precision_box = ttk.Combobox(settings_frame, textvariable=self.precision_var,
+                                     values=[label for label, _ in PRECISION_CHOICES],
+                                     state='readonly', width=6)
+        precision_box.grid(row=0, column=2, sticky=tk.W)
+        
+        # 实时预览开关
+        preview_check = ttk.Checkbutton(settings_frame, text="实时预览",
+                                        variable=self.preview_enabled,
+                                        command=self.schedule_preview)
+        preview_check.grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+        
+        # 性能分析：超过阈值的计算保存cProfile数据
+        cprofile_check = ttk.Checkbutton(settings_frame, text="性能分析",
+                                         variable=self.cprofile_enabled)
+        cprofile_check.grid(row=0, column=4, sticky=tk.W, padx=(10, 0))
+        stats_btn = ttk.Button(settings_frame, text="耗时统计", command=self.show_metrics)
+        stats_btn.grid(row=0, column=5, sticky=tk.W, padx=(5, 0))
+        settings_frame.columnconfigure(6, weight=1)
+        
+        # 运行状态指示和取消按钮
+        self.progress = ttk.Progressbar(settings_frame, mode='indeterminate', length=120)
+        self.progress.grid(row=0, column=7, sticky=tk.E, padx=(10, 5))
+        self.progress.grid_remove()
+        self.cancel_btn = ttk.Button(settings_frame, text="取消计算",
+                                     command=self.cancel_calculation, state=tk.DISABLED)
+        self.cancel_btn.grid(row=0, column=8, sticky=tk.E)
+        
         # 显示区域
         display_frame = ttk.LabelFrame(main_frame, text="显示区", padding="5")
         display_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -72,8 +4519,11 @@ class SymPyCalculator:
         display_frame.columnconfigure(1, weight=1)
         
         # 输入框 - 修复鼠标控制问题
-        self.entry = tk.Entry(display_frame, font=("Arial", 14), width=60)  # 原为80，缩小宽度
+        self.entry_var = tk.StringVar()
+        self.entry = tk.Entry(display_frame, font=("Arial", 14), width=60,  # 原为80，缩小宽度
+                              textvariable=self.entry_var)
         self.entry.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        self.entry_var.trace_add('write', self.schedule_preview)
         
         # 移除可能干扰鼠标交互的事件绑定
         self.entry.bind("<FocusIn>", self.on_entry_focus_in)
@@ -88,13 +4538,11 @@ class SymPyCalculator:
         latex_frame = ttk.Frame(display_frame)
         latex_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
         
-        # 创建matplotlib图形用于LaTeX渲染
-        self.latex_fig = Figure(figsize=(7, 1), facecolor='white')  # 原为(8, 1)，缩小宽度
-        self.latex_ax = self.latex_fig.add_subplot(111)
-        self.latex_ax.axis('off')
-        
-        self.latex_canvas = FigureCanvasTkAgg(self.latex_fig, latex_frame)
-        self.latex_canvas.get_tk_widget().grid(row=0, column=0, sticky=(tk.W, tk.E))
+        # 公式图片显示区：渲染好的图片直接贴到画布上，不重绘matplotlib图形
+        self.latex_canvas = tk.Canvas(latex_frame, width=700, height=100,  # 原为800宽
+                                      bg='white', highlightthickness=0)
+        self.latex_canvas.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        latex_frame.columnconfigure(0, weight=1)
         
         # 传统文本结果显示（备用）
         self.result_var = tk.StringVar()
@@ -102,6 +4550,12 @@ class SymPyCalculator:
                                      font=("Arial", 12), foreground="blue")
         self.result_label.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E))
         
+        # 结果过大时只显示摘要，完整内容在查看窗口中按页生成
+        self.view_btn = ttk.Button(display_frame, text="查看完整结果",
+                                   command=self.open_result_viewer)
+        self.view_btn.grid(row=4, column=1, sticky=tk.E, pady=(5, 0))
+        self.view_btn.grid_remove()
+        
         # 左侧按钮面板
         # button_frame = ttk.LabelFrame(main_frame, text="功能按钮", padding="5")
         # button_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 5))
@@ -160,6 +4614,9 @@ class SymPyCalculator:
                 btn = ttk.Button(adv_frame, text=btn_text,
                                command=lambda t=btn_text: self.adv_button_click(t))
                 btn.grid(row=i, column=j, padx=2, pady=2, sticky=(tk.N, tk.S, tk.W, tk.E))
+        race_check = ttk.Checkbutton(adv_frame, text="竞速求解 (integrate/solve/limit)",
+                                     variable=self.race_enabled, command=self.toggle_race)
+        race_check.grid(row=len(adv_buttons) - 1, column=1, columnspan=3, sticky=tk.W, padx=(5, 0))
 
         # 右侧面板
         self.right_frame = ttk.Frame(main_frame)
@@ -184,6 +4641,12 @@ class SymPyCalculator:
                                  )
         self.help_btn.pack(side=tk.LEFT)
         
+        # 绘图/表格按钮
+        self.plot_btn = tk.Button(header_frame, text="绘图/表格",
+                                 command=lambda: self.switch_right_panel('plot'),
+                                 )
+        self.plot_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
         # 内容区域
         self.content_frame = tk.Frame(self.right_frame)
         self.content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
@@ -192,14 +4655,11 @@ class SymPyCalculator:
         self.history_panel = tk.Frame(self.content_frame)
         self.history_panel.pack(fill=tk.BOTH, expand=True)
         
-        # 历史记录文本框
-        self.history_text = scrolledtext.ScrolledText(
-            self.history_panel, 
-            wrap=tk.WORD,
-            width=50,  # 控制每行显示字符数，缩小宽度
-            height=26
-        )
-        self.history_text.pack(fill=tk.BOTH, expand=True)
+        # 历史记录列表（只显示可见的行，滚动时按需读取；双击调回表达式）
+        self.history_view = HistoryView(self.history_panel, self.history_store,
+                                        self.use_history_expression)
+        self.history_view.frame.pack(fill=tk.BOTH, expand=True)
+        self.history_view.refresh()
         
         # 清除历史按钮
         clear_history_btn = tk.Button(self.history_panel, text="清除历史记录",
@@ -212,6 +4672,7 @@ class SymPyCalculator:
         
         help_text = """基础运算：
 • 数字和运算符：+, -, *, /, (), ^(幂运算)
+• 隐式乘法：2x, 2(x+1), (x+1)(x-1)；阶乘：5!, (n+1)!
 • 快捷键：Enter计算, Esc清除
 
 科学函数：
@@ -235,7 +4696,52 @@ class SymPyCalculator:
 • expand() - 展开表达式
 • factor() - 因式分解
 • simplify() - 简化表达式
-• subs() - 变量替换
+• subs() - 变量替换，代入小数时用编译后的数值函数计算
+• 批量代入：(x^2).subs(x, [1, 2, 3])、
+  sin(x).subs(x, linspace(0, pi, 50))、f.subs(x, range(0, 1, 1/10))
+
+数值精度：
+• 精确：整数/分数运算直接精确计算，其余交给SymPy
+• 15/30/50/100位：不含变量的表达式按所选精度数值计算
+• 状态栏显示本次结果由哪条计算路径给出
+
+近似结果：
+• 含积分、求和、极限或求解的输入，精确结果较慢时先显示近似值
+  （黄色底色，标记“近似值”）：定积分/级数数值计算、不定积分低阶级数、
+  多项式方程数值求根
+• 精确结果算出后自动替换；精确计算超时时保留近似值
+
+竞速求解：
+• 勾选后integrate/solve/limit同时尝试多种策略（manual、meijerg、
+  solveset、gruntz等），采用最先得到的完整结果，其余进程立即终止
+• 选择了数值精度时，定积分和多项式方程还会参与数值求积/求根
+• 状态栏显示胜出的策略，“耗时统计”中汇总各策略的胜出次数
+
+实时预览：
+• 输入停顿后自动试算，结果以灰色显示在输入下方
+• 较慢的计算只提示按Enter，预览不写入历史记录
+
+会话变量：
+• f = integrate(x^2, x) 定义变量，之后可直接使用：diff(f, x)
+• 重新定义变量时只重算依赖它的定义，值未变的沿用原结果
+• 变量只在本次运行中保留，x, y, z, t 和函数名不能被赋值
+
+开销估计：
+• 计算前按运算次数、多项式次数、嵌套深度和所用函数估计开销
+• 开销很小的输入直接计算，中等的在本进程后台计算，积分、求解等
+  难以预测或开销大的交给可终止的工作进程（状态栏显示所走路径）
+• 预计开销很大时（如高次展开、巨大整数）计算前会先确认，且不做预览
+
+大结果：
+• 结果过长（如 expand((x+y)^300)、factorial(20000)）时只显示摘要：
+  位数或项数以及开头部分
+• 点击“查看完整结果”按页浏览文本或LaTeX，滚动到末尾时才生成下一页
+• 查看窗口中可导出到文件，边生成边写入，不阻塞界面
+
+性能记录：
+• 状态栏显示本次耗时及最慢的几个阶段
+• 勾选“性能分析”后，求值超过阈值的计算保存cProfile数据
+• “耗时统计”按运算类型显示本次会话的p50/p95
 
 变量：
 • 默认变量：x, y, z, t
@@ -253,6 +4759,14 @@ LaTeX显示：
           idiff(x+y^2, y, x)
 • 求解：solve(x^2-4, x)
 • 因式分解：factor(x^2-4)
+• 矩阵：det(Matrix([[1.5, 2], [3, 4]]))、Matrix([[1.0, 2], [3, 4]]).inv()
+  含小数的数值矩阵由NumPy/LAPACK计算（状态栏显示），含符号或全为整数/分数时精确计算
+• 4阶及以上的有理数/多项式矩阵的det、solve，以及4个及以上方程的线性方程组，
+  在稀疏DomainMatrix上做无分数消元
+
+绘图/表格：
+• 对单变量(x或t)结果绘图，工具栏可缩放、平移
+• 导出表格：按范围和步长导出f(x)的CSV
 
 注意：需要matplotlib库支持LaTeX渲染"""
         
@@ -270,6 +4784,9 @@ LaTeX显示：
         self.help_text.insert(tk.END, help_text)
         self.help_text.config(state=tk.DISABLED)
         
+        # 绘图/表格面板
+        self.plot_panel = PlotPanel(self.content_frame, self)
+        
         # 初始显示历史记录
         self.switch_right_panel('history')
 
@@ -288,15 +4805,20 @@ LaTeX显示：
         # 隐藏所有面板
         self.history_panel.pack_forget()
         self.help_panel.pack_forget()
+        self.plot_panel.frame.pack_forget()
         
         # 重置按钮样式
         self.history_btn.config()
         self.help_btn.config()
+        self.plot_btn.config()
         
         # 显示对应面板并高亮按钮
         if mode == 'history':
             self.history_panel.pack(fill=tk.BOTH, expand=True)
             self.history_btn.config()
+        elif mode == 'plot':
+            self.plot_panel.frame.pack(fill=tk.BOTH, expand=True)
+            self.plot_btn.config()
         else:
             self.help_panel.pack(fill=tk.BOTH, expand=True)
             self.help_btn.config()
@@ -305,52 +4827,65 @@ LaTeX显示：
         """切换LaTeX显示模式"""
         if self.latex_enabled.get():
             self.status_var.set("就绪 - LaTeX显示已启用")
-            self.latex_canvas.get_tk_widget().grid()
+            self.latex_canvas.grid()
             self.result_label.grid_remove()
         else:
             self.status_var.set("就绪 - LaTeX显示已禁用")
-            self.latex_canvas.get_tk_widget().grid_remove()
+            self.latex_canvas.grid_remove()
             self.result_label.grid()
             
-    def render_latex(self, result):
-        """渲染LaTeX公式 - 仅渲染结果部分"""
+    def render_latex(self, result, result_latex=None, timings=None):
+        """渲染LaTeX公式 - 仅渲染结果部分
+
+        传入timings字典时记录 'latex'（如需在此生成）和 'draw' 阶段耗时。
+        """
+        if timings is None:
+            timings = {}
         try:
-            # 清除之前的内容
-            self.latex_ax.clear()
-            self.latex_ax.axis('off')
+            # 只转换结果为LaTeX格式（后台任务可能已经生成好）
+            if result_latex is None:
+                start = time.perf_counter()
+                result_latex = display_latex(result)
+                timings['latex'] = timings.get('latex', 0.0) + time.perf_counter() - start
             
-            # 只转换结果为LaTeX格式
-            result_latex = sp.latex(result) if hasattr(result, '__class__') else sp.latex(sp.sympify(str(result)))
-            
-            # 构建LaTeX字符串（只显示结果）
+            # 构建LaTeX字符串（只显示结果），已渲染过的公式直接取缓存图片
+            start = time.perf_counter()
             full_latex = f"$= {result_latex}$"
-            
-            # 在图形中显示LaTeX
-            self.latex_ax.text(0.05, 0.5, full_latex, fontsize=16, 
-                              transform=self.latex_ax.transAxes,
-                              verticalalignment='center',
-                              bbox=dict(boxstyle="round,pad=0.3", facecolor="lightblue"))
-            
-            # 调整布局并刷新
-            self.latex_fig.tight_layout()
-            self.latex_canvas.draw()
-            
+            photo = self.render_cache.photo(full_latex, 16, master=self.root)
+            self.show_latex_image(photo)
+            timings['draw'] = time.perf_counter() - start
             return True
             
         except Exception as e:
             print(f"LaTeX渲染错误: {e}")
             # 如果LaTeX渲染失败，显示纯文本
-            self.latex_ax.clear()
-            self.latex_ax.axis('off')
-            text_display = f"= {result}"
-            self.latex_ax.text(0.05, 0.5, text_display, fontsize=12,
-                              transform=self.latex_ax.transAxes,
-                              verticalalignment='center',
-                              bbox=dict(boxstyle="round,pad=0.3", facecolor="lightgray"))
-            self.latex_fig.tight_layout()
-            self.latex_canvas.draw()
+            self.show_latex_message(f"= {result}", "lightgray")
             return False
     
+    def show_latex_image(self, photo):
+        """在公式区显示图片，画布高度随公式调整"""
+        self.latex_canvas.delete('all')
+        height = min(max(100, photo.height() + 10), 300)
+        if int(self.latex_canvas.cget('height')) != height:
+            self.latex_canvas.config(height=height)
+        self.latex_canvas.create_image(10, height // 2, anchor=tk.W, image=photo)
+        
+    def show_latex_message(self, text, color):
+        """在公式区显示纯文本提示（错误或回退显示）"""
+        self.latex_canvas.delete('all')
+        if int(self.latex_canvas.cget('height')) != 100:
+            self.latex_canvas.config(height=100)
+        item = self.latex_canvas.create_text(16, 50, text=text, anchor=tk.W,
+                                             font=("Arial", 12))
+        x0, y0, x1, y1 = self.latex_canvas.bbox(item)
+        box = self.latex_canvas.create_rectangle(x0 - 6, y0 - 4, x1 + 6, y1 + 4,
+                                                 fill=color, outline='black')
+        self.latex_canvas.tag_lower(box, item)
+        
+    def clear_latex(self):
+        """清空公式区"""
+        self.latex_canvas.delete('all')
+    
     def on_entry_focus_in(self, event):
         """处理输入框获得焦点事件"""
         status_text = "就绪 - 可以输入"
@@ -362,11 +4897,45 @@ LaTeX显示：
         """绑定键盘事件 - 修复版本，减少对鼠标交互的干扰"""
         # 只绑定到entry，避免全局键盘事件干扰鼠标操作
         self.entry.bind('<Return>', lambda e: self.calculate())
-        self.entry.bind('<Escape>', lambda e: self.clear())
+        self.entry.bind('<Escape>', self.on_escape)
+        self.entry.bind('<Up>', lambda e: self.recall_history(-1))
+        self.entry.bind('<Down>', lambda e: self.recall_history(1))
         
         # 绑定窗口激活事件，但不强制设置焦点
         self.root.bind('<FocusIn>', self.on_window_focus)
         
+    def recall_history(self, step):
+        """上下键浏览历史记录，并重新显示该条结果（命中缓存时几乎无开销）"""
+        total = self.history_store.count()
+        if not total:
+            return "break"
+        if step < 0:
+            index = 0 if self.history_index is None else min(self.history_index + 1, total - 1)
+        elif not self.history_index:
+            self.history_index = None
+            self.entry.delete(0, tk.END)
+            return "break"
+        else:
+            index = self.history_index - 1
+        self.history_index = index
+        rows = self.history_store.fetch(index, 1)
+        if rows:
+            self.use_history_expression(rows[0][1])
+        return "break"
+        
+    def use_history_expression(self, expression):
+        """把历史表达式放回输入框并重新显示结果（不新增历史）"""
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, expression)
+        self.calculate(record=False)
+        
+    def on_escape(self, event=None):
+        """Esc：计算中则取消，否则清除"""
+        if self.running:
+            self.cancel_calculation()
+        else:
+            self.clear()
+        
     def on_window_focus(self, event):
         """窗口获得焦点时的处理 - 温和版本"""
         # 只有当当前没有其他控件有焦点时，才设置焦点到输入框
@@ -472,12 +5041,12 @@ LaTeX显示：
         self.entry.delete(0, tk.END)
         self.result_var.set("")
         self.input_display_var.set("")
+        self.shown_expression = None
+        self.view_btn.grid_remove()
         
         # 清除LaTeX显示
         if self.latex_enabled.get():
-            self.latex_ax.clear()
-            self.latex_ax.axis('off')
-            self.latex_canvas.draw()
+            self.clear_latex()
         
         status_text = "已清除"
         if self.latex_enabled.get():
@@ -493,164 +5062,594 @@ LaTeX显示：
         if cursor_pos > 0:
             self.entry.delete(cursor_pos-1, cursor_pos)
             
-    def calculate(self):
-        """执行计算"""
+    def calculate(self, record=True):
+        """执行计算 - 在后台线程中求值，不阻塞界面
+
+        record为False时不写入历史记录（浏览历史时使用）
+        """
         expression = self.entry.get().strip()
         if not expression:
             return
-            
+        
+        # 预计开销很大时先确认
+        cost = self.plan_calculation(expression)
+        if cost is not None and cost.warn:
+            message = "预计开销很大：\n" + "\n".join(cost.reasons or ["输入规模较大"])
+            if not messagebox.askyesno("计算可能很慢", message + "\n\n仍要计算吗？（计算中可按Esc取消）"):
+                self.status_var.set("已放弃计算")
+                self.entry.focus_set()
+                return
+        
+        # 新任务取代尚未完成的旧任务和预览
+        self.cancel_event.set()
+        self.cancel_event = threading.Event()
+        self.job_id += 1
+        self.cancel_preview()
+        self.stop_estimate()
+        self.estimate_shown = None
+        self.set_running(True)
+        self.status_var.set("计算中... (Esc或点击取消可中止)")
+        
+        # 显示输入表达式（纯文本）
+        self.shown_expression = expression
+        self.input_display_label.config(foreground="black")
+        self.input_display_var.set(f"输入: {expression}")
+        
+        self.record_job = record
+        self.job_started = time.perf_counter()
+        profile = None
+        if self.cprofile_enabled.get():
+            profile = (self.cprofile_dir, self.cprofile_threshold, expression)
+        args = (self.job_id, expression, self.latex_enabled.get(), self.cancel_event,
+                self.get_precision(), profile, self.race_enabled.get(),
+                cost.route if cost is not None else None)
+        if cost is not None and cost.route == 'inline' and (
+                not self.latex_enabled.get() or _Figure is not None):
+            # 开销很小的纯求值（不定义变量）：直接在UI线程计算，不经过线程和队列轮询
+            self.compute_job(*args)
+            self.drain_results()
+        else:
+            worker = threading.Thread(target=self.compute_job, args=args, daemon=True)
+            worker.start()
+            self.estimate_after_id = self.root.after(self.estimate_delay, self.start_estimate)
+        
+        # 计算后确保焦点回到输入框
+        self.entry.focus_set()
+        
+    def plan_calculation(self, expression):
+        """在UI线程中估计开销，返回Cost；已缓存、SymPy未加载或输入有误时返回None"""
+        if sp is None:
+            return None
         try:
-            self.status_var.set("计算中...")
+            assignment = self.session.parse_assignment(expression)
+            processed = self.preprocess_expression(assignment[1] if assignment else expression)
+            bindings, context = self.session.bindings(self.session.references(processed))
+        except Exception:
+            return None  # 交给计算任务报告错误
+        if cache_key(processed, self.get_precision(), context) in self.result_cache:
+            return None
+        cost = estimate_cost(processed, self.session.sizes(bindings), self.get_precision())
+        if assignment is not None:
+            # 定义变量可能要重算下游定义，开销不可预测，不能在UI线程中计算
+            cost.route = 'isolated'
+        return cost
+        
+    def toggle_race(self):
+        """开启竞速求解时在后台预先启动竞速进程"""
+        if self.race_enabled.get() and self.pool is not None:
+            threading.Thread(target=self.engine.ensure_race_pool, daemon=True).start()
+        self.entry.focus_set()
+        
+    def get_precision(self):
+        """当前选择的数值精度，None表示精确模式"""
+        return dict(PRECISION_CHOICES).get(self.precision_var.get())
+        
+    def compute_job(self, job_id, expression, want_latex, cancel_event, precision=None,
+                    profile=None, race=False, route=None):
+        """后台线程：预处理、求值并生成LaTeX，结果放入队列（不直接操作Tk）
+
+        各阶段耗时记录在report['timings']中，随结果一起交给UI线程。
+        race为True时integrate/solve/limit按race_strategies竞速求值；route为
+        plan_calculation估计的计算路径。
+        """
+        post = lambda kind, payload: self.result_queue.put((job_id, kind, payload))
+        report = {'timings': {}}
+        timings = report['timings']
+        try:
+            if sp is None:
+                post('status', "正在加载SymPy...")
+            load_sympy()
             
-            # 显示输入表达式（纯文本）
-            self.input_display_var.set(f"输入: {expression}")
+            # 预处理表达式；“名称 = 表达式”定义会话变量
+            start = time.perf_counter()
+            assignment = self.session.parse_assignment(expression)
+            if assignment is not None:
+                name, expression_body = assignment
+            else:
+                expression_body = expression
+            processed_expr = self.preprocess_expression(expression_body)
+            dependencies = self.session.references(processed_expr)
+            if assignment is not None:
+                self.session.check_cycle(name, dependencies)
+            bindings, context = self.session.bindings(dependencies)
+            strategies = race_strategies(processed_expr, precision) if race else None
+            timings['preprocess'] = time.perf_counter() - start
             
-            # 预处理表达式
-            processed_expr = self.preprocess_expression(expression)
+            # 计算（先查缓存，再交给工作进程）
+            result, source = self.evaluate_detailed(processed_expr, cancel_event, precision,
+                                                    report, profile, bindings, context,
+                                                    strategies, route,
+                                                    self.session.sizes(dependencies))
+            if assignment is not None:
+                report['session'] = self.assign_variable(name, processed_expr, dependencies,
+                                                         result, cancel_event, precision)
             
-            # 使用SymPy计算
-            result = self.evaluate_expression(processed_expr)
+            post('status', "生成显示...")
+            result_latex = None
+            if is_large_result(result):
+                # 整体生成文本和LaTeX会卡很久且无法显示，只生成摘要
+                report['large'] = LargeResult(result)
+                result_str = report['large'].summary()
+            else:
+                result_str = display_text(result)
+            if want_latex and 'large' not in report:
+                try:
+                    start = time.perf_counter()
+                    result_latex = display_latex(result)
+                    latex_done = time.perf_counter()
+                    timings['latex'] = latex_done - start
+                    # 在后台完成mathtext排版和栅格化，UI线程只需生成图片
+                    self.render_cache.rasterize(f"$= {result_latex}$", 16)
+                    timings['mathtext'] = time.perf_counter() - latex_done
+                except Exception:
+                    pass  # 交给render_latex的纯文本回退处理
+            report['operation'] = operation_type(processed_expr)
+            post('done', (expression, result, result_str, result_latex, source, report))
+        except EvaluationCancelled:
+            pass
+        except Exception as e:
+            post('error', (expression, e))
             
-            # 显示结果
-            result_str = str(result)
+    def assign_variable(self, name, expression, dependencies, value, cancel_event, precision):
+        """定义会话变量并重算受影响的下游定义，返回状态栏摘要
+
+        下游定义按拓扑顺序处理：只有引用的变量值确实变化时才重算，否则沿用原值。
+        全部重算成功后才一次性提交，中途出错或被取消时会话变量保持不变。
+        """
+        previous = self.session.get(name)
+        updated = {name: SessionVariable(name, expression, dependencies, value)}
+        changed = set()
+        if previous is None or previous.digest != updated[name].digest:
+            changed.add(name)
+        recomputed, reused = [], []
+        for other in self.session.downstream(name):
+            variable = self.session.get(other)
+            if not variable.dependencies & changed:
+                reused.append(other)
+                continue
+            bindings, context = self.session.bindings(variable.dependencies, updated)
+            try:
+                result, _ = self.evaluate_detailed(
+                    variable.expression, cancel_event, precision, bindings=bindings,
+                    context=context, sizes=self.session.sizes(variable.dependencies, updated))
+            except EvaluationCancelled:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"重算 {other} 时出错: {e}") from e
+            updated[other] = SessionVariable(other, variable.expression,
+                                             variable.dependencies, result)
+            if updated[other].digest != variable.digest:
+                changed.add(other)
+            recomputed.append(other)
+        if cancel_event.is_set():
+            raise EvaluationCancelled("计算已取消")
+        self.session.commit(updated.values())
+        
+        summary = f"变量 {name} 已{'更新' if previous is not None else '定义'}"
+        if recomputed:
+            summary += f"，重算 {', '.join(recomputed)}"
+        if reused:
+            summary += f"，沿用 {', '.join(reused)}"
+        return summary
+        
+    def set_running(self, running):
+        """切换运行状态：进度条、取消按钮和结果轮询"""
+        self.running = running
+        if running:
+            self.progress.grid()
+            self.progress.start(10)
+            self.cancel_btn.config(state=tk.NORMAL)
+            self.ensure_polling()
+        else:
+            self.progress.stop()
+            self.progress.grid_remove()
+            self.cancel_btn.config(state=tk.DISABLED)
             
-            if self.latex_enabled.get():
-                # 使用LaTeX显示结果
-                success = self.render_latex(result)
-                if not success:
-                    self.result_var.set(f"{result_str}")
-                else:
-                    self.result_var.set("")  # 清除文本显示
+    def ensure_polling(self):
+        """启动结果轮询（已在轮询时不重复启动）"""
+        if self.poll_after_id is None:
+            self.poll_after_id = self.root.after(self.poll_interval, self.poll_results)
+            
+    def schedule_preview(self, *args):
+        """输入变化后延迟启动预览，连续输入时只保留最后一次"""
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        self.cancel_preview()
+        if self.preview_enabled.get():
+            self.preview_after_id = self.root.after(self.preview_delay, self.start_preview)
+            
+    def cancel_preview(self):
+        """作废未完成的预览并清除已显示的预览
+
+        不终止预览进程（重新启动要再付出解释器和SymPy的导入开销），
+        过期的结果按preview_id丢弃，运行时间仍受preview_timeout限制。
+        """
+        self.preview_id += 1
+        if self.preview_shown:
+            self.preview_shown = False
+            self.input_display_var.set("")
+            self.input_display_label.config(foreground="black")
+            
+    def start_preview(self):
+        """先做语法检查，通过后在后台试算（不写入历史）"""
+        self.preview_after_id = None
+        expression = self.entry.get().strip()
+        if (not expression or self.running or sp is None
+                or expression == self.shown_expression):
+            return
+        try:
+            # 赋值只预览右侧的值，不修改会话变量
+            assignment = self.session.parse_assignment(expression)
+            processed = self.preprocess_expression(assignment[1] if assignment else expression)
+            bindings, context = self.session.bindings(self.session.references(processed))
+        except Exception:
+            return  # 输入尚不完整，不打扰用户
+        precision = self.get_precision()
+        found, result = self.result_cache.lookup(cache_key(processed, precision, context))
+        if found:
+            self.show_preview('preview', self.preview_text(result))
+            return
+        if estimate_cost(processed, self.session.sizes(bindings), precision).warn:
+            self.show_preview('preview-costly', None)
+            return
+        if self.pool is not None and not self.ensure_preview_pool():
+            return
+        if self.preview_active:
+            self.preview_pending = True  # 上一次预览结束后再启动，不让任务排队
+            return
+        self.preview_thread = threading.Thread(target=self.preview_job,
+                                               args=(self.preview_id, processed, precision,
+                                                     self.preview_cancel, bindings, context),
+                                               daemon=True)
+        self.preview_active = True
+        self.preview_thread.start()
+        self.ensure_polling()
+        
+    def ensure_preview_pool(self):
+        """启动预览进程池，失败时返回False
+
+        两个进程：一个可能仍在计算已过期的预览，另一个可立即用于近似层。
+        """
+        if self.preview_pool is None:
+            try:
+                self.preview_pool = EvaluationWorkerPool(2, self.preview_timeout,
+                                                         self.memory_limit_mb)
+            except Exception:
+                return False
+        return True
+        
+    def start_estimate(self):
+        """精确结果仍未完成时，对含积分、求和、极限、求解的输入先计算近似值"""
+        self.estimate_after_id = None
+        expression = self.shown_expression
+        if not self.running or self.pool is None or expression is None:
+            return
+        try:
+            assignment = self.session.parse_assignment(expression)
+            processed = self.preprocess_expression(assignment[1] if assignment else expression)
+            bindings, _ = self.session.bindings(self.session.references(processed))
+        except Exception:
+            return  # 交给精确计算报告错误
+        precision = self.get_precision() or 15
+        overrides = estimate_overrides(processed, precision)
+        if overrides is None or not self.ensure_preview_pool():
+            return
+        threading.Thread(target=self.estimate_job,
+                         args=(self.job_id, processed, dict(bindings or {}, **overrides),
+                               precision, self.latex_enabled.get(), self.estimate_cancel),
+                         daemon=True).start()
+        
+    def estimate_job(self, job_id, processed, bindings, precision, want_latex, cancel_event):
+        """后台线程：在预览进程中计算近似结果（不写入缓存和历史记录）"""
+        try:
+            result, _ = self.preview_pool.evaluate(processed, timeout=self.estimate_timeout,
+                                                   cancel_event=cancel_event,
+                                                   precision=precision, bindings=bindings)
+            text = display_text(result)
+            latex = None
+            if want_latex:
+                try:
+                    latex = display_latex(result)
+                    self.render_cache.rasterize(f"$\\approx {latex}$", 16, 'lightyellow')
+                except Exception:
+                    latex = None
+        except Exception:
+            return  # 估算失败或超时时只等精确结果
+        self.result_queue.put((job_id, 'estimate', (text, latex)))
+        
+    def stop_estimate(self):
+        """取消尚未开始或未完成的近似计算"""
+        if self.estimate_after_id is not None:
+            self.root.after_cancel(self.estimate_after_id)
+            self.estimate_after_id = None
+        self.estimate_cancel.set()
+        self.estimate_cancel = threading.Event()
+        
+    def show_estimate(self, text, latex):
+        """显示近似结果（黄色底色，标明为近似层），精确结果到达后被替换"""
+        self.estimate_shown = text
+        shown = False
+        if self.latex_enabled.get() and latex is not None:
+            try:
+                photo = self.render_cache.photo(f"$\\approx {latex}$", 16, 'lightyellow',
+                                                master=self.root)
+                self.show_latex_image(photo)
+                self.result_var.set("[近似值]")
+                shown = True
+            except Exception:
+                pass
+        if not shown:
+            self.result_var.set(f"≈ {text}  [近似值]")
+        self.status_var.set("已显示近似结果，精确结果计算中... (Esc或点击取消可中止)")
+        
+    def preview_job(self, preview_id, processed, precision, cancel_event, bindings=None,
+                    context=None):
+        """后台线程：在预览时间预算内求值，结果存入缓存供Enter直接使用"""
+        post = lambda kind, payload: self.result_queue.put((preview_id, kind, payload))
+        try:
+            self.preview_evaluate(post, processed, precision, cancel_event, bindings, context)
+        finally:
+            post('preview-idle', None)
+            
+    def preview_evaluate(self, post, processed, precision, cancel_event, bindings, context):
+        """预览求值的主体，结果通过post发送"""
+        try:
+            if self.preview_pool is not None:
+                result, _ = self.preview_pool.evaluate(processed, timeout=self.preview_timeout,
+                                                       cancel_event=cancel_event,
+                                                       precision=precision, bindings=bindings)
             else:
-                # 使用传统文本显示
-                self.result_var.set(f"= {result_str}")
-                # 清除LaTeX显示区域
-                self.latex_ax.clear()
-                self.latex_ax.axis('off')
-                self.latex_canvas.draw()
+                # 没有工作进程时线程无法中止，只预览数值快速路径能处理的输入
+                namespace = dict(get_namespace(), **bindings) if bindings else get_namespace()
+                fast = numeric_fast_path(parse_expression(processed), namespace, precision)
+                if fast is None:
+                    return
+                result = fast[0]
+        except EvaluationCancelled:
+            return
+        except EvaluationTimeout:
+            post('preview-slow', None)
+            return
+        except Exception:
+            return  # 求值出错时不显示预览，按Enter后再报告错误
+        self.result_cache.store(cache_key(processed, precision, context), result)
+        post('preview', self.preview_text(result))
+        
+    @staticmethod
+    def preview_text(result, limit=80):
+        """预览用的单行文本，过长时截断（大结果用摘要，不生成完整文本）"""
+        text = LargeResult(result).summary() if is_large_result(result) else display_text(result)
+        if len(text) > limit:
+            text = text[:limit] + "…"
+        return text
+        
+    def show_preview(self, kind, text):
+        """在输入显示标签中用灰色显示预览"""
+        if kind == 'preview':
+            self.input_display_var.set(f"预览: = {text}")
+        elif kind == 'preview-costly':
+            self.input_display_var.set("预览: 预计开销很大，已跳过")
+        else:
+            self.input_display_var.set("预览: 计算较慢，按Enter完整计算")
+        self.input_display_label.config(foreground="gray")
+        self.preview_shown = True
+        
+    def preview_busy(self):
+        """预览线程仍在运行或还有未取出的消息"""
+        return ((self.preview_thread is not None and self.preview_thread.is_alive())
+                or not self.result_queue.empty())
+        
+    def cancel_calculation(self):
+        """放弃当前计算，后台线程的结果到达后会被丢弃"""
+        if not self.running:
+            return
+        self.cancel_event.set()  # 终止工作进程中的任务
+        self.job_id += 1
+        self.stop_estimate()
+        self.set_running(False)
+        self.status_var.set("计算已取消")
+        self.entry.focus_set()
+        
+    def poll_results(self):
+        """在UI线程中定时取出后台任务的消息"""
+        self.poll_after_id = None
+        self.drain_results()
+        if self.running or self.preview_busy():
+            self.poll_after_id = self.root.after(self.poll_interval, self.poll_results)
             
-            # 添加到历史记录
-            self.add_to_history(expression, result_str)
+    def drain_results(self):
+        """处理队列中已有的全部消息"""
+        while True:
+            try:
+                job_id, kind, payload = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'preview-idle':
+                self.preview_active = False
+                if self.preview_pending:
+                    self.preview_pending = False
+                    self.start_preview()
+                continue
+            if kind.startswith('preview'):
+                if job_id == self.preview_id and not self.running:
+                    self.show_preview(kind, payload)
+                continue
+            if job_id != self.job_id or not self.running:
+                continue  # 已取消或被新任务取代
+            if kind == 'status':
+                if self.estimate_shown is None:
+                    self.status_var.set(payload)
+            elif kind == 'estimate':
+                self.show_estimate(*payload)
+            elif kind == 'done':
+                self.stop_estimate()
+                self.set_running(False)
+                self.show_result(*payload)
+            elif kind == 'error':
+                self.stop_estimate()
+                self.set_running(False)
+                self.show_error(*payload)
             
-            status_text = "计算完成"
+    def show_result(self, expression, result, result_str, result_latex, source='sympy',
+                    report=None):
+        """显示计算结果"""
+        if self.profile:
+            self.profile.report_late_imports()
+        if report is None:
+            report = {'timings': {}}
+        timings = report['timings']
+        self.last_result = result
+        self.large_result = report.get('large')
+        if self.large_result is not None:
+            # 大结果只显示摘要
+            self.view_btn.grid()
+            self.result_var.set(f"= {result_str}")
             if self.latex_enabled.get():
-                status_text += " (LaTeX显示)"
-            self.status_var.set(status_text)
-            
-        except Exception as e:
-            error_msg = f"错误: {str(e)}"
+                self.show_latex_message(f"= {result_str}", "lightyellow")
+        elif self.latex_enabled.get():
+            self.view_btn.grid_remove()
+            # 使用LaTeX显示结果
+            success = self.render_latex(result, result_latex, timings)
+            if not success:
+                self.result_var.set(f"{result_str}")
+            else:
+                self.result_var.set("")  # 清除文本显示
+        else:
+            self.view_btn.grid_remove()
+            # 使用传统文本显示
+            self.result_var.set(f"= {result_str}")
+            # 清除LaTeX显示区域
+            self.clear_latex()
+        
+        # 添加到历史记录
+        if self.record_job:
+            self.add_to_history(expression, result_str)
+        
+        status_text = f"计算完成 [{ENGINE_LABELS.get(source, source)}"
+        if report.get('route') and source not in ('cache', 'disk'):
+            status_text += f" · {ROUTE_LABELS[report['route']]}"
+        status_text += "]"
+        if self.latex_enabled.get():
+            status_text += " (LaTeX显示)"
+        if self.estimate_shown is not None:
+            status_text += " | 精确结果已替换近似值"
+            self.estimate_shown = None
+        status_text += f" | {self.result_cache.stats_text()}"
+        
+        # 耗时分解：未计入任何阶段的部分（加载、排队、线程切换）记为“其他”
+        if self.job_started is not None:
+            total = time.perf_counter() - self.job_started
+            timings['other'] = max(0.0, total - sum(timings.values()))
+            status_text += f" | {format_timings(timings, total)}"
+            self.metrics.record(report.get('operation', '其他'), total, source, timings,
+                                report.get('race'))
+        if self.large_result is not None:
+            status_text += " | 结果较大，已显示摘要"
+        if report.get('race'):
+            status_text += f" | {race_summary(report['race'])}"
+        if report.get('session'):
+            status_text += f" | {report['session']}"
+        if report.get('profile'):
+            status_text += f" | 性能分析已保存: {os.path.basename(report['profile'])}"
+        self.status_var.set(status_text)
+        
+    def open_result_viewer(self):
+        """打开大结果的查看窗口"""
+        if self.large_result is not None:
+            ResultViewer(self.root, self.shown_expression or "", self.large_result)
+        
+    def show_metrics(self):
+        """显示本次会话各类运算的p50/p95耗时"""
+        text = self.metrics.summary_text()
+        if self.metrics.path:
+            text += f"\n\n日志: {self.metrics.path}"
+        messagebox.showinfo("耗时统计", text)
+        self.entry.focus_set()
+        
+    def show_error(self, expression, e):
+        """显示计算错误"""
+        error_msg = f"错误: {str(e)}"
+        self.view_btn.grid_remove()
+        estimate, self.estimate_shown = self.estimate_shown, None
+        if estimate is not None:
+            # 精确计算失败（多为超时）时保留已显示的近似结果
+            self.result_var.set(f"{error_msg}\n近似值: ≈ {estimate}")
+        else:
             self.result_var.set(error_msg)
+        if isinstance(e, EvaluationTimeout):
+            self.status_var.set("计算超时 - 工作进程已重启")
+        elif isinstance(e, EvaluationMemoryError):
+            self.status_var.set("内存不足 - 工作进程已重启")
+        elif isinstance(e, EvaluationWorkerError):
+            self.status_var.set("工作进程意外退出 - 已重新启动")
+        else:
             self.status_var.set("计算出错")
-            self.input_display_var.set(f"输入: {expression}")
-            
-            # 清除LaTeX显示区域的错误内容
-            if self.latex_enabled.get():
-                self.latex_ax.clear()
-                self.latex_ax.axis('off')
-                self.latex_ax.text(0.05, 0.5, f"计算错误: {str(e)}", fontsize=12,
-                                  transform=self.latex_ax.transAxes,
-                                  verticalalignment='center',
-                                  bbox=dict(boxstyle="round,pad=0.3", facecolor="lightcoral"))
-                self.latex_canvas.draw()
-            
-            messagebox.showerror("计算错误", error_msg)
+        self.input_display_var.set(f"输入: {expression}")
         
-        # 计算后确保焦点回到输入框
+        # 清除LaTeX显示区域的错误内容
+        if self.latex_enabled.get() and estimate is None:
+            self.show_latex_message(f"计算错误: {str(e)}", "lightcoral")
+        
+        messagebox.showerror("计算错误", error_msg)
         self.entry.focus_set()
             
     def preprocess_expression(self, expr):
         """预处理表达式"""
-        # 替换常用数学符号
-        replacements = [
-            ('π', 'pi'),
-            ('∞', 'oo'),
-            ('×', '*'),
-            ('÷', '/'),
-            ('log10', 'log10'),
-            ('!', '!'),  # 阶乘会在evaluate中处理
-        ]
-        
-        for old, new in replacements:
-            expr = expr.replace(old, new)
-            
-        return expr
-        
-    def evaluate_expression(self, expr):
-        """使用SymPy计算表达式"""
-        # 创建安全的命名空间
-        namespace = {
-            # 基本符号
-            'x': self.x, 'y': self.y, 'z': self.z, 't': self.t,
-            # 常数
-            'pi': sp.pi, 'e': sp.E, 'I': sp.I, 'oo': sp.oo,
-            # 基本函数
-            'sin': sp.sin, 'cos': sp.cos, 'tan': sp.tan,
-            'asin': sp.asin, 'acos': sp.acos, 'atan': sp.atan,
-            'sinh': sp.sinh, 'cosh': sp.cosh, 'tanh': sp.tanh,
-            'log': sp.log, 'log10': lambda x: sp.log(x, 10),
-            'ln': sp.log, 'exp': sp.exp,
-            'sqrt': sp.sqrt, 'abs': sp.Abs,
-            'factorial': sp.factorial,
-            # 微积分函数
-            'diff': sp.diff, 'integrate': sp.integrate,
-            'limit': sp.limit, 'series': sp.series,
-            'idiff': sp.idiff,
-            # 代数函数
-            'solve': sp.solve, 'expand': sp.expand,
-            'factor': sp.factor, 'simplify': sp.simplify,
-            'cancel': sp.cancel, 'apart': sp.apart,
-            # 矩阵函数
-            'Matrix': sp.Matrix, 'det': lambda m: m.det(),
-            # 其他有用函数
-            'summation': sp.summation, 'product': sp.product,
-        }
+        return preprocess_expression(expr)
         
-        # 处理阶乘
-        if '!' in expr:
-            # 简单处理阶乘
-            import re
-            expr = re.sub(r'(\d+)!', r'factorial(\1)', expr)
-            expr = re.sub(r'([a-zA-Z_][a-zA-Z0-9_]*)!', r'factorial(\1)', expr)
+    def evaluate_expression(self, expr, cancel_event=None, precision=None):
+        """使用SymPy计算表达式（带LRU结果缓存）"""
+        return self.evaluate_detailed(expr, cancel_event, precision)[0]
         
-        # 计算表达式
-        try:
-            result = eval(expr, {"__builtins__": {}}, namespace)
-            
-            # 如果结果是SymPy表达式，尝试数值化
-            if hasattr(result, 'evalf'):
-                try:
-                    numeric_result = result.evalf()
-                    # 如果数值结果比符号结果更简单，返回数值结果
-                    if len(str(numeric_result)) < len(str(result)) and numeric_result.is_real:
-                        return numeric_result
-                except:
-                    pass
-            
-            return result
-            
-        except Exception as e:
-            # 如果直接计算失败，尝试作为SymPy表达式解析
-            try:
-                parsed = sp.sympify(expr, locals=namespace)
-                return parsed.evalf() if parsed.is_number else parsed
-            except:
-                raise e
+    def evaluate_detailed(self, expr, cancel_event=None, precision=None, report=None,
+                          profile=None, bindings=None, context=None, strategies=None,
+                          route=None, sizes=None):
+        """计算表达式，返回 (结果, 来源)，参数见CalculatorEngine.evaluate_detailed"""
+        return self.engine.evaluate_detailed(expr, cancel_event, precision, report,
+                                             profile, bindings, context, strategies, route,
+                                             sizes)
                 
     def add_to_history(self, expression, result):
-        """添加到历史记录"""
-        history_entry = f"{expression} = {result}\n"
-        self.history.append(history_entry)
-        self.history_text.insert(tk.END, history_entry)
-        self.history_text.see(tk.END)
-        
-        # 限制历史记录数量
-        if len(self.history) > 100:
-            self.history.pop(0)
+        """添加到历史记录（批量写入数据库）"""
+        self.history_store.add(expression, result)
+        self.history_index = None
+        if self.history_flush_id is None:
+            self.history_flush_id = self.root.after(1000, self.flush_history)
+        # 正在查看最新记录时刷新列表
+        if self.history_view.offset == 0:
+            self.history_view.refresh()
+            
+    def flush_history(self):
+        """定时把待写入的历史记录写入数据库"""
+        self.history_flush_id = None
+        self.history_store.flush()
             
     def clear_history(self):
         """清除历史记录"""
-        self.history.clear()
-        self.history_text.delete(1.0, tk.END)
+        self.history_store.clear()
+        self.history_index = None
+        self.history_view.refresh()
         status_text = "历史记录已清除"
         if self.latex_enabled.get():
             status_text += " (LaTeX已启用)"
@@ -658,9 +5657,104 @@ LaTeX显示：
         # 清除历史后确保焦点回到输入框
         self.entry.focus_set()
 
+    def on_close(self):
+        """关闭窗口时结束工作进程"""
+        self.cancel_event.set()
+        self.preview_cancel.set()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.engine.shutdown()
+        if self.preview_pool is not None:
+            self.preview_pool.shutdown()
+        self.history_store.close()
+        self.root.destroy()
+
 def main():
+    parser = argparse.ArgumentParser(description="SymPy LaTeX 科学计算器")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="求值工作进程数，0表示在线程中计算 (默认: 2)")
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help="单次计算时间上限，秒 (默认: 30)")
+    parser.add_argument('--memory-limit', type=int, default=1024, metavar='MB',
+                        help="每个工作进程的内存上限，MB (默认: 1024)")
+    parser.add_argument('--cache-size', type=int, default=256, metavar='N',
+                        help="结果缓存的最大条目数，0表示关闭缓存 (默认: 256)")
+    parser.add_argument('--cache-mb', type=int, default=64, metavar='MB',
+                        help="结果缓存的估计内存上限，MB (默认: 64)")
+    parser.add_argument('--disk-cache', nargs='?', const=DEFAULT_DISK_CACHE_DIR,
+                        metavar='DIR',
+                        help=f"启用跨会话磁盘缓存 (默认目录: {DEFAULT_DISK_CACHE_DIR})")
+    parser.add_argument('--disk-cache-mb', type=int, default=256, metavar='MB',
+                        help="磁盘缓存大小上限，MB (默认: 256)")
+    batch = parser.add_argument_group("批量模式（不打开窗口）")
+    batch.add_argument('--batch', metavar='FILE',
+                       help="逐行计算FILE中的表达式（'-'表示标准输入），结果以JSON lines输出")
+    batch.add_argument('--output', metavar='FILE',
+                       help="批量结果输出文件 (默认: 标准输出)")
+    batch.add_argument('--jobs', type=int, default=None, metavar='N',
+                       help="批量模式的工作进程数 (默认: CPU核数)")
+    batch.add_argument('--unordered', action='store_true',
+                       help="按完成顺序输出，不保持输入顺序")
+    batch.add_argument('--latex', action='store_true',
+                       help="输出中包含LaTeX")
+    serve = parser.add_argument_group("本地求值服务（不打开窗口）")
+    serve.add_argument('--serve', nargs='?', const='127.0.0.1:8765', metavar='ADDRESS',
+                       help="以JSON-RPC over HTTP提供求值服务，ADDRESS为HOST:PORT或"
+                            "unix:/路径 (默认: 127.0.0.1:8765)，工作进程数由--jobs指定")
+    serve.add_argument('--verbose', action='store_true',
+                       help="服务模式下打印每个HTTP请求")
+    parser.add_argument('--history', default=DEFAULT_HISTORY_PATH, metavar='FILE',
+                        help=f"历史记录数据库，':memory:'表示不保存 (默认: {DEFAULT_HISTORY_PATH})")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="打印各模块导入和初始化耗时")
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, metavar='DIR',
+                        help=f"开启“性能分析”后cProfile数据的保存目录 (默认: {DEFAULT_PROFILE_DIR})")
+    parser.add_argument('--profile-threshold', type=float, default=1.0, metavar='SECONDS',
+                        help="求值耗时达到该值才保存性能分析 (默认: 1)")
+    parser.add_argument('--metrics-log', default=DEFAULT_METRICS_LOG, metavar='FILE',
+                        help=f"耗时日志（JSON lines），空字符串表示不写文件 (默认: {DEFAULT_METRICS_LOG})")
+    parser.add_argument('--watchdog', nargs='?', type=float, const=0.5, default=None,
+                        metavar='SECONDS',
+                        help="监视界面卡顿，超过该时长时记录主线程调用栈 (默认阈值: 0.5)")
+    parser.add_argument('--diagnostics-log', default=DEFAULT_DIAGNOSTICS_LOG, metavar='FILE',
+                        help=f"卡顿诊断日志 (默认: {DEFAULT_DIAGNOSTICS_LOG})")
+    args = parser.parse_args()
+    
+    if args.batch:
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            run_batch(source, out, args.jobs, not args.unordered, args.timeout,
+                      args.memory_limit, args.latex)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+        return
+    
+    if args.serve:
+        engine = CalculatorEngine(args.jobs or os.cpu_count() or 1, args.timeout,
+                                  args.memory_limit, args.cache_size, args.cache_mb,
+                                  args.disk_cache, args.disk_cache_mb)
+        try:
+            run_server(args.serve, engine, args.verbose)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        finally:
+            engine.shutdown()
+        return
+    
+    profile = StartupProfile() if args.startup_profile else None
+    start = time.perf_counter()
     root = tk.Tk()
-    app = SymPyCalculator(root)
+    if profile:
+        profile.mark("创建Tk根窗口", time.perf_counter() - start)
+    app = SymPyCalculator(root, args.workers, args.timeout, args.memory_limit,
+                          args.cache_size, args.cache_mb,
+                          args.disk_cache, args.disk_cache_mb, profile, args.history,
+                          args.profile_dir, args.profile_threshold, args.metrics_log,
+                          args.watchdog, args.diagnostics_log)
     root.mainloop()
 
 if __name__ == "__main__":
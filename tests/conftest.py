@@ -0,0 +1,5 @@
+import os
+import sys
+
+# calculator.py是仓库根目录下的单文件模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+"""结果缓存：缓存键、LRU淘汰和磁盘缓存"""
+import os
+
+import calculator
+from calculator import DiskResultCache, ResultCache, cache_key
+
+sp = calculator.load_sympy()
+x = sp.Symbol('x')
+
+
+def test_cache_key_normalizes_whitespace():
+    assert cache_key(' x  +\t1 ') == cache_key('x + 1')
+
+
+def test_cache_key_separates_precision_and_context():
+    keys = {cache_key('x'), cache_key('x', 15), cache_key('x', 30), cache_key('x', None, 'a=1'),
+            cache_key('x', 15, 'a=1'), cache_key('x', None, 'a=2')}
+    assert len(keys) == 6
+
+
+def test_lru_eviction_by_entries():
+    cache = ResultCache(max_entries=2)
+    cache.store('a', sp.Integer(1))
+    cache.store('b', sp.Integer(2))
+    assert cache.lookup('a') == (True, 1)  # a成为最近使用
+    cache.store('c', sp.Integer(3))
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert cache.lookup('b') == (False, None)
+    assert cache.misses == 1
+
+
+def test_eviction_by_bytes():
+    small = sp.Integer(1)
+    size = calculator.estimate_result_bytes(small)
+    cache = ResultCache(max_entries=100, max_bytes=3 * size)
+    for key in 'abcd':
+        cache.store(key, small)
+    assert list(cache.entries) == ['b', 'c', 'd']
+    assert cache.total_bytes == 3 * size
+
+
+def test_oversized_and_disabled():
+    cache = ResultCache(max_entries=10, max_bytes=1)
+    cache.store('a', x + 1)
+    assert 'a' not in cache
+    cache = ResultCache(max_entries=0)
+    cache.store('a', sp.Integer(1))
+    assert 'a' not in cache
+
+
+def test_store_replaces_existing_entry():
+    cache = ResultCache()
+    cache.store('a', sp.Integer(1))
+    cache.store('a', x + 1)
+    assert len(cache.entries) == 1
+    assert cache.total_bytes == calculator.estimate_result_bytes(x + 1)
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskResultCache(str(tmp_path), min_seconds=0)
+    values = [x ** 2 + sp.Rational(1, 3), sp.Matrix([[1, x]]), sp.factorial(3000) * x]
+    for index, value in enumerate(values):
+        cache.store(f"k{index}", value, 1.0)
+    for index, value in enumerate(values):
+        assert cache.load(f"k{index}") == (True, value)
+    assert cache.load('missing') == (False, None)
+
+
+def test_disk_cache_skips_fast_results(tmp_path):
+    cache = DiskResultCache(str(tmp_path), min_seconds=0.5)
+    cache.store('k', x, 0.1)
+    assert cache.load('k') == (False, None)
+
+
+def test_disk_cache_removes_corrupt_entries(tmp_path):
+    cache = DiskResultCache(str(tmp_path), min_seconds=0)
+    cache.store('k', x, 1.0)
+    path = cache.path_for('k')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Symbol(')
+    assert cache.load('k') == (False, None)
+    assert not os.path.exists(path)
+
+
+def test_disk_cache_sweep_evicts_least_recently_used(tmp_path):
+    cache = DiskResultCache(str(tmp_path), max_mb=1, min_seconds=0)
+    for index in range(4):
+        cache.store(f"k{index}", x + index, 1.0)
+        os.utime(cache.path_for(f"k{index}"), (index, index))
+    sizes = sum(os.path.getsize(cache.path_for(f"k{index}")) for index in range(4))
+    cache.max_bytes = sizes - 1
+    cache.sweep()
+    assert not os.path.exists(cache.path_for('k0'))
+    assert os.path.exists(cache.path_for('k3'))
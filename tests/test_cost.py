@@ -0,0 +1,64 @@
+"""开销估计和计算路径：只有简单运算留在调用线程中"""
+import pytest
+
+import calculator
+from calculator import COST_WARN, estimate_cost
+
+calculator.load_sympy()
+
+
+@pytest.mark.parametrize('text', ['1+2', 'x**2 + 2*x', 'sin(x) + cos(x)', '2^10', '3!', 'sqrt(2)/3'])
+def test_simple_input_is_inline(text):
+    assert estimate_cost(text).route == 'inline'
+
+
+@pytest.mark.parametrize('text', [
+    'Integral(exp(-x**2)*sin(x)**9, x).doit()',
+    'pi.evalf(300000)',
+    'N(pi, 300000)',
+    'dsolve(f(x).diff(x) - f(x))',
+    'factorint(10**30 + 1)',
+    'trigsimp(sin(x)**2 + cos(x)**2)',
+    'nsimplify(0.5)',
+    'det(Matrix([[a, b], [c, d]]))',
+    'Matrix([[a, b], [c, d]]).inv()',
+    'integrate(x, x)',
+    'expand((x+1)**3)',
+    'unknown_function(1)',
+    'x.subs(x, 1)',
+    'a = 1',
+])
+def test_unknown_or_heavy_work_is_isolated(text):
+    assert estimate_cost(text).route == 'isolated'
+
+
+def test_precision_is_scored():
+    assert estimate_cost('sqrt(2)', precision=15).route == 'inline'
+    assert estimate_cost('sqrt(2)', precision=100).route == 'inline'
+    cost = estimate_cost('sqrt(2)', precision=400000)
+    assert cost.route == 'isolated'
+    assert cost.reasons
+    assert estimate_cost('sqrt(2)', precision=10 ** 7).warn
+
+
+@pytest.mark.parametrize('text', ['pi.evalf(10**7)', 'pi.n(10**7)', 'N(pi, 10**7)', 'N(pi, n=10**7)'])
+def test_digit_arguments_warn(text):
+    assert estimate_cost(text).warn
+
+
+@pytest.mark.parametrize('text', ['2**(2**100)', 'factorial(factorial(20))', '10**10**10',
+                                  'expand((x+y+z+1)**200)'])
+def test_unbounded_work_warns(text):
+    cost = estimate_cost(text)
+    assert cost.score >= COST_WARN
+    assert cost.route == 'isolated'
+    assert cost.reasons
+
+
+def test_large_session_variable_is_isolated():
+    assert estimate_cost('p * 2', {'p': 10}).route == 'inline'
+    assert estimate_cost('p * 2', {'p': 1000}).route == 'isolated'
+
+
+def test_syntax_error_is_isolated():
+    assert estimate_cost('(1+').route == 'isolated'
@@ -0,0 +1,50 @@
+"""数值快速路径与SymPy路径的结果一致"""
+import pytest
+
+import calculator
+from calculator import evaluate_detailed, evaluate_tree, get_namespace, numeric_form, parse_expression
+
+sp = calculator.load_sympy()
+
+
+def sympy_value(text):
+    return evaluate_tree(parse_expression(text), get_namespace())
+
+
+def sympy_result(text, precision=None):
+    return numeric_form(sympy_value(text), precision)
+
+
+@pytest.mark.parametrize('text', [
+    '2^100 - 3*7', '1/3 + 1/6', '(-2)^5', '2^-3', '7 % 3', '10!', 'factorial(20) / 3',
+    'abs(-5/2)', '-(3 - 10)^2',
+])
+@pytest.mark.parametrize('precision', [None, 15, 50])
+def test_exact_path(text, precision):
+    result, engine = evaluate_detailed(text, precision=precision)
+    assert engine == 'exact'
+    # 精确模式保留整数和分数的精确值，不像numeric_form那样把长整数改写为浮点
+    expected = sympy_value(text) if precision is None else sympy_result(text, precision)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+@pytest.mark.parametrize('text', ['0.1 + 0.2', 'sin(1.5) * 2', 'sqrt(2.0)', 'exp(1.0) - pi'])
+def test_float_path(text):
+    result, engine = evaluate_detailed(text)
+    assert engine == 'float'
+    assert abs(result - sympy_result(text)) < 1e-12
+
+
+@pytest.mark.parametrize('text', ['sqrt(2)', 'pi + e', 'log(10, 2)', 'sin(1)^2 + cos(1)^2'])
+def test_mpmath_path(text):
+    result, engine = evaluate_detailed(text, precision=50)
+    assert engine == 'mpmath'
+    assert abs(result - sympy_result(text, 50)) < sp.Float('1e-45', 50)
+
+
+@pytest.mark.parametrize('text', ['x + 1', '1/0', '0^-1', 'sqrt(-1.0)', '2^(1/2)', 'sqrt(2)'])
+def test_falls_back_to_sympy(text):
+    result, engine = evaluate_detailed(text)
+    assert engine == 'sympy'
+    assert result == sympy_result(text)
@@ -0,0 +1,71 @@
+"""表达式解析器：语法树、运算优先级和错误信息"""
+import re
+
+import pytest
+
+import calculator
+from calculator import parse_expression, tokenize, evaluate_tree, get_namespace
+
+sp = calculator.load_sympy()
+x, y = sp.symbols('x y')
+
+
+def evaluate(text):
+    return evaluate_tree(parse_expression(text), get_namespace())
+
+
+def test_tokenize_aliases():
+    assert [value for _, value, _ in tokenize('2^π×3÷∞')] == ['2', '**', 'pi', '*', '3', '/', 'oo']
+
+
+@pytest.mark.parametrize('text, tree', [
+    ('1+2*3', ('binop', '+', ('num', '1'), ('binop', '*', ('num', '2'), ('num', '3')))),
+    ('2^3^2', ('binop', '**', ('num', '2'), ('binop', '**', ('num', '3'), ('num', '2')))),
+    ('-x**2', ('neg', ('binop', '**', ('name', 'x'), ('num', '2')))),
+    ('2**-1', ('binop', '**', ('num', '2'), ('neg', ('num', '1')))),
+    ('5!', ('fact', ('num', '5'))),
+    ('2x', ('binop', '*', ('num', '2'), ('name', 'x'))),
+    ('x == 1', ('cmp', '==', ('name', 'x'), ('num', '1'))),
+    ('f(x, n=3)', ('call', ('name', 'f'), (('name', 'x'),), (('n', ('num', '3')),))),
+    ('a.b', ('attr', ('name', 'a'), 'b')),
+    ('m[0, 1]', ('index', ('name', 'm'), ('tuple', (('num', '0'), ('num', '1'))))),
+    ('(1,)', ('tuple', (('num', '1'),))),
+    ('[1, 2,]', ('list', (('num', '1'), ('num', '2')))),
+    ('{x: 1}', ('dict', ((('name', 'x'), ('num', '1')),))),
+])
+def test_tree(text, tree):
+    assert parse_expression(text) == tree
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2^10', sp.Integer(1024)),
+    ('-2**2', sp.Integer(-4)),
+    ('2(x+1)', 2 * x + 2),
+    ('(x+1)(x-1)', (x + 1) * (x - 1)),
+    ('sin x', sp.sin(x)),
+    ('3!', sp.Integer(6)),
+    ('x y', x * y),
+    ('1/3', sp.Rational(1, 3)),
+    ('diff(x^3, x)', 3 * x ** 2),
+])
+def test_evaluate_matches_sympy(text, expected):
+    assert evaluate(text) == expected
+
+
+@pytest.mark.parametrize('text, message', [
+    ('', '表达式为空'),
+    ('1+', '表达式不完整'),
+    ('[1, 2', "缺少 ']'"),
+    ('1 $ 2', "无法识别的字符 '$'"),
+    ('x._secret', "不允许访问属性 '_secret'"),
+    ('f(n=1, 2)', '位置参数不能出现在关键字参数之后'),
+    ('1 2)', "意外的符号 ')'"),
+])
+def test_syntax_errors(text, message):
+    with pytest.raises(SyntaxError, match=re.escape(message)):
+        parse_expression(text)
+
+
+def test_error_position():
+    with pytest.raises(SyntaxError, match=r'位置 3'):
+        parse_expression('1+*2')
@@ -0,0 +1,81 @@
+"""稀疏多项式环和DomainMatrix的快速实现与SymPy结果一致"""
+import pytest
+
+import calculator
+from calculator import determinant, poly_cancel, poly_expand, poly_factor, solve_equations
+
+sp = calculator.load_sympy()
+x, y, z = sp.symbols('x y z')
+
+
+@pytest.mark.parametrize('expr', [
+    (x + y + 1) ** 5, (2 * x - sp.Rational(1, 3) * y) ** 4, (x - 1) * (x + 1) * (z + 2),
+    x ** 3 - 7, -(x + y) ** 2,
+])
+def test_expand(expr):
+    assert poly_expand(expr) == sp.expand(expr)
+
+
+@pytest.mark.parametrize('expr', [
+    x ** 4 - 1, 6 * x ** 2 + 12 * x + 6, (x ** 2 - y ** 2) / (x + 2), -2 * x ** 2 + 8,
+    (x ** 2 - 1) / (3 * x ** 2 - 6 * x + 3), x ** 2 / 4 - sp.Rational(1, 9),
+])
+def test_factor(expr):
+    assert poly_factor(expr) == sp.factor(expr)
+
+
+@pytest.mark.parametrize('expr', [
+    (x ** 2 - 1) / (x - 1), (2 * x + 2) / (4 * x ** 2 - 4), (x ** 2 - y ** 2) / (y - x),
+    (6 * x ** 2 + 3 * x) / (-9 * x), x / 2 + 1 / (3 * x),
+])
+def test_cancel(expr):
+    assert poly_cancel(expr) == sp.cancel(expr)
+
+
+@pytest.mark.parametrize('equation', [
+    x ** 2 - 5 * x + 6, x ** 4 - 1, x ** 3 - 2, sp.Eq(x ** 2, 2), (x - 1) ** 3 * (x + 2),
+    x ** 5 - x - 1,
+])
+def test_polynomial_roots(equation):
+    assert solve_equations(equation, x) == sp.solve(equation, x)
+
+
+def test_linear_system():
+    a, b, c, d = sp.symbols('a b c d')
+    equations = [a + b + c + d - 10, a - b + 2 * c - 3, 3 * a + d - 7, b - c + d - 2]
+    assert solve_equations(equations, [a, b, c, d]) == sp.solve(equations, [a, b, c, d])
+
+
+@pytest.mark.parametrize('matrix', [
+    sp.Matrix(4, 4, lambda i, j: sp.Rational(i + 1, j + 2) + int(i == j)),
+    sp.Matrix(4, 4, lambda i, j: x ** ((i + j) % 3) + i - j),
+    sp.Matrix(5, 5, lambda i, j: (i * 7 + j * 3) % 5 - 2),
+])
+def test_determinant(matrix):
+    assert sp.expand(determinant(matrix) - matrix.det()) == 0
+
+
+def test_exact_solve():
+    a = sp.Matrix(4, 4, lambda i, j: sp.Rational(1, i + j + 1))
+    b = sp.Matrix([1, 2, 3, 4])
+    result = calculator.evaluate_tree(calculator.parse_expression('A.solve(b)'),
+                                      dict(calculator.get_namespace(), A=a, b=b))
+    assert result == a.solve(b)
+
+
+def test_exact_solve_rejects_singular_matrix():
+    a = sp.Matrix(4, 4, lambda i, j: i + j)
+    with pytest.raises(ValueError):
+        calculator._exact_solve(a, [sp.Matrix([1, 2, 3, 4])], {})
+
+
+@pytest.mark.parametrize('text, engine', [
+    ('expand((x + y + 1)^5)', 'poly'),
+    ('factor(x^4 - 1)', 'poly'),
+    ('cancel((x^2 - 1)/(x - 1))', 'poly'),
+    ('solve(x^2 - 5x + 6, x)', 'poly'),
+    ('det(Matrix([[1, 2, 3, 4], [0, 1, x, 2], [3, 1, 0, 1], [1, 1, 1, 5]]))', 'domain'),
+    ('expand((x + 1)^2) + sin(x)', 'sympy'),
+])
+def test_engine_labels(text, engine):
+    assert calculator.evaluate_detailed(text)[1] == engine
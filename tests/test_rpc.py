@@ -0,0 +1,101 @@
+"""JSON-RPC服务：请求和参数校验、错误码（不启动工作进程）"""
+import json
+
+import pytest
+
+import calculator
+from calculator import (CalculatorEngine, EvaluationService, MAX_RPC_PRECISION,
+                        RPC_INVALID_PARAMS, RPC_INVALID_REQUEST, RPC_METHOD_NOT_FOUND,
+                        RPC_PARSE_ERROR, RPC_EVALUATION_ERROR, _RPCRequestHandler)
+
+
+@pytest.fixture
+def service():
+    engine = CalculatorEngine(workers=0, cache_size=0)
+    service = EvaluationService(engine)
+    yield service
+    service.close()
+    engine.shutdown()
+
+
+def call(service, payload):
+    body = service.handle(json.dumps(payload).encode('utf-8'))
+    return None if body is None else json.loads(body)
+
+
+def evaluate(service, params):
+    return call(service, {'jsonrpc': '2.0', 'id': 1, 'method': 'evaluate', 'params': params})
+
+
+def error_code(response):
+    return response['error']['code']
+
+
+def test_evaluate(service):
+    response = evaluate(service, {'expression': '1/3', 'precision': 15})
+    assert response['result']['result'] == '0.333333333333333'
+    assert evaluate(service, ['x^2'])['result']['latex'] == 'x^{2}'
+
+
+@pytest.mark.parametrize('params', [
+    {'expression': ''},
+    {'expression': 3},
+    {'expression': '1', 'precision': 0},
+    {'expression': '1', 'precision': -5},
+    {'expression': '1', 'precision': 1.5},
+    {'expression': '1', 'precision': True},
+    {'expression': '1', 'precision': '15'},
+    {'expression': '1', 'precision': MAX_RPC_PRECISION + 1},
+    {'expression': '1', 'unknown': 1},
+    ['1', 15, True, False, 'extra'],
+])
+def test_invalid_params(service, params):
+    assert error_code(evaluate(service, params)) == RPC_INVALID_PARAMS
+
+
+def test_precision_limit_is_accepted(service):
+    assert 'result' in evaluate(service, {'expression': '1/7', 'precision': MAX_RPC_PRECISION,
+                                          'latex': False})
+
+
+def test_evaluation_error(service):
+    response = evaluate(service, {'expression': '(1+'})
+    assert error_code(response) == RPC_EVALUATION_ERROR
+    assert response['error']['data']['type'] == 'error'
+
+
+@pytest.mark.parametrize('payload, code', [
+    ({'jsonrpc': '1.0', 'id': 1, 'method': 'ping'}, RPC_INVALID_REQUEST),
+    ({'jsonrpc': '2.0', 'id': 1}, RPC_INVALID_REQUEST),
+    ([], RPC_INVALID_REQUEST),
+    ({'jsonrpc': '2.0', 'id': 1, 'method': 'shutdown'}, RPC_METHOD_NOT_FOUND),
+    ({'jsonrpc': '2.0', 'id': 1, 'method': 'ping', 'params': 'x'}, RPC_INVALID_PARAMS),
+])
+def test_invalid_requests(service, payload, code):
+    assert error_code(call(service, payload)) == code
+
+
+def test_parse_error(service):
+    assert error_code(json.loads(service.handle(b'{"jsonrpc": '))) == RPC_PARSE_ERROR
+
+
+def test_notifications_and_batches(service):
+    assert call(service, {'jsonrpc': '2.0', 'method': 'ping'}) is None
+    responses = call(service, [{'jsonrpc': '2.0', 'id': 1, 'method': 'ping'},
+                               {'jsonrpc': '2.0', 'method': 'ping'},
+                               {'jsonrpc': '2.0', 'id': 2, 'method': 'nope'}])
+    assert [response['id'] for response in responses] == [1, 2]
+    assert responses[0]['result'] == 'pong'
+    assert service.health()['requests'] == 4
+
+
+@pytest.mark.parametrize('origin, allowed', [
+    ('http://localhost:3000', True),
+    ('http://127.0.0.1', True),
+    ('http://[::1]:8080', True),
+    ('https://example.com', False),
+    ('http://localhost.example.com', False),
+    ('null', False),
+])
+def test_local_origin(origin, allowed):
+    assert _RPCRequestHandler.local_origin(origin) is allowed